@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # primero: mide la request completa (sesión y usuario incluidos)
+    'tucanasta.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,13 +52,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tucanasta.replicas.PrimarioTrasEscrituraMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render (tucanasta/metricas.py)
+        'BACKEND': 'tucanasta.metricas.DjangoTemplatesMedidos',
         'DIRS': [BASE_DIR / 'templates', os.path.join(BASE_DIR, 'tucanasta', 'templates'),],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -64,6 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'tucanasta.context_processors.mini_carrito',
             ],
         },
     },
@@ -74,14 +79,118 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# Se configura por variables de entorno (por defecto: SQLite en db.sqlite3):
+#   DB_ENGINE          sqlite | postgresql
+#   DB_NAME            ruta del archivo (sqlite) o nombre de la base (postgresql)
+#   DB_USER, DB_PASSWORD, DB_HOST, DB_PORT   (postgresql)
+#   DB_CONN_MAX_AGE    segundos que se reutiliza una conexión (0 = una por request)
+#   DB_POOL=1          pool de psycopg (postgresql, requiere psycopg[pool])
+#   DB_REPLICA_NAME    archivo de la réplica (sqlite) o nombre de su base
+#   DB_REPLICA_HOST    host de la réplica (postgresql)
+# Con réplica, las lecturas del catálogo van al alias 'replica' y todo lo
+# demás (carrito, pymes, usuarios, escrituras) al primario; ver tucanasta/replicas.py.
+# En local se prueba con dos archivos SQLite: DB_REPLICA_NAME=replica.sqlite3
+# y `python manage.py sincronizar_replica` para copiar el primario.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+# WAL: los lectores (catálogo) no bloquean al escritor (carrito, importaciones)
+# ni al revés. synchronous=NORMAL es seguro con WAL y evita un fsync por commit.
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA cache_size=-20000;'      # ~20 MB de cache de páginas por conexión
+    'PRAGMA mmap_size=134217728;'    # 128 MB mapeados en memoria
+)
+
+
+def _base_de_datos(nombre, host=None):
+    if DB_ENGINE == 'postgresql':
+        pool = os.environ.get('DB_POOL') == '1'
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': nombre,
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': host or os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # el pool ya reutiliza conexiones; Django no permite ambos a la vez
+            'CONN_MAX_AGE': 0 if pool else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': True} if pool else {},
+        }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': nombre,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE: las escrituras del carrito esperan el lock en vez
+            # de fallar al promover un lock de lectura ("database is locked")
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': SQLITE_PRAGMAS,
+        },
+    }
+
 
 DATABASES = {
+    'default': _base_de_datos(
+        os.environ.get('DB_NAME') or (BASE_DIR / 'db.sqlite3' if DB_ENGINE == 'sqlite' else 'tucanasta'),
+    ),
+}
+if DB_ENGINE == 'sqlite':
+    # en archivo y no en memoria: los tests de concurrencia usan varios hilos
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _base_de_datos(
+        os.environ.get('DB_REPLICA_NAME') or DATABASES['default']['NAME'],
+        host=os.environ.get('DB_REPLICA_HOST'),
+    )
+    # en los tests la réplica es la misma base que el primario
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['tucanasta.replicas.RouterReplica']
+
+# Tras una escritura (POST, etc.) el mismo navegador lee del primario durante
+# estos segundos, para ver sus propios cambios aunque la réplica vaya atrasada
+REPLICA_PRIMARIO_SEGUNDOS = int(os.environ.get('DB_REPLICA_PRIMARIO_SEGUNDOS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tucanasta',
     }
 }
 
+# Sesiones leídas del cache (con respaldo en la base): ahorra una consulta por request
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Tipos, marcas y tiendas por tipo (se invalida al guardar/borrar productos)
+CATALOGO_CACHE_TIMEOUT = 60 * 60
+
+# Resumen del mini-carrito por usuario (se invalida en cada cambio del carrito)
+CARRITO_CACHE_TIMEOUT = 15 * 60
+
+# Páginas del catálogo para anónimos y fragmentos de catálogo para usuarios con
+# sesión (se invalidan al guardar/borrar productos o supermercados)
+PAGINAS_CACHE_TIMEOUT = 10 * 60
+
+
+# Métricas por vista (ver tucanasta/metricas.py)
+# /metricas/ es para staff o para quien mande `Authorization: Bearer <METRICAS_TOKEN>`
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+METRICAS_SERVER_TIMING = os.environ.get('METRICAS_SERVER_TIMING', '1' if DEBUG else '0') == '1'
+# True: pasarse del @presupuesto_consultas de una vista es un error, no un warning
+METRICAS_PRESUPUESTO_ESTRICTO = os.environ.get('METRICAS_PRESUPUESTO_ESTRICTO') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,4 +238,26 @@ LOGIN_REDIRECT_URL = 'comparador'          # o 'tucanasta:index'
 LOGOUT_REDIRECT_URL = '/'         # dónde vuelve tras salir
 LOGIN_URL = 'login'               # nombre de la url del login
 
-AUTH_USER_MODEL = 'tucanasta.Usuario'
\ No newline at end of file
+AUTH_USER_MODEL = 'tucanasta.Usuario'
+
+# Correo: en desarrollo se imprime en la consola del runserver / worker
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Tus Canastas <no-responder@tuscanastas.cl>')
+
+# Documentos de verificación de pymes (ver tucanasta/documentos.py)
+DOCUMENTOS_ROOT = BASE_DIR / 'pyme_docs'
+DOCUMENTO_MAX_BYTES = 10 * 1024 * 1024
+# None: los sirve Django (con Range). 'x-sendfile' (Apache/lighttpd) o
+# 'x-accel-redirect' (nginx, location interna en DOCUMENTOS_ACCEL_PREFIX)
+DOCUMENTOS_SENDFILE = os.environ.get('DOCUMENTOS_SENDFILE') or None
+DOCUMENTOS_ACCEL_PREFIX = '/interno/pyme_docs/'
+
+# Proxy de imágenes de productos (ver tucanasta/imagenes.py)
+IMAGENES_CACHE_ROOT = Path(os.environ.get('IMAGENES_CACHE_ROOT', BASE_DIR / 'cache_imagenes'))
+IMAGENES_CACHE_MAX_BYTES = int(os.environ.get('IMAGENES_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+IMAGENES_FETCHER = 'tucanasta.imagenes.descargar_http'
+IMAGENES_TAMANO = 400                        # px, lado mayor de la miniatura
+IMAGENES_MAX_BYTES_ORIGEN = 5 * 1024 * 1024  # no descargar imágenes más grandes
+IMAGENES_TIMEOUT = 5                         # segundos por descarga
+IMAGENES_REINTENTO = 60 * 60                 # tras un fallo, no reintentar antes de esto
+
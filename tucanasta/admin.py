@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Supermercado, Producto, Cotizacion, CotizacionItem, Usuario
+from .models import Supermercado, Producto, Cotizacion, CotizacionItem, Usuario, Tarea
 
 @admin.register(Supermercado)
 class SupermercadoAdmin(admin.ModelAdmin):
@@ -29,4 +29,11 @@ class UsuarioAdmin(UserAdmin):
         ("Datos adicionales", {"fields": ("nombre", "apellido", "rut", "direccion", "email")}),
     )
     list_display = ("username", "email", "nombre", "apellido", "rut")
-    
\ No newline at end of file
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "estado", "intentos", "ejecutar_desde", "fecha_creacion", "fecha_fin")
+    list_filter = ("estado", "nombre")
+    search_fields = ("clave",)
+    readonly_fields = ("ultimo_error",)
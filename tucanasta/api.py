@@ -0,0 +1,162 @@
+"""
+API JSON de sólo lectura del catálogo (v1).
+
+    GET /api/v1/supermercados/
+    GET /api/v1/tipos/
+    GET /api/v1/categorias/<tipo>/productos/?ordenar=&cursor=&marca=&tienda=&unidad=&precio_unidad_max=&campos=
+    GET /api/v1/productos/<id>/?campos=
+
+Cada respuesta lleva un ETag fuerte calculado con una consulta agregada
+barata (MAX(fecha_actualizacion) y COUNT de las filas que entran en la
+respuesta). Las respuestas con productos suman además la versión del
+catálogo (cache_paginas), que sube al guardar un supermercado: su nombre
+sale como "tienda" en cada producto y no mueve fecha_actualizacion. Si el
+cliente manda If-None-Match con ese ETag se responde 304 sin ejecutar la
+vista (decorador `condition` de Django).
+"""
+import hashlib
+
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_GET
+
+from . import imagenes, paginacion
+from .cache_paginas import version_catalogo
+from .catalogo import ORDEN_SIMILARES, productos_de_categoria, similares_a, tipos_catalogo
+from .models import Producto, Supermercado
+
+VERSION = 'v1'
+
+# campos que se pueden pedir con ?campos=a,b,c (los primeros son los por defecto)
+CAMPOS_PRODUCTO = (
+    'id', 'nombre', 'marca', 'precio', 'tienda', 'imagen', 'producto_url', 'tipo', 'supermercado_id',
+    'precio_por_unidad', 'unidad_precio',
+)
+CAMPOS_PRODUCTO_DEFECTO = CAMPOS_PRODUCTO[:5]
+
+
+def _etag(request, *partes):
+    # la URL completa entra al hash: cada página/filtro/campos tiene su propio ETag
+    texto = '|'.join(str(p) for p in (VERSION, request.get_full_path(), *partes))
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def _version(qs):
+    datos = qs.order_by().aggregate(ultima=Max('fecha_actualizacion'), n=Count('pk'))
+    return datos['ultima'], datos['n']
+
+
+def _campos(request):
+    pedidos = [c.strip() for c in request.GET.get('campos', '').split(',') if c.strip()]
+    invalidos = [c for c in pedidos if c not in CAMPOS_PRODUCTO]
+    return pedidos or list(CAMPOS_PRODUCTO_DEFECTO), invalidos
+
+
+def _compactar(fila, campos):
+    fila = {c: fila[c] for c in campos}
+    for campo in ('precio', 'precio_por_unidad'):
+        if fila.get(campo) is not None:
+            fila[campo] = float(fila[campo])
+    return fila
+
+
+def _error(mensaje, status=400):
+    return JsonResponse({'ok': False, 'error': mensaje}, status=status)
+
+
+# --- ETags ---
+
+def _etag_supermercados(request):
+    tiendas = list(Supermercado.objects.order_by('pk').values_list('pk', 'nombre', 'url_principal'))
+    return _etag(request, tiendas, *_version(Producto.objects.filter(disponible=True)))
+
+
+def _etag_tipos(request):
+    # tipos_catalogo() sale de todos los productos, disponibles o no
+    return _etag(request, *_version(Producto.objects.all()))
+
+
+def _etag_categoria(request, tipo):
+    productos, _, _ = productos_de_categoria(tipo, request.GET)
+    return _etag(request, version_catalogo(), *_version(productos))
+
+
+def _etag_producto(request, producto_id):
+    producto = Producto.objects.filter(pk=producto_id).only('pk', 'nombre', 'tipo', 'grupo_id').first()
+    if producto is None:
+        return None  # la vista responde 404
+    return _etag(request, version_catalogo(), *_version(similares_a(producto) | Producto.objects.filter(pk=producto_id)))
+
+
+# --- vistas ---
+
+@require_GET
+@condition(etag_func=_etag_supermercados)
+def supermercados(request):
+    filas = (
+        Supermercado.objects.order_by('nombre')
+        .annotate(productos_disponibles=Count('productos', filter=Q(productos__disponible=True)))
+        .values('id', 'nombre', 'url_principal', 'productos_disponibles')
+    )
+    return JsonResponse({'ok': True, 'version': VERSION, 'supermercados': list(filas)})
+
+
+@require_GET
+@condition(etag_func=_etag_tipos)
+def tipos(request):
+    return JsonResponse({'ok': True, 'version': VERSION, 'tipos': tipos_catalogo()})
+
+
+@require_GET
+@condition(etag_func=_etag_categoria)
+def productos_categoria(request, tipo):
+    campos, invalidos = _campos(request)
+    if invalidos:
+        return _error(f"campos desconocidos: {', '.join(invalidos)}")
+    productos, _, filtros = productos_de_categoria(tipo, request.GET)
+    try:
+        filas, siguiente = paginacion.pagina(productos, filtros['ordenar'], request.GET.get('cursor'))
+    except paginacion.CursorInvalido as e:
+        return _error(str(e))
+    return JsonResponse({
+        'ok': True,
+        'version': VERSION,
+        'tipo': tipo,
+        'productos': [_compactar(f, campos) for f in filas],
+        'siguiente': siguiente,
+    })
+
+
+@require_GET
+@condition(etag_func=_etag_producto)
+def producto(request, producto_id):
+    campos, invalidos = _campos(request)
+    if invalidos:
+        return _error(f"campos desconocidos: {', '.join(invalidos)}")
+    p = get_object_or_404(Producto.objects.select_related('supermercado'), pk=producto_id)
+    comparables = imagenes.proxy_filas(list(paginacion.tarjetas(
+        similares_a(p).filter(disponible=True).exclude(pk=p.pk).order_by(*ORDEN_SIMILARES)
+    )))
+    return JsonResponse({
+        'ok': True,
+        'version': VERSION,
+        'producto': {
+            'id': p.pk,
+            'nombre': p.nombre,
+            'marca': p.marca,
+            'tipo': p.tipo,
+            'descripcion': p.descripcion,
+            'precio': float(p.precio),
+            'precio_por_unidad': float(p.precio_por_unidad) if p.precio_por_unidad is not None else None,
+            'unidad_precio': p.unidad_precio,
+            'moneda': p.moneda,
+            'disponible': p.disponible,
+            'tienda': p.supermercado.nombre,
+            'supermercado_id': p.supermercado_id,
+            'imagen': imagenes.url_proxy(p.pk, p.imagen_url),
+            'producto_url': p.producto_url,
+            'fecha_actualizacion': p.fecha_actualizacion,
+        },
+        'comparables': [_compactar(f, campos) for f in comparables],
+    })
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TucanastaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tucanasta'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receivers)
@@ -0,0 +1,263 @@
+"""
+Datos sintéticos y benchmark de las vistas calientes.
+
+    DB_NAME=bench.sqlite3 python manage.py migrate
+    DB_NAME=bench.sqlite3 python manage.py seed_benchmark --supermercados 6 --productos 5000 --usuarios 200
+    DB_NAME=bench.sqlite3 python manage.py benchmark --salida bench/$(git rev-parse --short HEAD).json \
+        --comparar bench/anterior.json
+
+- sembrar(): supermercados "Bench ..." con el mismo surtido base (tipos,
+  marcas y contenidos realistas, ~90% presente en cada tienda, precios con
+  ruido), usuarios bench_N con carrito abierto y cotizaciones guardadas.
+  Todo con bulk_create por lotes; --limpiar borra lo sembrado antes.
+- medir(): recorre los escenarios con el cliente de pruebas de Django
+  (middleware, sesión, plantillas: la request completa, sin red) y reporta
+  p50/p95 de latencia y consultas SQL por escenario.
+"""
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import Client
+from django.urls import reverse
+
+from .catalogo import invalidar_catalogo
+from .metricas import Medicion
+from .models import Cotizacion, CotizacionItem, Producto, Supermercado, Usuario
+
+PREFIJO_SUPERMERCADO = 'Bench '
+PREFIJO_USUARIO = 'bench_'
+CLAVE_USUARIOS = 'bench-1234'
+LOTE = 1000
+
+# tipo -> (variedades, marcas, contenidos, precio base por el primer contenido)
+SURTIDO = {
+    'arroz': (['Arroz Grado 1', 'Arroz Grado 2', 'Arroz Integral', 'Arroz para sushi'],
+              ['Tucapel', 'Miraflores', 'Banquete', 'Acuenta'], ['1 kg', '2 kg', '5 kg'], 1190),
+    'aceite': (['Aceite Vegetal', 'Aceite de Maravilla', 'Aceite de Oliva Extra Virgen'],
+               ['Chef', 'Belmont', 'Natura', 'Miraflores'], ['900 ml', '1 L', '5 L'], 2490),
+    'leche': (['Leche Entera', 'Leche Semidescremada', 'Leche Descremada', 'Leche Sin Lactosa'],
+              ['Colun', 'Soprole', 'Loncoleche', 'Surlat'], ['1 L', '6 x 1 L'], 1090),
+    'fideos': (['Spaghetti 5', 'Corbatas', 'Tallarines', 'Espirales'],
+               ['Carozzi', 'Lucchetti', 'Don Vittorio', 'Talliani'], ['400 g', '1 kg'], 890),
+    'azucar': (['Azúcar Blanca', 'Azúcar Rubia', 'Endulzante'],
+               ['Iansa', 'Cuisine & Co', 'Lider'], ['1 kg', '5 kg'], 1150),
+    'cafe': (['Café Instantáneo', 'Café Molido', 'Café en Grano'],
+             ['Nescafé', 'Cabrales', 'Haiti', 'Juan Valdez'], ['170 g', '250 g', '500 g'], 4990),
+    'detergente': (['Detergente Líquido', 'Detergente en Polvo'],
+                   ['Omo', 'Ariel', 'Popeye', 'Drive'], ['1 L', '3 L', '5 kg'], 5490),
+    'bebidas': (['Bebida Cola', 'Bebida Naranja', 'Agua Mineral', 'Jugo Néctar'],
+                ['Coca-Cola', 'Fanta', 'Cachantun', 'Watts'], ['500 ml', '1.5 L', '3 L'], 990),
+    'huevos': (['Huevos Blancos', 'Huevos Color', 'Huevos de Campo'],
+               ['Santa Marta', 'Ariztía', 'Don Pollo'], ['12 u', '30 u'], 2890),
+    'papel higienico': (['Papel Higiénico Doble Hoja', 'Papel Higiénico Triple Hoja'],
+                        ['Confort', 'Noble', 'Elite'], ['4 u', '12 u', '24 u'], 2190),
+}
+
+NOMBRES = ['Ana', 'Beto', 'Carla', 'Diego', 'Elena', 'Felipe', 'Gabriela', 'Hugo', 'Isabel', 'Jorge']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva']
+
+
+# --- datos sintéticos ---
+
+def _surtido_base(n, azar):
+    """n productos distintos (variedad, marca, contenido, precio) repartidos entre los tipos."""
+    combinaciones = [
+        (tipo, variedad, marca, contenido, round(base * (1 + 1.6 * i)))
+        for tipo, (variedades, marcas, contenidos, base) in SURTIDO.items()
+        for variedad in variedades
+        for marca in marcas
+        for i, contenido in enumerate(contenidos)
+    ]
+    azar.shuffle(combinaciones)
+    surtido = []
+    for k in range(n):
+        tipo, variedad, marca, contenido, precio = combinaciones[k % len(combinaciones)]
+        pack = k // len(combinaciones)  # más productos que combinaciones: "Pack 2", "Pack 3"...
+        if pack:
+            variedad, precio = f'{variedad} Pack {pack + 1}', precio * (pack + 1)
+        surtido.append((tipo, variedad, marca, contenido, precio))
+    return surtido
+
+
+def limpiar():
+    """Borra supermercados y usuarios sembrados (con sus productos y cotizaciones)."""
+    with transaction.atomic():
+        Usuario.objects.filter(username__startswith=PREFIJO_USUARIO).delete()
+        Supermercado.objects.filter(nombre__startswith=PREFIJO_SUPERMERCADO).delete()
+
+
+def sembrar(supermercados=5, productos=2000, usuarios=50, guardadas=3, items=20, semilla=1, presencia=0.9):
+    """Crea el catálogo y los usuarios sintéticos. Devuelve cuántas filas de cada cosa."""
+    azar = random.Random(semilla)
+    base = _surtido_base(productos, azar)
+
+    with transaction.atomic():
+        tiendas = Supermercado.objects.bulk_create([
+            Supermercado(nombre=f'{PREFIJO_SUPERMERCADO}{i + 1}', url_principal=f'https://bench{i + 1}.example.cl')
+            for i in range(supermercados)
+        ])
+        filas = []
+        for tienda in tiendas:
+            factor = azar.uniform(0.92, 1.08)  # tiendas más caras o más baratas
+            for k, (tipo, variedad, marca, contenido, precio) in enumerate(base):
+                if azar.random() > presencia:
+                    continue
+                nombre = f'{variedad} {marca} {contenido}'
+                filas.append(Producto(
+                    nombre=nombre,
+                    marca=marca,
+                    tipo=tipo,
+                    descripcion=f'{nombre}. Producto sintético para benchmark.',
+                    supermercado=tienda,
+                    precio=Decimal(round(precio * factor * azar.uniform(0.9, 1.1) / 10) * 10),
+                    imagen_url=f'https://img.bench.example.cl/{k}.jpg',
+                    producto_url=f'{tienda.url_principal}/p/{k}',
+                    disponible=azar.random() > 0.02,
+                    codigo_interno=f'BENCH-{k}',
+                ))
+        for p in filas:
+            p.completar_contenido()
+        Producto.objects.bulk_create(filas, batch_size=LOTE)
+
+        clave = make_password(CLAVE_USUARIOS)  # un solo hash: PBKDF2 por usuario tomaría minutos
+        nuevos = Usuario.objects.bulk_create([
+            Usuario(
+                username=f'{PREFIJO_USUARIO}{i}', password=clave,
+                email=f'{PREFIJO_USUARIO}{i}@bench.example.cl', rut=f'B{i:08d}-{i % 10}',
+                nombre=azar.choice(NOMBRES), apellido=azar.choice(APELLIDOS),
+                direccion=f'Calle Falsa {100 + i}',
+            )
+            for i in range(usuarios)
+        ], batch_size=LOTE)
+
+        disponibles = list(
+            Producto.objects.filter(supermercado__in=tiendas, disponible=True).values_list('pk', 'precio')
+        )
+        cotizaciones = Cotizacion.objects.bulk_create([
+            Cotizacion(usuario=u, status=status, nombre='' if status == 'open' else f'Semana {n}')
+            for u in nuevos
+            for n, status in enumerate(['open'] + ['saved'] * guardadas)
+        ], batch_size=LOTE)
+        lineas = [
+            CotizacionItem(cotizacion=cot, producto_id=pk, cantidad=azar.randint(1, 4), precio_unidad=precio)
+            for cot in cotizaciones
+            for pk, precio in azar.sample(disponibles, min(items, len(disponibles)))
+        ]
+        CotizacionItem.objects.bulk_create(lineas, batch_size=LOTE)
+        # bulk_create no manda señales: totales denormalizados de una vez
+        Cotizacion.recalcular_totales()
+        invalidar_catalogo()
+
+    return {
+        'supermercados': len(tiendas),
+        'productos': len(filas),
+        'usuarios': len(nuevos),
+        'cotizaciones': len(cotizaciones),
+        'items': len(lineas),
+    }
+
+
+# --- benchmark ---
+
+def _escenarios(usuario, azar):
+    """nombre -> función que arma (método, url, datos) para la próxima request."""
+    tipos = sorted(Producto.objects.filter(supermercado__nombre__startswith=PREFIJO_SUPERMERCADO)
+                   .values_list('tipo', flat=True).distinct()) or ['arroz']
+    ids = list(Producto.objects.filter(disponible=True).values_list('pk', flat=True)[:5000])
+    palabras = ['arroz', 'leche entera', 'aceite', 'cafe molido', 'detergente', 'colun', 'tucapel 5 kg']
+
+    def item_del_carrito():
+        pk = (CotizacionItem.objects.filter(cotizacion__usuario=usuario, cotizacion__status='open')
+              .values_list('pk', flat=True).order_by('?').first())
+        return pk
+
+    def agregar():
+        return 'post', reverse('agregar_cotizacion'), {'product_id': azar.choice(ids), 'cantidad': 1}
+
+    def actualizar():
+        return 'post', reverse('actualizar_item'), {'item_id': item_del_carrito(), 'cantidad': azar.randint(1, 5)}
+
+    def eliminar():
+        return 'post', reverse('eliminar_item'), {'item_id': item_del_carrito()}
+
+    return {
+        'comparador': lambda: ('get', reverse('comparador'), None),
+        'categoria': lambda: ('get', reverse('productos_por_categoria', args=[azar.choice(tipos)]), None),
+        'categoria_orden_precio': lambda: (
+            'get', reverse('productos_por_categoria', args=[azar.choice(tipos)]), {'ordenar': 'precio_asc'}),
+        'producto': lambda: ('get', reverse('producto_detalle', args=[azar.choice(ids)]), None),
+        'buscar': lambda: ('get', reverse('buscar_productos'), {'q': azar.choice(palabras)}),
+        'ver_cotizacion': lambda: ('get', reverse('ver_cotizacion'), None),
+        'carrito_agregar': agregar,
+        'carrito_actualizar': actualizar,
+        'carrito_eliminar': eliminar,
+    }
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def _una(client, metodo, url, datos):
+    medicion = Medicion()
+    with ExitStack() as pila:
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(medicion))
+        inicio = time.perf_counter()
+        response = getattr(client, metodo)(url, datos or {})
+        segundos = time.perf_counter() - inicio
+    return segundos, medicion.consultas, response.status_code
+
+
+def medir(usuario, iteraciones=30, calentamiento=3, solo=None, sin_cache=False, host='localhost', semilla=1):
+    """
+    Corre cada escenario `iteraciones` veces (tras `calentamiento` requests
+    que no cuentan) con `usuario` logueado. Devuelve un dict por escenario.
+    """
+    azar = random.Random(semilla)
+    client = Client(HTTP_HOST=host, raise_request_exception=False)
+    client.force_login(usuario)
+
+    resultados = {}
+    for nombre, armar in _escenarios(usuario, azar).items():
+        if solo and nombre not in solo:
+            continue
+        tiempos, consultas, errores = [], [], 0
+        for i in range(calentamiento + iteraciones):
+            if sin_cache:
+                cache.clear()
+            segundos, n, status = _una(client, *armar())
+            if i < calentamiento:
+                continue
+            tiempos.append(segundos * 1000)
+            consultas.append(n)
+            errores += status >= 400
+        resultados[nombre] = {
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(_percentil(tiempos, 95), 2),
+            'media_ms': round(statistics.fmean(tiempos), 2),
+            'consultas_p50': statistics.median_low(consultas),
+            'consultas_max': max(consultas),
+            'errores': errores,
+            'n': iteraciones,
+        }
+    return resultados
+
+
+def comparar(actual, anterior):
+    """Filas (escenario, p50 antes, p50 ahora, % cambio, consultas antes, consultas ahora)."""
+    filas = []
+    for nombre, r in actual.items():
+        a = anterior.get(nombre)
+        if a is None:
+            continue
+        cambio = (r['p50_ms'] - a['p50_ms']) / a['p50_ms'] * 100 if a['p50_ms'] else 0.0
+        filas.append((nombre, a['p50_ms'], r['p50_ms'], cambio, a['consultas_p50'], r['consultas_p50']))
+    return filas
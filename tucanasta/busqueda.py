@@ -0,0 +1,146 @@
+"""
+Búsqueda de productos.
+
+En SQLite usa una tabla virtual FTS5 (tucanasta_producto_fts) de contenido
+externo sobre tucanasta_producto, mantenida por triggers. El tokenizer
+unicode61 con remove_diacritics ignora mayúsculas y tildes (aceite = Aceíte)
+y el índice de prefijos permite buscar mientras se escribe ("ace" -> aceite).
+En otros motores se usa un icontains por término como respaldo.
+"""
+import re
+import unicodedata
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Producto
+
+FTS_TABLA = 'tucanasta_producto_fts'
+FTS_COLUMNAS = ('nombre', 'marca', 'descripcion', 'tipo')
+
+# peso de cada columna en bm25 (mismo orden que FTS_COLUMNAS)
+FTS_PESOS = (10.0, 5.0, 1.0, 3.0)
+
+_SQL_TABLA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLA} USING fts5("
+    f"{', '.join(FTS_COLUMNAS)}, "
+    "content='tucanasta_producto', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+_cols = ', '.join(FTS_COLUMNAS)
+_nuevos = ', '.join(f'new.{c}' for c in FTS_COLUMNAS)
+_viejos = ', '.join(f'old.{c}' for c in FTS_COLUMNAS)
+_SQL_TRIGGERS = {
+    f'{FTS_TABLA}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLA}_ai AFTER INSERT ON tucanasta_producto BEGIN "
+        f"INSERT INTO {FTS_TABLA}(rowid, {_cols}) VALUES (new.id, {_nuevos}); END"
+    ),
+    f'{FTS_TABLA}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLA}_ad AFTER DELETE ON tucanasta_producto BEGIN "
+        f"INSERT INTO {FTS_TABLA}({FTS_TABLA}, rowid, {_cols}) VALUES ('delete', old.id, {_viejos}); END"
+    ),
+    f'{FTS_TABLA}_au': (
+        # sólo si cambian columnas indexadas: precios, stock o grupo no tocan el índice
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLA}_au AFTER UPDATE OF {_cols} ON tucanasta_producto BEGIN "
+        f"INSERT INTO {FTS_TABLA}({FTS_TABLA}, rowid, {_cols}) VALUES ('delete', old.id, {_viejos}); "
+        f"INSERT INTO {FTS_TABLA}(rowid, {_cols}) VALUES (new.id, {_nuevos}); END"
+    ),
+}
+
+
+def usa_fts(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+
+def asegurar_indice_fts(conn=None):
+    """
+    Crea la tabla FTS5 y sus triggers si faltan. Si hubo que crear algo
+    (instalación nueva, o una migración que reconstruyó tucanasta_producto y
+    se llevó los triggers) reindexa todo el catálogo.
+    Devuelve True si reindexó.
+    """
+    conn = conn or connection
+    if not usa_fts(conn):
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ', '.join(['%s'] * (len(_SQL_TRIGGERS) + 1)),
+            [FTS_TABLA, *_SQL_TRIGGERS],
+        )
+        existentes = {fila[0] for fila in cursor.fetchall()}
+        if existentes == {FTS_TABLA, *_SQL_TRIGGERS}:
+            return False
+        cursor.execute(_SQL_TABLA)
+        for sql in _SQL_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLA}({FTS_TABLA}) VALUES ('rebuild')")
+    return True
+
+
+def reindexar(conn=None):
+    conn = conn or connection
+    if not usa_fts(conn):
+        return
+    asegurar_indice_fts(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLA}({FTS_TABLA}) VALUES ('rebuild')")
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Aceíte Ñuñoa' -> 'aceite nunoa'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def terminos(q):
+    return re.findall(r'\w+', normalizar(q))
+
+
+def consulta_fts(q):
+    """
+    'aceite belm' -> '"aceite"* "belm"*' (todos los términos, con prefijo).
+    Cada término va entre comillas para que el usuario no pueda inyectar
+    sintaxis FTS5 (NEAR, OR, columnas, etc.).
+    """
+    return ' '.join(f'"{t}"*' for t in terminos(q))
+
+
+def buscar(q, offset=0, limite=20):
+    """
+    Devuelve (ids ordenados por relevancia, total de coincidencias) de
+    productos disponibles que contienen todos los términos de `q`.
+    """
+    if not terminos(q):
+        return [], 0
+
+    # catálogo: puede leerse de la réplica (ver replicas.py)
+    conn = connections[router.db_for_read(Producto)]
+    if not usa_fts(conn):
+        filtro = Q()
+        for t in terminos(q):
+            filtro &= (
+                Q(nombre__icontains=t) | Q(marca__icontains=t)
+                | Q(descripcion__icontains=t) | Q(tipo__icontains=t)
+            )
+        qs = Producto.objects.filter(filtro, disponible=True).order_by('precio', 'pk')
+        return list(qs.values_list('pk', flat=True)[offset:offset + limite]), qs.count()
+
+    match = consulta_fts(q)
+    pesos = ', '.join(str(p) for p in FTS_PESOS)
+    desde = (
+        f"FROM {FTS_TABLA} JOIN tucanasta_producto p ON p.id = {FTS_TABLA}.rowid "
+        f"WHERE {FTS_TABLA} MATCH %s AND p.disponible"
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) {desde}", [match])
+        total = cursor.fetchone()[0]
+        if not total:
+            return [], 0
+        cursor.execute(
+            f"SELECT p.id {desde} ORDER BY bm25({FTS_TABLA}, {pesos}), p.precio LIMIT %s OFFSET %s",
+            [match, limite, offset],
+        )
+        ids = [fila[0] for fila in cursor.fetchall()]
+    return ids, total
@@ -0,0 +1,83 @@
+"""
+Cache de páginas del catálogo.
+
+- Visitantes anónimos: la respuesta HTML completa se guarda por URL (con
+  query string). La única parte por usuario de estas páginas es el
+  mini-carrito y la cabecera de sesión, que para un anónimo son siempre
+  iguales.
+- Usuarios con sesión: no se cachea el HTML (lleva su carrito y su nombre),
+  pero sí los datos del catálogo que arma la vista (fragmento()); el carrito
+  sale aparte del context processor mini_carrito.
+
+Todas las claves llevan una "versión del catálogo" que se incrementa al
+guardar/borrar productos o supermercados (catalogo.invalidar_catalogo), así
+invalidar es un solo INCR y las entradas viejas simplemente expiran.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+VERSION_KEY = 'tucanasta:paginas:version'
+PAGINAS_CACHE_TIMEOUT = getattr(settings, 'PAGINAS_CACHE_TIMEOUT', 10 * 60)
+
+
+def version_catalogo():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # nunca repetir una versión anterior aunque el cache haya perdido la clave
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidar_paginas():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+
+
+def _clave(request, tipo):
+    url = hashlib.sha1(f'{request.get_host()}{request.get_full_path()}'.encode('utf-8')).hexdigest()
+    return f'tucanasta:{tipo}:{version_catalogo()}:{url}'
+
+
+def cache_anonimo(vista):
+    """
+    Cachea la respuesta 200 de `vista` para GET/HEAD anónimos. No cachea
+    respuestas que fijan cookies (CSRF, mensajes) ni si hay mensajes pendientes.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                or 'messages' in request.COOKIES):
+            return vista(request, *args, **kwargs)
+
+        clave = _clave(request, 'pagina')
+        guardada = cache.get(clave)
+        if guardada is not None:
+            contenido, content_type = guardada
+            response = HttpResponse(contenido, content_type=content_type)
+        else:
+            response = vista(request, *args, **kwargs)
+            if response.status_code == 200 and not response.cookies and not response.streaming:
+                cache.set(clave, (response.content, response['Content-Type']), PAGINAS_CACHE_TIMEOUT)
+        # la variante anónima no sirve a quien trae cookie de sesión
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return envoltura
+
+
+def fragmento(request, nombre, calcular):
+    """Datos de catálogo de la vista (`calcular()`), cacheados por URL y versión."""
+    clave = _clave(request, f'fragmento:{nombre}')
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular()
+        cache.set(clave, datos, PAGINAS_CACHE_TIMEOUT)
+    return datos
@@ -0,0 +1,327 @@
+"""
+Operaciones sobre el carrito (cotización abierta) seguras ante concurrencia.
+
+Nada lee la cantidad en Python para volver a escribirla: agregar es un
+INSERT ... ON CONFLICT DO UPDATE SET cantidad = cantidad + n (RETURNING la
+fila resultante), actualizar/eliminar son UPDATE/DELETE directos y los
+totales se recalculan con un solo UPDATE agregado en la misma transacción.
+Dos clics simultáneos suman las dos cantidades en vez de perder una.
+
+aplicar_lote() aplica muchas operaciones (agregar/actualizar/eliminar) en una
+transacción con un INSERT multi-fila, un UPDATE y un DELETE, y recalcula los
+totales una sola vez.
+
+El mini-carrito de la cabecera usa resumen_carrito(): un dict compacto por
+usuario en el cache, que cada mutación invalida al confirmar. Como guarda
+nombre, imagen y tienda de los productos, editar un producto o supermercado
+invalida también el de los usuarios que lo tienen en el carrito.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import Cotizacion, CotizacionItem, Producto
+
+RESUMEN_CACHE_KEY = 'tucanasta:carrito:{}'
+RESUMEN_CACHE_TIMEOUT = getattr(settings, 'CARRITO_CACHE_TIMEOUT', 15 * 60)
+MAX_OPERACIONES = 200
+
+_ITEMS = CotizacionItem._meta.db_table
+
+_SQL_UPSERT_VARIOS = (
+    f"INSERT INTO {_ITEMS} (cotizacion_id, producto_id, cantidad, precio_unidad) "
+    f"VALUES {{valores}} "
+    f"ON CONFLICT (cotizacion_id, producto_id) DO UPDATE SET "
+    f"cantidad = {_ITEMS}.cantidad + excluded.cantidad, precio_unidad = excluded.precio_unidad"
+)
+_SQL_UPSERT = _SQL_UPSERT_VARIOS.format(valores='(%s, %s, %s, %s)') + " RETURNING id, cantidad, precio_unidad"
+
+
+# --- resumen para el mini-carrito ---
+
+def _calcular_resumen(usuario_id):
+    """Una sola consulta: items de la cotización abierta con sus totales."""
+    filas = (
+        CotizacionItem.objects
+        .filter(cotizacion__usuario_id=usuario_id, cotizacion__status='open')
+        .order_by('-pk')
+        .values_list(
+            'pk', 'cantidad', 'precio_unidad', 'cotizacion_id',
+            'cotizacion__total', 'cotizacion__cantidad_items', 'producto_id',
+            'producto__nombre', 'producto__imagen_url', 'producto__supermercado__nombre',
+        )
+    )
+    resumen = {'id': None, 'total': 0.0, 'count': 0, 'items': []}
+    for pk, cantidad, precio, cot_id, total, count, producto_id, nombre, imagen, tienda in filas:
+        resumen.update(id=cot_id, total=float(total), count=count)
+        resumen['items'].append({
+            'pk': pk,
+            'cantidad': cantidad,
+            'precio_unidad': float(precio),
+            'subtotal': float(precio) * cantidad,
+            'producto': {'id': producto_id, 'nombre': nombre, 'imagen_url': imagen, 'supermercado': {'nombre': tienda}},
+        })
+    return resumen
+
+
+def resumen_carrito(usuario_id):
+    """
+    Dict serializable con id, total, count e items de la cotización abierta.
+    Los items imitan los atributos que usan las plantillas
+    (it.producto.supermercado.nombre, it.subtotal, ...).
+    """
+    clave = RESUMEN_CACHE_KEY.format(usuario_id)
+    resumen = cache.get(clave)
+    if resumen is None:
+        resumen = _calcular_resumen(usuario_id)
+        cache.set(clave, resumen, RESUMEN_CACHE_TIMEOUT)
+    return resumen
+
+
+def invalidar_resumen(usuario_id):
+    # al confirmar: así ninguna request vuelve a cachear datos sin commitear
+    transaction.on_commit(partial(cache.delete, RESUMEN_CACHE_KEY.format(usuario_id)))
+
+
+def invalidar_resumen_de_productos(**filtro):
+    """
+    Invalida el mini-carrito de los usuarios cuya cotización abierta tiene
+    productos que cumplen `filtro` (p. ej. pk=... o supermercado_id=...):
+    el resumen guarda nombre, imagen y tienda de cada producto.
+    """
+    usuarios = (
+        CotizacionItem.objects
+        .filter(cotizacion__status='open', **{f'producto__{k}': v for k, v in filtro.items()})
+        .values_list('cotizacion__usuario_id', flat=True)
+        .distinct()
+    )
+    claves = [RESUMEN_CACHE_KEY.format(u) for u in usuarios]
+    if claves:
+        transaction.on_commit(partial(cache.delete_many, claves))
+
+
+# --- mutaciones ---
+
+def cotizacion_abierta(usuario):
+    """
+    La cotización abierta del usuario, creándola si no existe.
+    La restricción una_cotizacion_abierta_por_usuario garantiza que haya a lo
+    más una: si dos requests la crean a la vez, el perdedor recibe
+    IntegrityError y get_or_create vuelve a leer la que ganó.
+    """
+    cot, _ = Cotizacion.objects.get_or_create(usuario=usuario, status='open')
+    return cot
+
+
+def _totales(cotizacion_id):
+    return Cotizacion.recalcular_totales(cotizacion_id, devolver=True)[cotizacion_id]
+
+
+def _upsert_item(cotizacion_id, producto, cantidad):
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute(_SQL_UPSERT, [cotizacion_id, producto.pk, cantidad, producto.precio])
+            return cursor.fetchone()
+
+    # sin RETURNING: UPDATE con F() y, si no había fila, INSERT (o UPDATE si otro ganó)
+    filtro = CotizacionItem.objects.filter(cotizacion_id=cotizacion_id, producto=producto)
+    cambios = {'cantidad': F('cantidad') + cantidad, 'precio_unidad': producto.precio}
+    if not filtro.update(**cambios):
+        try:
+            with transaction.atomic():
+                CotizacionItem.objects.create(
+                    cotizacion_id=cotizacion_id, producto=producto,
+                    cantidad=cantidad, precio_unidad=producto.precio,
+                )
+        except IntegrityError:
+            filtro.update(**cambios)
+    return filtro.values_list('pk', 'cantidad', 'precio_unidad').get()
+
+
+def agregar_item(usuario, producto, cantidad=1):
+    """
+    Suma `cantidad` del producto a la cotización abierta del usuario.
+    Devuelve dict con la fila resultante y los totales de la cotización.
+    """
+    cot = cotizacion_abierta(usuario)
+    with transaction.atomic():
+        item_id, cantidad_final, precio_unidad = _upsert_item(cot.pk, producto, cantidad)
+        total, cantidad_items = _totales(cot.pk)
+        invalidar_resumen(usuario.pk)
+    return {
+        'item_id': item_id,
+        'cantidad': cantidad_final,
+        'subtotal': float(precio_unidad) * cantidad_final,
+        'total': total,
+        'count': cantidad_items,
+    }
+
+
+def actualizar_cantidad(usuario, item_id, cantidad):
+    """
+    Fija la cantidad de un item del usuario (<= 0 lo elimina).
+    Devuelve (msg, total, cantidad_items) o None si el item no es del usuario.
+    """
+    with transaction.atomic():
+        cotizacion_id = (
+            CotizacionItem.objects.filter(pk=item_id, cotizacion__usuario=usuario)
+            .values_list('cotizacion_id', flat=True).first()
+        )
+        if cotizacion_id is None:
+            return None
+        if cantidad <= 0:
+            # DELETE directo: con .delete() el ORM primero lee la fila para mandar
+            # post_delete, que recalcularía los totales que _totales() recalcula igual
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {_ITEMS} WHERE id = %s", [item_id])
+            msg = 'deleted'
+        else:
+            CotizacionItem.objects.filter(pk=item_id).update(cantidad=cantidad)
+            msg = 'updated'
+        invalidar_resumen(usuario.pk)
+        return (msg, *_totales(cotizacion_id))
+
+
+def eliminar_item(usuario, item_id):
+    """Elimina un item del usuario. Devuelve (total, cantidad_items) o None."""
+    resultado = actualizar_cantidad(usuario, item_id, 0)
+    return resultado and resultado[1:]
+
+
+# --- lote ---
+
+def leer_operaciones(operaciones):
+    """
+    Valida [{"op": "agregar", "producto_id": 1, "cantidad": 2},
+            {"op": "actualizar", "item_id": 5, "cantidad": 3},
+            {"op": "eliminar", "item_id": 7}, ...]
+    y la reduce a (agregar {producto_id: cantidad}, actualizar {item_id: cantidad},
+    eliminar {item_id}). Agregar el mismo producto dos veces suma; para un
+    mismo item vale la última operación. Lanza ValueError con el motivo.
+    """
+    if not isinstance(operaciones, list) or not 1 <= len(operaciones) <= MAX_OPERACIONES:
+        raise ValueError(f'entre 1 y {MAX_OPERACIONES} operaciones')
+    agregar, actualizar, eliminar = {}, {}, set()
+    for i, o in enumerate(operaciones):
+        try:
+            op = o['op']
+            if op == 'agregar':
+                producto_id, cantidad = int(o['producto_id']), int(o.get('cantidad', 1))
+                if cantidad < 1:
+                    raise ValueError
+                agregar[producto_id] = agregar.get(producto_id, 0) + cantidad
+            elif op in ('actualizar', 'eliminar'):
+                item_id = int(o['item_id'])
+                cantidad = int(o['cantidad']) if op == 'actualizar' else 0
+                actualizar.pop(item_id, None)
+                eliminar.discard(item_id)
+                if cantidad > 0:
+                    actualizar[item_id] = cantidad
+                else:
+                    eliminar.add(item_id)
+            else:
+                raise ValueError
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f'operación {i} inválida') from None
+    return agregar, actualizar, eliminar
+
+
+def _upsert_items(cotizacion_id, cantidades, precios):
+    if connection.vendor in ('sqlite', 'postgresql'):
+        filas = [(cotizacion_id, pk, cantidades[pk], precio) for pk, precio in precios.items()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _SQL_UPSERT_VARIOS.format(valores=', '.join(['(%s, %s, %s, %s)'] * len(filas))),
+                [valor for fila in filas for valor in fila],
+            )
+        return
+    for pk, precio in precios.items():
+        _upsert_item(cotizacion_id, Producto(pk=pk, precio=precio), cantidades[pk])
+
+
+def aplicar_lote(usuario, agregar, actualizar, eliminar):
+    """
+    Aplica las operaciones de leer_operaciones() al carrito del usuario en una
+    transacción, con un número fijo de consultas sin importar cuántas sean.
+    Devuelve dict con total, count y `omitidos` (productos inexistentes o
+    items que no están en el carrito).
+    """
+    cot = cotizacion_abierta(usuario)
+    omitidos = []
+    with transaction.atomic():
+        if agregar:
+            precios = dict(Producto.objects.filter(pk__in=agregar).values_list('pk', 'precio'))
+            omitidos += [{'op': 'agregar', 'producto_id': pk} for pk in agregar if pk not in precios]
+            if precios:
+                _upsert_items(cot.pk, agregar, precios)
+
+        if actualizar or eliminar:
+            propios = set(
+                CotizacionItem.objects.filter(pk__in=[*actualizar, *eliminar], cotizacion_id=cot.pk)
+                .values_list('pk', flat=True)
+            )
+            omitidos += [{'op': 'actualizar', 'item_id': pk} for pk in actualizar if pk not in propios]
+            omitidos += [{'op': 'eliminar', 'item_id': pk} for pk in eliminar if pk not in propios]
+            cambios = [CotizacionItem(pk=pk, cantidad=c) for pk, c in actualizar.items() if pk in propios]
+            if cambios:
+                CotizacionItem.objects.bulk_update(cambios, ['cantidad'])
+            borrar = [pk for pk in eliminar if pk in propios]
+            if borrar:
+                # DELETE directo, sin post_delete por fila (ver actualizar_cantidad)
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"DELETE FROM {_ITEMS} WHERE id IN ({', '.join(['%s'] * len(borrar))})", borrar,
+                    )
+
+        total, cantidad_items = _totales(cot.pk)
+        invalidar_resumen(usuario.pk)
+    return {'cotizacion_id': cot.pk, 'total': total, 'count': cantidad_items, 'omitidos': omitidos}
+
+
+# --- repetir una canasta guardada ---
+
+def repetir_cotizacion(usuario, cotizacion_id):
+    """
+    Copia los items de una cotización guardada del usuario a su carrito, con
+    el precio actual de cada producto. La guardada no se toca; si el carrito
+    tenía items queda guardado como cotización aparte. Los productos que ya
+    no están disponibles no se copian y se informan.
+    Devuelve dict con la nueva cotización y sus totales, o None si no existe.
+    """
+    with transaction.atomic():
+        origen = (
+            Cotizacion.objects.filter(pk=cotizacion_id, usuario=usuario).exclude(status='open')
+            .values('pk', 'total').first()
+        )
+        if origen is None:
+            return None
+        # el carrito actual no se pierde: pasa a guardado (si está vacío se reutiliza)
+        Cotizacion.objects.filter(usuario=usuario, status='open', cantidad_items__gt=0).update(status='saved')
+        cot = cotizacion_abierta(usuario)
+
+        # items del origen con el precio vigente, en un solo JOIN
+        lineas = CotizacionItem.objects.filter(cotizacion_id=origen['pk']).order_by('pk').values_list(
+            'producto_id', 'cantidad', 'producto__precio', 'producto__disponible', 'producto__nombre',
+        )
+        nuevos, no_disponibles = [], []
+        for producto_id, cantidad, precio, disponible, nombre in lineas:
+            if disponible:
+                nuevos.append(CotizacionItem(
+                    cotizacion_id=cot.pk, producto_id=producto_id, cantidad=cantidad, precio_unidad=precio,
+                ))
+            else:
+                no_disponibles.append({'producto_id': producto_id, 'nombre': nombre})
+        # bulk_create no manda post_save: los totales se recalculan una vez
+        CotizacionItem.objects.bulk_create(nuevos)
+        total, cantidad_items = _totales(cot.pk)
+        invalidar_resumen(usuario.pk)
+    return {
+        'cotizacion_id': cot.pk,
+        'total': total,
+        'total_anterior': origen['total'],
+        'count': cantidad_items,
+        'no_disponibles': no_disponibles,
+    }
@@ -0,0 +1,176 @@
+"""
+Consultas de catálogo compartidas por las vistas (comparador, categorías, detalle).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Value, Window
+from django.db.models.functions import Lower, RowNumber
+
+from .cache_paginas import invalidar_paginas
+from .models import UNIDAD_PRECIO, Producto, Supermercado
+
+PLACEHOLDER_IMG = "/static/img/placeholder.png"
+
+CATALOGO_CACHE_KEY = 'tucanasta:catalogo:metadatos'
+CATALOGO_CACHE_TIMEOUT = getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 60 * 60)
+
+
+# --- metadatos del catálogo (tipos) ---
+
+def _calcular_metadatos():
+    """
+    Tipos de producto del catálogo. Marcas y tiendas dependen de los filtros
+    activos de cada página, así que salen de facetas.py y no se cachean.
+    """
+    tipos = Producto.objects.order_by('tipo').values_list('tipo', flat=True).distinct()
+    return {'tipos': list(tipos)}
+
+
+def metadatos_catalogo():
+    data = cache.get(CATALOGO_CACHE_KEY)
+    if data is None:
+        data = _calcular_metadatos()
+        cache.set(CATALOGO_CACHE_KEY, data, CATALOGO_CACHE_TIMEOUT)
+    return data
+
+
+def invalidar_catalogo():
+    cache.delete(CATALOGO_CACHE_KEY)
+    # páginas y fragmentos cacheados del catálogo (cache_paginas.py)
+    invalidar_paginas()
+
+
+def tipos_catalogo():
+    return metadatos_catalogo()['tipos']
+
+
+# --- consultas ---
+
+
+def filtrar_por_tipo(qs, tipo, campo='tipo'):
+    """
+    Equivalente a `filter(tipo__iexact=tipo)` pero como LOWER(tipo) = LOWER(%s),
+    que sí usa el índice funcional producto_tipo_precio_disp_idx (en SQLite
+    iexact se traduce a LIKE y no puede usar índices).
+    """
+    return qs.alias(tipo_normalizado=Lower(campo)).filter(tipo_normalizado=Lower(Value(tipo)))
+
+
+def ranking_productos_recientes(limite=10):
+    """
+    QuerySet con los `limite` productos disponibles más recientes de cada
+    supermercado, ordenados por supermercado y posición.
+    """
+    ranking = Window(
+        expression=RowNumber(),
+        partition_by=[F('supermercado_id')],
+        order_by=[F('fecha_actualizacion').desc(), F('id').desc()],
+    )
+    return (
+        Producto.objects.filter(disponible=True)
+        .annotate(posicion=ranking)
+        .filter(posicion__lte=limite)
+        .order_by('supermercado_id', 'posicion')
+    )
+
+
+def productos_recientes_por_supermercado(limite=10):
+    """
+    Devuelve [{'supermercado': s, 'productos': [...]}, ...] con los `limite`
+    productos disponibles más recientes de cada supermercado.
+
+    Usa ROW_NUMBER() OVER (PARTITION BY supermercado ...) para traer todos los
+    productos en una sola consulta, sin importar cuántos supermercados existan
+    (antes era una consulta por supermercado).
+    """
+    supermercados = list(Supermercado.objects.all().order_by('nombre'))
+    por_id = {s.pk: s for s in supermercados}
+
+    por_supermercado = {}
+    for p in ranking_productos_recientes(limite):
+        supermercado = por_id.get(p.supermercado_id)
+        if supermercado is None:
+            # supermercado creado entre ambas consultas: se mostrará en la próxima carga
+            continue
+        if not p.imagen_url:
+            p.imagen_url = PLACEHOLDER_IMG
+        # reusar el supermercado ya cargado (evita un query por p.supermercado)
+        p.supermercado = supermercado
+        por_supermercado.setdefault(p.supermercado_id, []).append(p)
+
+    return [
+        {"supermercado": s, "productos": por_supermercado.get(s.pk, [])}
+        for s in supermercados
+    ]
+
+
+def _decimal(params, nombre):
+    try:
+        valor = Decimal(params[nombre])
+    except (KeyError, InvalidOperation):
+        return None
+    return valor if valor.is_finite() else None
+
+
+def productos_de_categoria(tipo, params):
+    """
+    Aplica los filtros GET (`params`, un QueryDict) de una categoría.
+    Devuelve (productos filtrados sin ordenar, base de facetas, filtros).
+    La base es la categoría + búsqueda + unidad/precio por unidad, sin
+    filtros de marca/tienda/precio.
+    """
+    base = filtrar_por_tipo(Producto.objects.filter(disponible=True), tipo)
+    filtros = {
+        'q': params.get('q'),
+        'ordenar': params.get('ordenar'),
+        # marca_normalizada: minúsculas y sin espacios en los bordes
+        'marca_filtro': [m.strip().lower() for m in params.getlist('marca') if m.strip()],
+        'tienda_filtro': params.getlist('tienda'),
+        'precio_min': _decimal(params, 'precio_min'),
+        'precio_max': _decimal(params, 'precio_max'),
+        # precio por kg / L / unidad (columna precio_por_unidad, ver Producto)
+        'unidad': params.get('unidad') if params.get('unidad') in UNIDAD_PRECIO else None,
+        'precio_unidad_max': _decimal(params, 'precio_unidad_max'),
+    }
+
+    # Búsqueda
+    if filtros['q']:
+        base = base.filter(nombre__icontains=filtros['q'])
+
+    # Sólo productos comparables por contenido: precio por unidad <= máximo
+    if filtros['unidad']:
+        base = base.filter(unidad=filtros['unidad'])
+    if filtros['precio_unidad_max'] is not None:
+        base = base.filter(precio_por_unidad__lte=filtros['precio_unidad_max'])
+    productos = base
+
+    # Filtrar por marca
+    if filtros['marca_filtro']:
+        productos = productos.filter(marca_normalizada__in=filtros['marca_filtro'])
+
+    # Filtrar por tienda
+    if filtros['tienda_filtro']:
+        productos = productos.filter(supermercado__nombre__in=filtros['tienda_filtro'])
+
+    # Filtrar por rango de precio [precio_min, precio_max)
+    if filtros['precio_min'] is not None:
+        productos = productos.filter(precio__gte=filtros['precio_min'])
+    if filtros['precio_max'] is not None:
+        productos = productos.filter(precio__lt=filtros['precio_max'])
+
+    return productos, base, filtros
+
+
+# comparables: primero el más barato por kg / L / unidad, los sin contenido al final
+ORDEN_SIMILARES = (F('precio_por_unidad').asc(nulls_last=True), 'precio', 'pk')
+
+
+def similares_a(producto):
+    """Productos comparables con `producto` (incluido él mismo), sin ordenar."""
+    if producto.grupo_id:
+        # grupo de equivalencia precalculado (comando agrupar_productos)
+        return Producto.objects.filter(grupo_id=producto.grupo_id)
+    # aún sin agrupar: comparación aproximada por nombre
+    return Producto.objects.filter(nombre__icontains=producto.nombre, tipo=producto.tipo)
@@ -0,0 +1,19 @@
+from django.utils.functional import SimpleLazyObject
+
+from .carrito import resumen_carrito
+
+
+def mini_carrito(request):
+    """
+    `cotizacion` y `cot_items` para el mini-carrito de la cabecera.
+    Perezoso: sólo consulta (cache o una query) si la plantilla los usa.
+    Las vistas que pasan su propia `cotizacion` (ver_cotizacion) la pisan.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    resumen = SimpleLazyObject(lambda: resumen_carrito(user.pk))
+    return {
+        'cotizacion': SimpleLazyObject(lambda: resumen if resumen['id'] else None),
+        'cot_items': SimpleLazyObject(lambda: resumen['items']),
+    }
@@ -0,0 +1,236 @@
+"""
+Documentos de verificación de las pymes.
+
+- Subida: LimiteDocumentoHandler corta la subida apenas el archivo pasa de
+  DOCUMENTO_MAX_BYTES, sin esperar a recibirlo entero (Django ya escribe a
+  disco por trozos los archivos grandes).
+- Almacenamiento direccionado por contenido: el nombre es el sha256 del
+  archivo (`ab/cd/abcd....pdf`), calculado mientras se copia por trozos.
+  Dos pymes que suben el mismo documento comparten el archivo. La extensión
+  sale de la firma de los primeros bytes, nunca del nombre que mandó el
+  cliente.
+- Miniaturas: las genera la tarea `procesar_documento_pyme` en segundo plano
+  (sólo imágenes, requiere Pillow).
+- Descarga (sólo staff): con DOCUMENTOS_SENDFILE el servidor web manda el
+  archivo (X-Sendfile / X-Accel-Redirect); si no, Django lo sirve por trozos
+  y con soporte de Range (206), así el visor de PDF del navegador puede pedir
+  páginas sueltas. Sólo PDF e imágenes se muestran inline; cualquier otra
+  cosa va como adjunto, y siempre con nosniff.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.template.defaultfilters import filesizeformat
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él no hay miniaturas
+    Image = None
+
+CAMPO_DOCUMENTO = 'documento'
+TAMANO_MINIATURA = (320, 320)
+SUFIJO_MINIATURA = '.miniatura.jpg'
+BLOQUE = 64 * 1024
+
+# tipos aceptados, por firma de los primeros bytes -> (tipo, content-type)
+FIRMAS_DOCUMENTO = {
+    b'%PDF-': ('pdf', 'application/pdf'),
+    b'\x89PNG\r\n\x1a\n': ('png', 'image/png'),
+    b'\xff\xd8\xff': ('jpg', 'image/jpeg'),
+}
+LARGO_FIRMA = max(len(firma) for firma in FIRMAS_DOCUMENTO)
+CONTENT_TYPES_INLINE = {content_type for _, content_type in FIRMAS_DOCUMENTO.values()}
+
+
+def max_bytes():
+    return settings.DOCUMENTO_MAX_BYTES
+
+
+def mensaje_excedido():
+    return f"El documento supera el máximo de {filesizeformat(max_bytes())}."
+
+
+def tipo_documento(cabecera):
+    """('pdf', 'application/pdf') según los primeros bytes, o (None, None)."""
+    return next((t for firma, t in FIRMAS_DOCUMENTO.items() if cabecera.startswith(firma)), (None, None))
+
+
+# --- subida ---
+
+class LimiteDocumentoHandler(FileUploadHandler):
+    """
+    Rechaza el campo `documento` en cuanto supera el máximo. Los bytes siguen
+    pasando a los handlers normales de Django hasta ese momento.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.recibidos = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name == CAMPO_DOCUMENTO:
+            self.recibidos += len(raw_data)
+            if self.recibidos > max_bytes():
+                self.request.documento_excedido = True
+                raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None  # el archivo lo arman los handlers siguientes
+
+
+# --- almacenamiento ---
+
+@deconstructible(path='tucanasta.documentos.DocumentosStorage')
+class DocumentosStorage(FileSystemStorage):
+    """FileSystemStorage en DOCUMENTOS_ROOT que nombra cada archivo por su sha256."""
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.DOCUMENTOS_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'DOCUMENTOS_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    def save(self, name, content, max_length=None):
+        carpeta_tmp = Path(self.location) / 'tmp'
+        carpeta_tmp.mkdir(parents=True, exist_ok=True)
+
+        # una sola pasada: se hashea mientras se copia a un temporal del mismo disco
+        sha = hashlib.sha256()
+        cabecera = b''
+        tmp = tempfile.NamedTemporaryFile(dir=carpeta_tmp, delete=False)
+        try:
+            with tmp:
+                for bloque in content.chunks(BLOQUE):
+                    if len(cabecera) < LARGO_FIRMA:
+                        cabecera += bloque[:LARGO_FIRMA - len(cabecera)]
+                    sha.update(bloque)
+                    tmp.write(bloque)
+            digest = sha.hexdigest()
+            # extensión según el contenido: un "rut.html" con firma PDF se guarda .pdf
+            tipo, _ = tipo_documento(cabecera)
+            nombre = f'{digest[:2]}/{digest[2:4]}/{digest}' + (f'.{tipo}' if tipo else '')
+
+            destino = Path(self.path(nombre))
+            if not destino.exists():
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp.name, destino)
+                if self.file_permissions_mode is not None:
+                    os.chmod(destino, self.file_permissions_mode)
+        finally:
+            # mismo contenido ya guardado, o falló la copia: no dejar el temporal
+            if os.path.exists(tmp.name):
+                os.unlink(tmp.name)
+        return nombre
+
+
+documentos_storage = DocumentosStorage()
+
+
+def nombre_miniatura(nombre):
+    return f'{nombre}{SUFIJO_MINIATURA}'
+
+
+def generar_miniatura(nombre, storage=documentos_storage):
+    """Guarda una miniatura JPEG de la imagen `nombre`. Devuelve su nombre o None."""
+    if Image is None:
+        return None
+    miniatura = nombre_miniatura(nombre)
+    if storage.exists(miniatura):
+        return miniatura
+    with storage.open(nombre, 'rb') as archivo:
+        imagen = Image.open(archivo)
+        imagen.thumbnail(TAMANO_MINIATURA)
+        with open(storage.path(miniatura), 'wb') as salida:
+            imagen.convert('RGB').save(salida, 'JPEG', quality=80)
+    return miniatura
+
+
+# --- descarga ---
+
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_type_guardado(nombre, storage=documentos_storage):
+    """Content-type del archivo `nombre` según su firma ('application/octet-stream' si no se reconoce)."""
+    with storage.open(nombre, 'rb') as archivo:
+        _, content_type = tipo_documento(archivo.read(LARGO_FIRMA))
+    return content_type or 'application/octet-stream'
+
+
+def _rango(cabecera, tamano):
+    """(inicio, fin) inclusivo de un Range de un solo tramo; None si no aplica; ValueError si es insatisfacible."""
+    m = RANGO.match(cabecera or '')
+    if not m or m.groups() == ('', ''):
+        return None  # sin Range, o con varios tramos: se responde el archivo entero
+    desde, hasta = m.groups()
+    if desde == '':
+        inicio, fin = max(tamano - int(hasta), 0), tamano - 1  # "bytes=-500": los últimos 500
+    else:
+        inicio, fin = int(desde), min(int(hasta), tamano - 1) if hasta else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        raise ValueError
+    return inicio, fin
+
+
+def _trozos(archivo, inicio, largo):
+    try:
+        archivo.seek(inicio)
+        while largo > 0:
+            bloque = archivo.read(min(BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+    finally:
+        archivo.close()
+
+
+def servir(request, nombre, content_type, storage=documentos_storage):
+    """Respuesta con el archivo `nombre` del storage (sendfile o streaming con Range)."""
+    ruta = storage.path(nombre)
+    # direccionado por contenido: el nombre ya identifica los bytes
+    etag = f'"{Path(nombre).name}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    modo = getattr(settings, 'DOCUMENTOS_SENDFILE', None)
+    if modo:
+        response = HttpResponse(content_type=content_type)
+        if modo == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.DOCUMENTOS_ACCEL_PREFIX.rstrip('/') + '/' + nombre
+        else:
+            response['X-Sendfile'] = ruta
+    else:
+        tamano = os.path.getsize(ruta)
+        try:
+            rango = _rango(request.headers.get('Range'), tamano)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{tamano}'})
+        if rango is None:
+            response = FileResponse(open(ruta, 'rb'), content_type=content_type)
+        else:
+            inicio, fin = rango
+            response = StreamingHttpResponse(_trozos(open(ruta, 'rb'), inicio, fin - inicio + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+            response['Content-Length'] = fin - inicio + 1
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=3600'
+    # nada que el navegador pueda interpretar como HTML/JS se muestra inline
+    response['Content-Disposition'] = 'inline' if content_type in CONTENT_TYPES_INLINE else 'attachment'
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,125 @@
+"""
+Agrupación de productos equivalentes entre supermercados.
+
+Cada producto se reduce a una firma: tipo + tokens normalizados del nombre y
+la marca + contenido parseado ("1kg", "900 g", "1 L" -> 1000 g / 1000 ml).
+Productos con la misma firma quedan en el mismo GrupoProducto, así la página
+de detalle compara precios con un solo lookup por grupo_id.
+"""
+import hashlib
+import re
+from decimal import Decimal, InvalidOperation
+
+from .busqueda import normalizar
+
+# unidad de origen -> (unidad base, factor)
+UNIDADES = {
+    'kg': ('g', 1000), 'kgs': ('g', 1000), 'kilo': ('g', 1000), 'kilos': ('g', 1000),
+    'g': ('g', 1), 'gr': ('g', 1), 'grs': ('g', 1), 'gramos': ('g', 1),
+    'mg': ('g', Decimal('0.001')),
+    'l': ('ml', 1000), 'lt': ('ml', 1000), 'lts': ('ml', 1000), 'litro': ('ml', 1000), 'litros': ('ml', 1000),
+    'ml': ('ml', 1), 'cc': ('ml', 1),
+    'u': ('u', 1), 'un': ('u', 1), 'und': ('u', 1), 'unid': ('u', 1), 'unidad': ('u', 1), 'unidades': ('u', 1),
+}
+
+_RE_CONTENIDO = re.compile(
+    r'(?:(?P<pack>\d+)\s*x\s*)?'
+    r'(?P<cantidad>\d+(?:[.,]\d+)?)\s*'
+    r'(?P<unidad>' + '|'.join(sorted(UNIDADES, key=len, reverse=True)) + r')\b'
+)
+
+# palabras que no distinguen un producto de otro
+STOPWORDS = {
+    'de', 'del', 'la', 'el', 'los', 'las', 'en', 'y', 'x', 'con', 'para', 'por',
+    'grado', 'pack', 'bolsa', 'caja', 'botella', 'formato', 'unidad',
+}
+
+
+def parsear_contenido(texto):
+    """
+    'Arroz Tucapel 1kg' -> (Decimal('1000'), 'g'); '6 x 350 cc' -> (Decimal('2100'), 'ml').
+    Devuelve (None, '') si no encuentra contenido.
+    """
+    m = _RE_CONTENIDO.search(normalizar(texto))
+    if not m:
+        return None, ''
+    try:
+        cantidad = Decimal(m.group('cantidad').replace(',', '.'))
+    except InvalidOperation:
+        return None, ''
+    unidad, factor = UNIDADES[m.group('unidad')]
+    cantidad *= factor
+    if m.group('pack'):
+        cantidad *= int(m.group('pack'))
+    return cantidad.normalize(), unidad
+
+
+def tokens(nombre, marca=''):
+    """Tokens significativos de nombre + marca, sin contenido, stopwords ni números sueltos."""
+    texto = _RE_CONTENIDO.sub(' ', normalizar(f'{nombre} {marca or ""}'))
+    return sorted({
+        t for t in re.findall(r'[a-z0-9]+', texto)
+        if len(t) > 1 and not t.isdigit() and t not in STOPWORDS
+    })
+
+
+def firma(producto):
+    """Devuelve (clave sha1, dict con las partes legibles) para un producto."""
+    cantidad, unidad = parsear_contenido(f'{producto.nombre} {producto.descripcion or ""}')
+    partes = {
+        'tipo': normalizar(producto.tipo).strip(),
+        'marca': normalizar(producto.marca or '').strip(),
+        'tokens': ' '.join(tokens(producto.nombre, producto.marca)),
+        'contenido': cantidad,
+        'unidad': unidad,
+    }
+    texto = f"{partes['tipo']}|{partes['tokens']}|{cantidad or ''}{unidad}"
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest(), partes
+
+
+def agrupar_catalogo(lote=1000):
+    """
+    Recalcula los grupos de equivalencia de todo el catálogo.
+    Crea los grupos nuevos con bulk_create, reasigna sólo los productos cuyo
+    grupo cambió (bulk_update por lotes) y borra los grupos que quedaron vacíos.
+    """
+    from django.db import transaction
+
+    from .cache_paginas import invalidar_paginas
+    from .models import GrupoProducto, Producto
+
+    firmas = {}
+    asignacion = []  # (producto, clave)
+    productos = (
+        Producto.objects.order_by()
+        .only('id', 'nombre', 'marca', 'tipo', 'descripcion', 'grupo_id')
+        .iterator(chunk_size=lote)
+    )
+    for p in productos:
+        clave, partes = firma(p)
+        firmas.setdefault(clave, partes)
+        asignacion.append((p, clave))
+
+    GrupoProducto.objects.bulk_create(
+        [GrupoProducto(clave=clave, **partes) for clave, partes in firmas.items()],
+        ignore_conflicts=True, batch_size=lote,
+    )
+    grupo_ids = dict(GrupoProducto.objects.values_list('clave', 'id'))
+
+    cambiados = []
+    for p, clave in asignacion:
+        if p.grupo_id != grupo_ids[clave]:
+            p.grupo_id = grupo_ids[clave]
+            cambiados.append(p)
+    Producto.objects.bulk_update(cambiados, ['grupo'], batch_size=lote)
+    if cambiados:
+        # bulk_update no dispara señales: los detalles cacheados comparan con grupos viejos
+        transaction.on_commit(invalidar_paginas)
+
+    borrados, _ = GrupoProducto.objects.filter(productos__isnull=True).delete()
+    return {
+        'productos': len(asignacion),
+        'grupos': len(firmas),
+        'reasignados': len(cambiados),
+        'grupos_borrados': borrados,
+    }
@@ -0,0 +1,128 @@
+"""
+Facetas de una categoría: marcas y tiendas con conteo, y rangos de precio.
+
+Facetas "disyuntivas": el conteo de cada marca respeta los filtros activos de
+tienda, precio y texto pero no el de marca (así se ve cuántos resultados
+agregaría marcar otra marca), y lo mismo para tiendas y precio.
+
+Dos consultas:
+  1. GROUP BY (marca_normalizada, supermercado) sobre la categoría + texto,
+     con COUNT filtrado por el rango de precio activo y MIN/MAX de precio.
+     Con esa tabla cruzada (marcas × tiendas, chica) se sacan en Python los
+     conteos de marca y de tienda, el total y el precio mínimo/máximo.
+  2. Conteos condicionales por rango de precio (un COUNT(... FILTER) por
+     rango) sobre la categoría + texto + marca + tienda.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q
+
+RANGOS_PRECIO = 5
+
+
+def _redondear(valor, hacia_arriba=False):
+    """Redondea a un múltiplo "lindo" (10, 50, 100, 500, 1000...) según la magnitud."""
+    valor = int(valor)
+    paso = 10
+    while paso * 10 <= max(valor, 1):
+        paso *= 10
+    paso = max(paso // 2, 10) if valor < paso * 5 else paso
+    if hacia_arriba:
+        return -(-valor // paso) * paso
+    return valor // paso * paso
+
+
+def rangos_precio(minimo, maximo, n=RANGOS_PRECIO):
+    """[(desde, hasta), ...] de ancho parejo que cubren [minimo, maximo]; hasta es exclusivo."""
+    if minimo is None or maximo is None:
+        return []
+    desde = _redondear(minimo)
+    ancho = _redondear(max((maximo - desde) / n, 1), hacia_arriba=True)
+    rangos = []
+    while desde <= maximo:
+        rangos.append((desde, desde + ancho))
+        desde += ancho
+    return rangos
+
+
+def calcular_facetas(base, marcas=(), tiendas=(), precio_min=None, precio_max=None):
+    """
+    `base` es el queryset de la categoría con el filtro de texto aplicado y
+    SIN filtros de marca/tienda/precio. Devuelve dict con 'marcas', 'tiendas'
+    (listas de {'valor', 'etiqueta', 'conteo', 'activo'}), 'precios'
+    ({'min', 'max', 'rangos': [{'desde', 'hasta', 'conteo', 'activo'}]}) y 'total'.
+    """
+    marcas = set(marcas)
+    tiendas = set(tiendas)
+    filtro_precio = Q()
+    if precio_min is not None:
+        filtro_precio &= Q(precio__gte=precio_min)
+    if precio_max is not None:
+        filtro_precio &= Q(precio__lt=precio_max)
+
+    # 1) tabla cruzada marca × tienda
+    celdas = (
+        base.order_by()
+        .values('marca_normalizada', 'supermercado__nombre')
+        .annotate(n=Count('pk', filter=filtro_precio), minimo=Min('precio'), maximo=Max('precio'))
+    )
+    conteo_marcas, conteo_tiendas, etiquetas = {}, {}, {}
+    total = 0
+    minimo = maximo = None
+    for c in celdas:
+        marca, tienda, n = c['marca_normalizada'] or '', c['supermercado__nombre'], c['n']
+        en_marca = not marcas or marca in marcas
+        en_tienda = not tiendas or tienda in tiendas
+        if en_tienda and marca and n:
+            conteo_marcas[marca] = conteo_marcas.get(marca, 0) + n
+            etiquetas.setdefault(marca, marca.title())
+        if en_marca and n:
+            conteo_tiendas[tienda] = conteo_tiendas.get(tienda, 0) + n
+        if en_marca and en_tienda:
+            total += n
+            minimo = c['minimo'] if minimo is None else min(minimo, c['minimo'])
+            maximo = c['maximo'] if maximo is None else max(maximo, c['maximo'])
+
+    # marcas/tiendas seleccionadas siguen visibles aunque queden en 0
+    for m in marcas:
+        conteo_marcas.setdefault(m, 0)
+        etiquetas.setdefault(m, m.title())
+    for t in tiendas:
+        conteo_tiendas.setdefault(t, 0)
+
+    # 2) rangos de precio: respetan marca y tienda, no el propio filtro de precio
+    rangos = rangos_precio(minimo, maximo)
+    conteos = {}
+    if rangos:
+        con_marca_tienda = base
+        if marcas:
+            con_marca_tienda = con_marca_tienda.filter(marca_normalizada__in=marcas)
+        if tiendas:
+            con_marca_tienda = con_marca_tienda.filter(supermercado__nombre__in=tiendas)
+        conteos = con_marca_tienda.order_by().aggregate(**{
+            f'r{i}': Count('pk', filter=Q(precio__gte=desde, precio__lt=hasta))
+            for i, (desde, hasta) in enumerate(rangos)
+        })
+
+    return {
+        'total': total,
+        'marcas': [
+            {'valor': m, 'etiqueta': etiquetas[m], 'conteo': n, 'activo': m in marcas}
+            for m, n in sorted(conteo_marcas.items(), key=lambda x: (-x[1], x[0]))
+        ],
+        'tiendas': [
+            {'valor': t, 'etiqueta': t, 'conteo': n, 'activo': t in tiendas}
+            for t, n in sorted(conteo_tiendas.items(), key=lambda x: (-x[1], x[0]))
+        ],
+        'precios': {
+            'min': minimo,
+            'max': maximo,
+            'rangos': [
+                {
+                    'desde': desde, 'hasta': hasta, 'conteo': conteos.get(f'r{i}', 0),
+                    'activo': precio_min == Decimal(desde) and precio_max == Decimal(hasta),
+                }
+                for i, (desde, hasta) in enumerate(rangos)
+            ],
+        },
+    }
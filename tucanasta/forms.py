@@ -6,12 +6,50 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import PasswordChangeForm
         
 from django import forms
+from . import documentos
 from .models import Pyme, Producto
 
 from .models import Usuario
 from .models import Producto, Supermercado
+import math
 import re
 
+# Producto.precio es DecimalField(max_digits=10, decimal_places=2)
+PRECIO_MAXIMO = 99999999.99
+
+
+def parsear_precio(raw):
+    """
+    Convierte un precio escrito a mano ("$1.290", "1.234,56", "990") a float.
+    Lanza ValueError con el mensaje para el usuario si no es válido.
+    Lo usan PymeProductForm y el comando import_catalog.
+    """
+    if raw is None:
+        raise ValueError("Ingrese un precio válido.")
+    # remover símbolos, espacios y puntos de miles; reemplazar coma decimal por punto
+    cleaned = str(raw).strip().replace('$', '').replace(' ', '')
+    # si usan puntos para miles y coma para decimales: "1.234,56" -> "1234.56"
+    if ',' in cleaned and '.' in cleaned:
+        # asumir formato 1.234,56
+        cleaned = cleaned.replace('.', '').replace(',', '.')
+    else:
+        # sólo comas -> reemplazar coma por punto; sólo puntos -> mantener
+        cleaned = cleaned.replace(',', '.').replace('.', '.', 1)
+    try:
+        # convertir a Decimal-compatible string
+        value = float(cleaned)
+    except Exception:
+        raise ValueError("Precio inválido. Usa sólo números, punto o coma decimal.")
+    if not math.isfinite(value):
+        raise ValueError("Precio inválido. Usa sólo números, punto o coma decimal.")
+    if value < 0:
+        raise ValueError("El precio debe ser positivo.")
+    if value > PRECIO_MAXIMO:
+        raise ValueError("El precio es demasiado alto.")
+    # retornamos float que Django aceptará en el campo DecimalField al guardar
+    return value
+
+
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
         model = Usuario
@@ -80,6 +118,17 @@ class PymeRegistrationForm(forms.ModelForm):
 
     documento = forms.FileField(required=True, help_text="Adjunta documento (rut, escritura, permiso municipal, etc.)", widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
 
+    def clean_documento(self):
+        documento = self.cleaned_data.get('documento')
+        if documento and documento.size > documentos.max_bytes():
+            raise forms.ValidationError(documentos.mensaje_excedido())
+        if documento:
+            tipo, _ = documentos.tipo_documento(documento.read(16))
+            documento.seek(0)
+            if tipo is None:
+                raise forms.ValidationError("Formato no permitido: sube un PDF, PNG o JPG.")
+        return documento
+
 class PymeProductForm(forms.ModelForm):
     # keep precio field explicit so we can clean commas / currency symbols easily
     precio = forms.CharField(
@@ -91,8 +140,10 @@ class PymeProductForm(forms.ModelForm):
 
     class Meta:
         model = Producto
-        # no 'supermercado' (se asigna desde la pyme), y no tocar fecha_actualizacion
-        exclude = ['supermercado', 'fecha_actualizacion']
+        # no 'supermercado' (se asigna desde la pyme), y no tocar fecha_actualizacion;
+        # el grupo de equivalencia lo asigna agrupar_productos, no la pyme, y
+        # contenido/unidad los calcula Producto.save() desde nombre y descripción
+        exclude = ['supermercado', 'fecha_actualizacion', 'grupo', 'contenido', 'unidad']
 
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control'}),
@@ -105,28 +156,29 @@ class PymeProductForm(forms.ModelForm):
             'disponible': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def __init__(self, *args, supermercado=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # supermercado no es campo del form: Django no valida la unicidad
+        # (supermercado, codigo_interno), la revisa clean_codigo_interno
+        self.supermercado_id = supermercado.pk if supermercado else self.instance.supermercado_id
+
+    def clean_codigo_interno(self):
+        codigo = self.cleaned_data.get('codigo_interno') or None
+        if codigo and self.supermercado_id:
+            repetido = (
+                Producto.objects.filter(supermercado_id=self.supermercado_id, codigo_interno=codigo)
+                .exclude(pk=self.instance.pk).exists()
+            )
+            if repetido:
+                raise forms.ValidationError("Ya hay un producto con este código en la tienda.")
+        return codigo
+
     def clean_precio(self):
         raw = self.cleaned_data.get('precio', '')
-        if raw is None:
-            raise forms.ValidationError("Ingrese un precio válido.")
-        # remover símbolos, espacios y puntos de miles; reemplazar coma decimal por punto
-        cleaned = str(raw).strip().replace('$', '').replace(' ', '')
-        # si usan puntos para miles y coma para decimales: "1.234,56" -> "1234.56"
-        if ',' in cleaned and '.' in cleaned:
-            # asumir formato 1.234,56
-            cleaned = cleaned.replace('.', '').replace(',', '.')
-        else:
-            # sólo comas -> reemplazar coma por punto; sólo puntos -> mantener
-            cleaned = cleaned.replace(',', '.').replace('.', '.', 1)
         try:
-            # convertir a Decimal-compatible string
-            value = float(cleaned)
-        except Exception:
-            raise forms.ValidationError("Precio inválido. Usa sólo números, punto o coma decimal.")
-        if value < 0:
-            raise forms.ValidationError("El precio debe ser positivo.")
-        # retornamos Decimal string/float que Django aceptará en el campo DecimalField al guardar
-        return value
+            return parsear_precio(raw)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
 
     def clean_moneda(self):
         m = (self.cleaned_data.get('moneda') or 'CLP').strip().upper()
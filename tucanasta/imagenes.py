@@ -0,0 +1,299 @@
+"""
+Proxy y cache en disco de las imágenes de productos (imagen_url).
+
+Las tarjetas piden /img/<producto_id>/<clave>/ en vez de la URL del
+supermercado. La primera vez se descarga la imagen con el fetcher
+configurado (IMAGENES_FETCHER), se reduce a IMAGENES_TAMANO px en WebP y se
+guarda en IMAGENES_CACHE_ROOT con el sha256 de la URL como nombre; desde ahí
+se sirve del disco con cache de un año (la clave cambia si cambia la URL).
+
+- Sin Pillow no se puede redimensionar: se guarda la imagen original tal
+  cual (si de verdad es una imagen).
+- Sólo se descarga por http/https hacia IPs públicas (imagen_url la
+  escribe la pyme y el pedido sale desde el servidor), y sólo para
+  productos disponibles.
+- Si la descarga falla se deja una marca `.error` y durante
+  IMAGENES_REINTENTO segundos se responde el placeholder sin reintentar.
+- El total en disco se mantiene bajo IMAGENES_CACHE_MAX_BYTES borrando las
+  menos usadas (LRU por mtime, que se refresca al servir).
+"""
+import hashlib
+import http.client
+import ipaddress
+import logging
+import os
+import re
+import socket
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .catalogo import PLACEHOLDER_IMG
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él se guarda la imagen original
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+LARGO_CLAVE = 32  # hex del sha256 de la URL: nombre del archivo y parte de la ruta
+SUFIJO_ERROR = '.error'
+PODAR_CADA = 100  # imágenes nuevas entre podas
+REFRESCAR_USO = 24 * 60 * 60  # segundos: no tocar mtime en cada hit
+ESQUEMAS = ('http', 'https')  # lo único que se descarga
+
+FIRMAS_IMAGEN = {
+    b'RIFF': 'image/webp',  # + 'WEBP' en el byte 8
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'GIF8': 'image/gif',
+}
+
+CLAVE = re.compile(r'^[0-9a-f]{%d}$' % LARGO_CLAVE)
+
+_guardadas = 0
+
+
+class ErrorImagen(Exception):
+    pass
+
+
+def raiz():
+    return Path(settings.IMAGENES_CACHE_ROOT)
+
+
+def clave_url(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:LARGO_CLAVE]
+
+
+def clave_valida(clave):
+    return bool(CLAVE.match(clave))
+
+
+def ruta(clave):
+    return raiz() / clave[:2] / clave
+
+
+def content_type(cabecera):
+    for firma, tipo in FIRMAS_IMAGEN.items():
+        if cabecera.startswith(firma) and (tipo != 'image/webp' or cabecera[8:12] == b'WEBP'):
+            return tipo
+    return None
+
+
+def url_proxy(producto_id, imagen_url):
+    """URL del proxy para la imagen del producto (o la original si ya es local)."""
+    if not imagen_url:
+        return PLACEHOLDER_IMG
+    if not url_descargable(imagen_url):
+        return imagen_url  # placeholder o estática propia
+    return reverse('imagen_producto', args=[producto_id, clave_url(imagen_url)])
+
+
+def proxy_filas(filas):
+    """Reemplaza 'imagen' por la URL del proxy en filas de tarjetas (dicts con 'id')."""
+    for fila in filas:
+        fila['imagen'] = url_proxy(fila['id'], fila['imagen'])
+    return filas
+
+
+# --- descarga ---
+
+def url_descargable(url):
+    return urllib.parse.urlsplit(url).scheme in ESQUEMAS
+
+
+def _ip_publica(ip):
+    ip = ipaddress.ip_address(ip.split('%', 1)[0])
+    if getattr(ip, 'ipv4_mapped', None):
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _conectar_publico(direccion, *args, **kwargs):
+    """
+    socket.create_connection que rechaza IPs de loopback, privadas, link-local,
+    etc. Revisa la IP a la que de verdad se conectó (no la del DNS de antes),
+    así no sirve un DNS que cambia entre la validación y la conexión.
+    """
+    sock = socket.create_connection(direccion, *args, **kwargs)
+    ip = sock.getpeername()[0]
+    if not _ip_publica(ip):
+        sock.close()
+        raise ErrorImagen(f'{direccion[0]} resuelve a una dirección no pública ({ip})')
+    return sock
+
+
+class _HTTPConexionPublica(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _conectar_publico
+
+
+class _HTTPSConexionPublica(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _conectar_publico
+
+
+class _HTTPPublico(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_HTTPConexionPublica, req)
+
+
+class _HTTPSPublico(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_HTTPSConexionPublica, req, context=self._context)
+
+
+class _RedireccionHttp(urllib.request.HTTPRedirectHandler):
+    """Sigue redirecciones sólo a http/https (cada conexión vuelve a pasar por _conectar_publico)."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not url_descargable(newurl):
+            raise ErrorImagen(f'redirección no permitida a {newurl}')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# sin proxies del entorno: la IP revisada tiene que ser la del servidor de la imagen
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _HTTPPublico, _HTTPSPublico, _RedireccionHttp)
+
+
+def descargar_http(url):
+    """
+    Fetcher por defecto: GET con timeout y tope de tamaño. Devuelve bytes.
+    Sólo http/https hacia direcciones públicas, también en las redirecciones:
+    imagen_url la escriben las pymes y la descarga sale desde el servidor.
+    """
+    if not url_descargable(url):
+        raise ErrorImagen(f'{url}: esquema no permitido')
+    peticion = urllib.request.Request(url, headers={'User-Agent': 'TusCanastas/1.0 (+imagenes)'})
+    try:
+        with _opener.open(peticion, timeout=settings.IMAGENES_TIMEOUT) as respuesta:
+            datos = respuesta.read(settings.IMAGENES_MAX_BYTES_ORIGEN + 1)
+    except ErrorImagen:
+        raise
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        raise ErrorImagen(f'{url}: {e}') from e
+    if len(datos) > settings.IMAGENES_MAX_BYTES_ORIGEN:
+        raise ErrorImagen(f'{url}: supera {settings.IMAGENES_MAX_BYTES_ORIGEN} bytes')
+    return datos
+
+
+def _miniatura(datos):
+    if content_type(datos[:12]) is None:
+        raise ErrorImagen('el contenido no es una imagen')
+    if Image is None:
+        return datos
+    try:
+        imagen = Image.open(BytesIO(datos))
+        imagen.thumbnail((settings.IMAGENES_TAMANO, settings.IMAGENES_TAMANO))
+        salida = BytesIO()
+        imagen.save(salida, 'WEBP', quality=80)
+    except (OSError, ValueError) as e:
+        raise ErrorImagen(f'imagen ilegible: {e}') from e
+    return salida.getvalue()
+
+
+def _escribir(destino, datos):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    # escritura atómica: nunca se sirve un archivo a medias
+    with tempfile.NamedTemporaryFile(dir=destino.parent, delete=False) as tmp:
+        tmp.write(datos)
+    os.replace(tmp.name, destino)
+
+
+def obtener(url):
+    """
+    Devuelve la ruta en disco de la miniatura de `url`, descargándola si
+    hace falta. Lanza ErrorImagen si no se pudo (o falló hace poco).
+    """
+    global _guardadas
+    if not url_descargable(url):
+        raise ErrorImagen(f'{url}: esquema no permitido')
+    destino = ruta(clave_url(url))
+    if destino.exists():
+        return destino
+
+    marca = destino.with_name(destino.name + SUFIJO_ERROR)
+    if marca.exists() and time.time() - marca.stat().st_mtime < settings.IMAGENES_REINTENTO:
+        raise ErrorImagen(f'{url}: falló hace poco')
+
+    fetcher = import_string(settings.IMAGENES_FETCHER)
+    try:
+        datos = _miniatura(fetcher(url))
+    except ErrorImagen as e:
+        logger.warning('No se pudo obtener la imagen %s: %s', url, e)
+        _escribir(marca, b'')
+        raise
+    _escribir(destino, datos)
+    marca.unlink(missing_ok=True)
+
+    _guardadas += 1
+    if _guardadas % PODAR_CADA == 0:
+        podar()
+    return destino
+
+
+def marcar_uso(destino):
+    """Refresca mtime (orden LRU) como mucho una vez al día por archivo."""
+    try:
+        if time.time() - destino.stat().st_mtime > REFRESCAR_USO:
+            os.utime(destino)
+    except OSError:
+        pass
+
+
+def podar(presupuesto=None):
+    """
+    Si la cache pasa del presupuesto, borra las imágenes usadas hace más
+    tiempo hasta quedar en el 90%. Devuelve (archivos borrados, bytes liberados).
+    """
+    presupuesto = settings.IMAGENES_CACHE_MAX_BYTES if presupuesto is None else presupuesto
+    archivos = []
+    total = 0
+    for carpeta, _, nombres in os.walk(raiz()):
+        for nombre in nombres:
+            try:
+                info = os.stat(os.path.join(carpeta, nombre))
+            except OSError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, os.path.join(carpeta, nombre)))
+            total += info.st_size
+    if total <= presupuesto:
+        return 0, 0
+
+    objetivo = presupuesto * 0.9
+    borrados = liberados = 0
+    for _, tamano, camino in sorted(archivos):
+        if total <= objetivo:
+            break
+        try:
+            os.unlink(camino)
+        except OSError:
+            continue
+        total -= tamano
+        liberados += tamano
+        borrados += 1
+    logger.info('Cache de imágenes podada: %s archivos, %s bytes', borrados, liberados)
+    return borrados, liberados
+
+
+def servir(destino):
+    """Respuesta con la miniatura en disco; la URL cambia con la imagen, así que no expira."""
+    marcar_uso(destino)
+    archivo = open(destino, 'rb')
+    response = FileResponse(archivo, content_type=content_type(archivo.read(12)) or 'application/octet-stream')
+    archivo.seek(0)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{destino.name}"'
+    return response
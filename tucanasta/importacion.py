@@ -0,0 +1,181 @@
+"""
+Importación masiva de catálogos (feeds CSV / JSONL) por supermercado.
+
+Lee el archivo en streaming y hace upsert por (supermercado, codigo_interno)
+en lotes con bulk_create(update_conflicts=True): un INSERT ... ON CONFLICT
+DO UPDATE por lote, sin pasar por formularios ni save() fila a fila.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.utils import timezone
+
+from .catalogo import invalidar_catalogo
+from .forms import parsear_precio
+from .models import Producto
+from .precios import registrar_precios
+
+CAMPOS_ACTUALIZABLES = [
+    'nombre', 'marca', 'tipo', 'descripcion', 'precio', 'moneda',
+    'imagen_url', 'producto_url', 'disponible', 'fecha_actualizacion',
+    'contenido', 'unidad',  # precio_por_unidad lo recalcula la BD
+]
+
+_validar_url = URLValidator()
+
+VERDADEROS = {'1', 'true', 't', 'si', 'sí', 'yes', 'y', 'x'}
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+def leer_filas(archivo, formato):
+    """Itera dicts desde un archivo abierto en modo texto."""
+    if formato == 'csv':
+        yield from csv.DictReader(archivo)
+    elif formato == 'jsonl':
+        for linea in archivo:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except json.JSONDecodeError:
+                yield None  # fila_a_producto la reporta como inválida
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def _texto(fila, campo, largo=None):
+    valor = fila.get(campo)
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    if largo:
+        valor = valor[:largo]
+    return valor or None
+
+
+def _url(fila, campo):
+    # truncar una URL la deja rota: mejor rechazar la fila
+    valor = _texto(fila, campo)
+    if valor is None:
+        return None
+    largo = Producto._meta.get_field(campo).max_length
+    if len(valor) > largo:
+        raise FilaInvalida(f"{campo} supera {largo} caracteres")
+    try:
+        _validar_url(valor)
+    except ValidationError:
+        raise FilaInvalida(f"{campo} no es una URL válida")
+    return valor
+
+
+def fila_a_producto(fila, supermercado, ahora):
+    if not isinstance(fila, dict):
+        raise FilaInvalida("fila mal formada")
+    codigo = _texto(fila, 'codigo_interno', 100) or _texto(fila, 'sku', 100)
+    nombre = _texto(fila, 'nombre', 200)
+    tipo = _texto(fila, 'tipo', 100)
+    if not codigo or not nombre or not tipo:
+        raise FilaInvalida("faltan codigo_interno/sku, nombre o tipo")
+    try:
+        precio = Decimal(str(parsear_precio(fila.get('precio')))).quantize(Decimal('0.01'))
+    except (ValueError, InvalidOperation) as e:
+        raise FilaInvalida(str(e) or 'precio inválido')
+
+    disponible = fila.get('disponible', True)
+    if not isinstance(disponible, bool):
+        disponible = str(disponible).strip().lower() in VERDADEROS
+
+    producto = Producto(
+        supermercado=supermercado,
+        codigo_interno=codigo,
+        nombre=nombre,
+        marca=_texto(fila, 'marca', 100),
+        tipo=tipo,
+        descripcion=_texto(fila, 'descripcion'),
+        precio=precio,
+        moneda=(_texto(fila, 'moneda', 10) or 'CLP').upper(),
+        imagen_url=_url(fila, 'imagen_url'),
+        producto_url=_url(fila, 'producto_url'),
+        disponible=disponible,
+        fecha_actualizacion=ahora,
+    )
+    producto.completar_contenido()  # bulk_create no pasa por save()
+    return producto
+
+
+def _guardar_lote(lote):
+    # ON CONFLICT no puede tocar la misma fila dos veces en un mismo INSERT:
+    # si el feed repite un código dentro del lote, gana la última fila
+    unicos = list({p.codigo_interno: p for p in lote}.values())
+    with transaction.atomic():
+        Producto.objects.bulk_create(
+            unicos,
+            update_conflicts=True,
+            unique_fields=['supermercado', 'codigo_interno'],
+            update_fields=CAMPOS_ACTUALIZABLES,
+        )
+    return len(unicos)
+
+
+def importar_catalogo(archivo, formato, supermercado, lote=1000, desactivar_faltantes=True):
+    """
+    Importa un feed completo para `supermercado`.
+    Si `desactivar_faltantes`, los productos con código que no vinieron en el
+    feed quedan disponible=False (un solo UPDATE usando fecha_actualizacion).
+    Devuelve un dict con el resumen (filas, errores, filas/seg, ...).
+    """
+    inicio = time.monotonic()
+    ahora = timezone.now()
+    filas = guardados = 0
+    errores = []
+    pendiente = []
+
+    for numero, fila in enumerate(leer_filas(archivo, formato), start=1):
+        filas += 1
+        try:
+            pendiente.append(fila_a_producto(fila, supermercado, ahora))
+        except FilaInvalida as e:
+            errores.append((numero, str(e)))
+            continue
+        if len(pendiente) >= lote:
+            guardados += _guardar_lote(pendiente)
+            pendiente = []
+    if pendiente:
+        guardados += _guardar_lote(pendiente)
+
+    # historial: sólo los productos tocados por este feed cuyo precio cambió
+    precios_nuevos = registrar_precios(
+        Producto.objects.filter(supermercado=supermercado, fecha_actualizacion__gte=ahora)
+    )
+
+    desactivados = 0
+    if desactivar_faltantes:
+        desactivados = (
+            Producto.objects
+            .filter(supermercado=supermercado, disponible=True, codigo_interno__isnull=False,
+                    fecha_actualizacion__lt=ahora)
+            .update(disponible=False)
+        )
+
+    # bulk_create/update no disparan señales
+    transaction.on_commit(invalidar_catalogo)
+
+    segundos = time.monotonic() - inicio
+    return {
+        'filas': filas,
+        'guardados': guardados,
+        'errores': errores,
+        'desactivados': desactivados,
+        'precios_nuevos': precios_nuevos,
+        'segundos': segundos,
+        'filas_por_segundo': filas / segundos if segundos else float(filas),
+    }
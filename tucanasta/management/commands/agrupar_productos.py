@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tucanasta.equivalencias import agrupar_catalogo
+
+
+class Command(BaseCommand):
+    help = "Agrupa productos equivalentes entre supermercados (nombre, marca y contenido)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Tamaño de lote para lecturas y bulk_update")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        r = agrupar_catalogo(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['productos']} productos en {r['grupos']} grupos "
+            f"({r['reasignados']} reasignados, {r['grupos_borrados']} grupos vacíos borrados) "
+            f"en {time.monotonic() - inicio:.2f}s."
+        ))
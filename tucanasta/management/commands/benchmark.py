@@ -0,0 +1,88 @@
+import json
+import platform
+import subprocess
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from tucanasta.benchmark import PREFIJO_USUARIO, comparar, medir
+from tucanasta.models import Producto, Usuario
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide p50/p95 de latencia y consultas SQL de las vistas calientes (comparador, categoría, "
+        "producto, búsqueda, carrito) con el cliente de pruebas y guarda el resultado en JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=30)
+        parser.add_argument('--calentamiento', type=int, default=3, help="Requests iniciales que no se cuentan")
+        parser.add_argument('--escenario', action='append', help="Sólo estos escenarios (se puede repetir)")
+        parser.add_argument('--usuario', help=f"Usuario logueado (por defecto el primer {PREFIJO_USUARIO}*)")
+        parser.add_argument('--sin-cache', action='store_true', help="Vaciar el cache antes de cada request")
+        parser.add_argument('--host', default='localhost', help="Host de las requests (debe estar en ALLOWED_HOSTS)")
+        parser.add_argument('--salida', default='benchmark.json', help="Archivo JSON de resultados")
+        parser.add_argument('--comparar', help="JSON de una corrida anterior para mostrar la diferencia")
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = Usuario.objects.filter(username__startswith=PREFIJO_USUARIO).order_by('pk').first()
+        if usuario is None:
+            raise CommandError("No hay usuario para el benchmark; corre antes `manage.py seed_benchmark`.")
+
+        resultados = medir(
+            usuario,
+            iteraciones=options['iteraciones'],
+            calentamiento=options['calentamiento'],
+            solo=options['escenario'],
+            sin_cache=options['sin_cache'],
+            host=options['host'],
+        )
+
+        self.stdout.write(f"{'escenario':<24}{'p50 ms':>9}{'p95 ms':>9}{'consultas':>11}{'errores':>9}")
+        for nombre, r in resultados.items():
+            self.stdout.write(
+                f"{nombre:<24}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['consultas_p50']:>11}{r['errores']:>9}"
+            )
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_de_datos': connection.vendor,
+            'productos': Producto.objects.count(),
+            'usuario': usuario.username,
+            'parametros': {k: options[k] for k in ('iteraciones', 'calentamiento', 'sin_cache')},
+            'escenarios': resultados,
+        }
+        salida = Path(options['salida'])
+        salida.parent.mkdir(parents=True, exist_ok=True)
+        salida.write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"Resultados en {salida}"))
+
+        if options['comparar']:
+            try:
+                anterior = json.loads(Path(options['comparar']).read_text(encoding='utf-8'))['escenarios']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"No se pudo leer {options['comparar']}: {e}")
+            self.stdout.write(f"\nvs {options['comparar']}:")
+            for nombre, antes, ahora, cambio, q_antes, q_ahora in comparar(resultados, anterior):
+                linea = f"{nombre:<24}{antes:>9.1f} -> {ahora:>7.1f} ms ({cambio:+.0f}%)  consultas {q_antes} -> {q_ahora}"
+                regresion = cambio > 20 or q_ahora > q_antes
+                self.stdout.write(self.style.WARNING(linea) if regresion else linea)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tucanasta.precios import compactar_historial
+
+
+class Command(BaseCommand):
+    help = "Reduce el historial de precios antiguo a una fila por semana y aplica la retención."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias-diarios', type=int, default=180, help="Días con resolución diaria (por defecto 180)")
+        parser.add_argument('--dias-retencion', type=int, default=365 * 5, help="Días a conservar (por defecto 5 años)")
+
+    def handle(self, *args, **options):
+        borrados = compactar_historial(options['dias_diarios'], options['dias_retencion'])
+        self.stdout.write(self.style.SUCCESS(f"{borrados} filas de historial eliminadas."))
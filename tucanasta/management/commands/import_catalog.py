@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tucanasta.equivalencias import agrupar_catalogo
+from tucanasta.importacion import importar_catalogo
+from tucanasta.models import Supermercado
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa un feed de productos (CSV o JSONL) para un supermercado, "
+        "haciendo upsert por codigo_interno en lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta al feed (.csv o .jsonl)")
+        parser.add_argument('--supermercado', required=True, help="Nombre del supermercado (se crea si no existe)")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help="Por defecto se infiere de la extensión")
+        parser.add_argument('--lote', type=int, default=1000, help="Filas por INSERT ... ON CONFLICT")
+        parser.add_argument('--no-desactivar', action='store_true', help="No marcar como no disponibles los SKU ausentes del feed")
+        parser.add_argument('--agrupar', action='store_true', help="Recalcular grupos de equivalencia al terminar")
+
+    def handle(self, *args, **options):
+        ruta = Path(options['archivo'])
+        if not ruta.exists():
+            raise CommandError(f"No existe el archivo {ruta}")
+        formato = options['formato'] or ruta.suffix.lstrip('.').lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError("No se pudo inferir el formato; usa --formato csv|jsonl")
+
+        supermercado, creado = Supermercado.objects.get_or_create(nombre=options['supermercado'])
+        if creado:
+            self.stdout.write(f"Supermercado '{supermercado.nombre}' creado.")
+
+        with ruta.open(encoding='utf-8', newline='') as archivo:
+            r = importar_catalogo(
+                archivo, formato, supermercado,
+                lote=options['lote'],
+                desactivar_faltantes=not options['no_desactivar'],
+            )
+
+        for numero, error in r['errores'][:20]:
+            self.stderr.write(f"  fila {numero}: {error}")
+        if len(r['errores']) > 20:
+            self.stderr.write(f"  ... y {len(r['errores']) - 20} errores más")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{r['filas']} filas ({r['guardados']} guardadas, {len(r['errores'])} con error, "
+            f"{r['desactivados']} desactivadas, {r['precios_nuevos']} cambios de precio) en {r['segundos']:.2f}s "
+            f"— {r['filas_por_segundo']:.0f} filas/s."
+        ))
+
+        if options['agrupar']:
+            g = agrupar_catalogo()
+            self.stdout.write(f"Grupos de equivalencia: {g['grupos']} ({g['reasignados']} reasignados).")
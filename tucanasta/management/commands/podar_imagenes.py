@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tucanasta.imagenes import podar
+
+
+class Command(BaseCommand):
+    help = "Recorta la cache de imágenes de productos al presupuesto (borra las usadas hace más tiempo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, help="Presupuesto en bytes (por defecto IMAGENES_CACHE_MAX_BYTES)")
+
+    def handle(self, *args, **options):
+        presupuesto = options['max_bytes'] if options['max_bytes'] is not None else settings.IMAGENES_CACHE_MAX_BYTES
+        borrados, liberados = podar(presupuesto)
+        self.stdout.write(self.style.SUCCESS(f"{borrados} imágenes borradas, {liberados} bytes liberados."))
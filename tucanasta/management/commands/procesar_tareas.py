@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tucanasta.tareas import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de tareas (correos, documentos de pymes, reagrupar catálogo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help="Vaciar la cola una vez y terminar")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--max', type=int, help="Terminar después de ejecutar este número de tareas")
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                limite = None if options['max'] is None else options['max'] - total
+                n = procesar_pendientes(limite)
+                total += n
+                if n:
+                    self.stdout.write(f"{n} tareas ejecutadas.")
+                if options['una_vez'] or (options['max'] is not None and total >= options['max']):
+                    break
+                # el worker vive mucho: respetar CONN_MAX_AGE como entre requests
+                close_old_connections()
+                if not n:
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{total} tareas ejecutadas en total."))
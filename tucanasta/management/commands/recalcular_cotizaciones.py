@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tucanasta.models import Cotizacion
+
+
+class Command(BaseCommand):
+    help = "Recalcula total y cantidad_items de las cotizaciones (reparación de drift)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help="IDs de cotizaciones (por defecto, todas)")
+
+    def handle(self, *args, **options):
+        actualizadas = Cotizacion.recalcular_totales(*options['ids'])
+        self.stdout.write(self.style.SUCCESS(f"{actualizadas} cotizaciones recalculadas."))
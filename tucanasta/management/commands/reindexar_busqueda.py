@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tucanasta.busqueda import reindexar, usa_fts
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda full-text de productos (FTS5, sólo SQLite)."
+
+    def handle(self, *args, **options):
+        if not usa_fts():
+            self.stdout.write("El motor de base de datos no usa FTS5; nada que reindexar.")
+            return
+        reindexar()
+        self.stdout.write(self.style.SUCCESS("Índice de búsqueda reconstruido."))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tucanasta.benchmark import limpiar, sembrar
+from tucanasta.equivalencias import agrupar_catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un catálogo sintético (supermercados, productos, usuarios con carrito y "
+        "cotizaciones guardadas) para el benchmark. Úsalo en una base aparte (DB_NAME=bench.sqlite3)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supermercados', type=int, default=5)
+        parser.add_argument('--productos', type=int, default=2000, help="Productos por supermercado")
+        parser.add_argument('--usuarios', type=int, default=50)
+        parser.add_argument('--guardadas', type=int, default=3, help="Cotizaciones guardadas por usuario")
+        parser.add_argument('--items', type=int, default=20, help="Items por cotización")
+        parser.add_argument('--semilla', type=int, default=1, help="Misma semilla, mismos datos")
+        parser.add_argument('--limpiar', action='store_true', help="Borrar antes lo sembrado en una corrida anterior")
+        parser.add_argument('--sin-agrupar', action='store_true', help="No calcular grupos de equivalencia")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        if options['limpiar']:
+            limpiar()
+        r = sembrar(
+            supermercados=options['supermercados'],
+            productos=options['productos'],
+            usuarios=options['usuarios'],
+            guardadas=options['guardadas'],
+            items=options['items'],
+            semilla=options['semilla'],
+        )
+        self.stdout.write(
+            f"{r['supermercados']} supermercados, {r['productos']} productos, {r['usuarios']} usuarios, "
+            f"{r['cotizaciones']} cotizaciones con {r['items']} items."
+        )
+        if not options['sin_agrupar']:
+            g = agrupar_catalogo()
+            self.stdout.write(f"Grupos de equivalencia: {g['grupos']}.")
+        self.stdout.write(self.style.SUCCESS(f"Listo en {time.monotonic() - inicio:.1f}s."))
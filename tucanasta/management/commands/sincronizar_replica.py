@@ -0,0 +1,32 @@
+import sqlite3
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tucanasta.replicas import PRIMARIO, REPLICA, hay_replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia la base primaria a la réplica con la API de backup de SQLite "
+        "(para probar en local la réplica de lectura con dos archivos)."
+    )
+
+    def handle(self, *args, **options):
+        if not hay_replica():
+            raise CommandError("No hay alias 'replica' configurado (DB_REPLICA_NAME).")
+        primario, replica = connections[PRIMARIO], connections[REPLICA]
+        if primario.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("Sólo para SQLite; en PostgreSQL la réplica la mantiene la replicación del servidor.")
+        destino = Path(replica.settings_dict['NAME']).resolve()
+        if destino == Path(primario.settings_dict['NAME']).resolve():
+            raise CommandError("La réplica apunta al mismo archivo que el primario.")
+
+        # backup en línea: consistente aunque haya escrituras en curso
+        primario.ensure_connection()
+        replica.close()
+        with sqlite3.connect(destino) as copia:
+            primario.connection.backup(copia)
+        copia.close()
+        self.stdout.write(self.style.SUCCESS(f"Réplica actualizada: {destino}"))
@@ -0,0 +1,210 @@
+"""
+Métricas por request: consultas SQL, tiempo en SQL, tiempo de plantillas y
+latencia total, agrupadas por nombre de URL.
+
+- MetricasMiddleware (primero en MIDDLEWARE) mide cada request y acumula en
+  memoria del proceso; /metricas/ las expone en formato de texto de
+  Prometheus. Con varios workers cada proceso reporta lo suyo (Prometheus
+  suma por instancia).
+- Con METRICAS_SERVER_TIMING la respuesta lleva `Server-Timing` (se ve en la
+  pestaña Network del navegador).
+- @presupuesto_consultas(n) declara cuántas consultas puede hacer una vista.
+  Si se pasa se registra un warning, y con METRICAS_PRESUPUESTO_ESTRICTO se
+  lanza PresupuestoExcedido (en los tests hace fallar al que reintroduce un N+1).
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# límites de los buckets del histograma de latencia (segundos)
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# control de transacciones: no cuenta como consulta para el presupuesto
+CONTROL_TRANSACCION = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+_actual = ContextVar('tucanasta_medicion', default=None)
+
+
+class PresupuestoExcedido(Exception):
+    pass
+
+
+def presupuesto_consultas(maximo):
+    """Declara el máximo de consultas SQL por request de la vista (toda la request, sesión incluida)."""
+    def decorar(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorar
+
+
+class Medicion:
+    __slots__ = ('consultas', 'sql', 'plantillas')
+
+    def __init__(self):
+        self.consultas = 0
+        self.sql = 0.0
+        self.plantillas = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de cada conexión
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - inicio
+            if not sql.lstrip()[:9].upper().startswith(CONTROL_TRANSACCION):
+                self.consultas += 1
+
+
+class Registro:
+    """Acumulados por vista desde que arrancó el proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.vistas = {}
+
+    def sumar(self, vista, estado, medicion, segundos, excedido):
+        with self._lock:
+            v = self.vistas.setdefault(vista, {
+                'estados': {}, 'buckets': [0] * len(BUCKETS), 'segundos': 0.0,
+                'consultas': 0, 'sql': 0.0, 'plantillas': 0.0, 'excedidos': 0,
+            })
+            v['estados'][estado] = v['estados'].get(estado, 0) + 1
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    v['buckets'][i] += 1
+            v['segundos'] += segundos
+            v['consultas'] += medicion.consultas
+            v['sql'] += medicion.sql
+            v['plantillas'] += medicion.plantillas
+            v['excedidos'] += excedido
+
+    def limpiar(self):
+        with self._lock:
+            self.vistas.clear()
+
+    def prometheus(self):
+        with self._lock:
+            vistas = {k: {**v, 'estados': dict(v['estados']), 'buckets': list(v['buckets'])} for k, v in self.vistas.items()}
+        lineas = []
+
+        def metrica(nombre, tipo, ayuda, muestras):
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            lineas.extend(f'{nombre}{etiquetas} {valor:g}' for etiquetas, valor in muestras)
+
+        orden = sorted(vistas.items())
+        metrica('tucanasta_requests_total', 'counter', 'Requests por vista y código de estado.', [
+            (f'{{vista="{vista}",estado="{estado}"}}', n)
+            for vista, v in orden for estado, n in sorted(v['estados'].items())
+        ])
+        muestras = []
+        for vista, v in orden:
+            total = sum(v['estados'].values())
+            muestras += [(f'_bucket{{vista="{vista}",le="{limite}"}}', n) for limite, n in zip(BUCKETS, v['buckets'])]
+            muestras += [
+                (f'_bucket{{vista="{vista}",le="+Inf"}}', total),
+                (f'_sum{{vista="{vista}"}}', v['segundos']),
+                (f'_count{{vista="{vista}"}}', total),
+            ]
+        metrica('tucanasta_request_segundos', 'histogram', 'Latencia total de la request.', muestras)
+        metrica('tucanasta_sql_consultas_total', 'counter', 'Consultas SQL ejecutadas.',
+                [(f'{{vista="{vista}"}}', v['consultas']) for vista, v in orden])
+        metrica('tucanasta_sql_segundos_total', 'counter', 'Tiempo total en consultas SQL.',
+                [(f'{{vista="{vista}"}}', v['sql']) for vista, v in orden])
+        metrica('tucanasta_plantilla_segundos_total', 'counter', 'Tiempo total renderizando plantillas.',
+                [(f'{{vista="{vista}"}}', v['plantillas']) for vista, v in orden])
+        metrica('tucanasta_presupuesto_excedido_total', 'counter', 'Requests que pasaron el presupuesto de consultas.',
+                [(f'{{vista="{vista}"}}', v['excedidos']) for vista, v in orden])
+        return '\n'.join(lineas) + '\n'
+
+
+registro = Registro()
+
+
+def _nombre_vista(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'sin_ruta'
+    return match.view_name or match._func_path
+
+
+def _server_timing(medicion, segundos):
+    return (
+        f'sql;dur={medicion.sql * 1000:.1f};desc="{medicion.consultas} consultas", '
+        f'plantilla;dur={medicion.plantillas * 1000:.1f}, '
+        f'total;dur={segundos * 1000:.1f}'
+    )
+
+
+class MetricasMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _actual.reset(token)
+        segundos = time.perf_counter() - inicio
+
+        vista = _nombre_vista(request)
+        match = getattr(request, 'resolver_match', None)
+        maximo = getattr(getattr(match, 'func', None), 'presupuesto_consultas', None)
+        excedido = maximo is not None and medicion.consultas > maximo
+        registro.sumar(vista, response.status_code, medicion, segundos, excedido)
+
+        if getattr(settings, 'METRICAS_SERVER_TIMING', False):
+            response['Server-Timing'] = _server_timing(medicion, segundos)
+        if excedido:
+            mensaje = f'{vista}: {medicion.consultas} consultas SQL (presupuesto {maximo})'
+            if getattr(settings, 'METRICAS_PRESUPUESTO_ESTRICTO', False):
+                raise PresupuestoExcedido(mensaje)
+            logger.warning(mensaje)
+        return response
+
+
+# --- plantillas ---
+
+class _PlantillaMedida:
+    """Envuelve la plantilla del backend para sumar su tiempo de render a la request."""
+
+    def __init__(self, plantilla):
+        self._plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self._plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        inicio = time.perf_counter()
+        try:
+            return self._plantilla.render(context, request)
+        finally:
+            medicion = _actual.get()
+            if medicion is not None:
+                medicion.plantillas += time.perf_counter() - inicio
+
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+    """Backend DjangoTemplates que reporta el tiempo de render a MetricasMiddleware."""
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaMedida(super().get_template(template_name))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def rellenar_totales(apps, schema_editor):
+    Cotizacion = apps.get_model('tucanasta', 'Cotizacion')
+    for cot in Cotizacion.objects.all().iterator():
+        agg = cot.items.aggregate(total=Sum(F('precio_unidad') * F('cantidad')), n=Count('pk'))
+        cot.total = agg['total'] or 0
+        cot.cantidad_items = agg['n']
+        cot.save(update_fields=['total', 'cantidad_items'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0003_pyme_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotizacion',
+            name='cantidad_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(rellenar_totales, migrations.RunPython.noop),
+    ]
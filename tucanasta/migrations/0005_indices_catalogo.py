@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:04
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def dejar_una_abierta_por_usuario(apps, schema_editor):
+    # antes de la restricción: deja sólo la cotización abierta más reciente de cada usuario
+    Cotizacion = apps.get_model('tucanasta', 'Cotizacion')
+    vistos = set()
+    for cot in Cotizacion.objects.filter(status='open').order_by('usuario_id', '-fecha_creacion', '-pk'):
+        if cot.usuario_id in vistos:
+            cot.status = 'saved'
+            cot.save(update_fields=['status'])
+        vistos.add(cot.usuario_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0004_cotizacion_totales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['usuario', 'status'], name='cotizacion_usuario_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('tipo'), models.F('precio'), condition=models.Q(('disponible', True)), name='producto_tipo_precio_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['supermercado', '-fecha_actualizacion'], name='producto_super_fecha_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', False)), fields=['-fecha_actualizacion'], name='producto_revision_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['tipo', 'supermercado', 'precio'], name='producto_ordering_idx'),
+        ),
+        migrations.RunPython(dejar_una_abierta_por_usuario, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cotizacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'open')), fields=('usuario',), name='una_cotizacion_abierta_por_usuario'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Índice de búsqueda full-text (FTS5) sobre productos. Sólo aplica en SQLite.
+#
+# El SQL va copiado tal cual (no importado de tucanasta.busqueda): una
+# migración tiene que seguir haciendo lo mismo aunque ese módulo cambie.
+
+from django.db import migrations
+
+
+class RunSQLSoloSQLite(migrations.RunSQL):
+    """RunSQL que no hace nada fuera de SQLite (FTS5 no existe en otros motores)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0005_indices_catalogo'),
+    ]
+
+    operations = [
+        RunSQLSoloSQLite(
+            sql=[
+                "CREATE VIRTUAL TABLE IF NOT EXISTS tucanasta_producto_fts USING fts5("
+                "nombre, marca, descripcion, tipo, "
+                "content='tucanasta_producto', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+                "CREATE TRIGGER IF NOT EXISTS tucanasta_producto_fts_ai AFTER INSERT ON tucanasta_producto BEGIN "
+                "INSERT INTO tucanasta_producto_fts(rowid, nombre, marca, descripcion, tipo) "
+                "VALUES (new.id, new.nombre, new.marca, new.descripcion, new.tipo); END",
+
+                "CREATE TRIGGER IF NOT EXISTS tucanasta_producto_fts_ad AFTER DELETE ON tucanasta_producto BEGIN "
+                "INSERT INTO tucanasta_producto_fts(tucanasta_producto_fts, rowid, nombre, marca, descripcion, tipo) "
+                "VALUES ('delete', old.id, old.nombre, old.marca, old.descripcion, old.tipo); END",
+
+                "CREATE TRIGGER IF NOT EXISTS tucanasta_producto_fts_au "
+                "AFTER UPDATE OF nombre, marca, descripcion, tipo ON tucanasta_producto BEGIN "
+                "INSERT INTO tucanasta_producto_fts(tucanasta_producto_fts, rowid, nombre, marca, descripcion, tipo) "
+                "VALUES ('delete', old.id, old.nombre, old.marca, old.descripcion, old.tipo); "
+                "INSERT INTO tucanasta_producto_fts(rowid, nombre, marca, descripcion, tipo) "
+                "VALUES (new.id, new.nombre, new.marca, new.descripcion, new.tipo); END",
+
+                # productos cargados antes de esta migración
+                "INSERT INTO tucanasta_producto_fts(tucanasta_producto_fts) VALUES ('rebuild')",
+            ],
+            reverse_sql=[
+                "DROP TRIGGER IF EXISTS tucanasta_producto_fts_ai",
+                "DROP TRIGGER IF EXISTS tucanasta_producto_fts_ad",
+                "DROP TRIGGER IF EXISTS tucanasta_producto_fts_au",
+                "DROP TABLE IF EXISTS tucanasta_producto_fts",
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0006_producto_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GrupoProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=40, unique=True)),
+                ('tipo', models.CharField(max_length=100)),
+                ('marca', models.CharField(blank=True, max_length=100)),
+                ('tokens', models.CharField(blank=True, max_length=255)),
+                ('contenido', models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True)),
+                ('unidad', models.CharField(blank=True, max_length=5)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='grupo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='productos', to='tucanasta.grupoproducto'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+def limpiar_codigos(apps, schema_editor):
+    # '' -> NULL y, si un supermercado repite un código, sólo el producto más nuevo lo conserva
+    Producto = apps.get_model('tucanasta', 'Producto')
+    Producto.objects.filter(codigo_interno='').update(codigo_interno=None)
+    vistos = set()
+    duplicados = []
+    for pk, super_id, codigo in (
+        Producto.objects.exclude(codigo_interno__isnull=True)
+        .order_by('supermercado_id', 'codigo_interno', '-fecha_actualizacion', '-pk')
+        .values_list('pk', 'supermercado_id', 'codigo_interno')
+    ):
+        if (super_id, codigo) in vistos:
+            duplicados.append(pk)
+        vistos.add((super_id, codigo))
+    Producto.objects.filter(pk__in=duplicados).update(codigo_interno=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0007_grupos_producto'),
+    ]
+
+    operations = [
+        migrations.RunPython(limpiar_codigos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.UniqueConstraint(fields=('supermercado', 'codigo_interno'), name='producto_codigo_por_supermercado'),
+        ),
+    ]
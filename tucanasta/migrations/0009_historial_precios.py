@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def precio_inicial(apps, schema_editor):
+    # punto de partida del historial: el precio actual de cada producto
+    Producto = apps.get_model('tucanasta', 'Producto')
+    HistorialPrecio = apps.get_model('tucanasta', 'HistorialPrecio')
+    HistorialPrecio.objects.bulk_create(
+        (
+            HistorialPrecio(producto_id=pk, dia=fecha.date(), precio=precio)
+            for pk, precio, fecha in Producto.objects.values_list('pk', 'precio', 'fecha_actualizacion').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0008_producto_codigo_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('producto', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='tucanasta.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('producto', 'dia'), name='historial_precio_producto_dia')],
+            },
+        ),
+        migrations.RunPython(precio_inicial, migrations.RunPython.noop),
+    ]
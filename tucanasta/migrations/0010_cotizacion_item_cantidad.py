@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+def borrar_items_sin_cantidad(apps, schema_editor):
+    # antes de la restricción: un item con cantidad 0 no está en el carrito
+    CotizacionItem = apps.get_model('tucanasta', 'CotizacionItem')
+    Cotizacion = apps.get_model('tucanasta', 'Cotizacion')
+    vacios = CotizacionItem.objects.filter(cantidad__lt=1)
+    cotizaciones = set(vacios.values_list('cotizacion_id', flat=True))
+    vacios.delete()
+    for cot in Cotizacion.objects.filter(pk__in=cotizaciones):
+        cot.cantidad_items = cot.items.count()
+        cot.save(update_fields=['cantidad_items'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0009_historial_precios'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_items_sin_cantidad, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cotizacionitem',
+            constraint=models.CheckConstraint(condition=models.Q(('cantidad__gte', 1)), name='cotizacion_item_cantidad_positiva'),
+        ),
+    ]
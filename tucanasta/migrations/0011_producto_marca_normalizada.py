@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:21
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0010_cotizacion_item_cantidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='marca_normalizada',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('marca')), output_field=models.CharField(max_length=100, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('tipo'), models.F('marca_normalizada'), models.F('supermercado'), models.F('precio'), condition=models.Q(('disponible', True)), name='producto_tipo_facetas_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0011_producto_marca_normalizada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pyme',
+            index=models.Index(condition=models.Q(('approved', False)), fields=['-fecha_creacion'], name='pyme_revision_fecha_idx'),
+        ),
+    ]
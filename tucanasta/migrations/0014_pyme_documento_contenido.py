@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:38
+
+import tucanasta.documentos
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+ANTIGUO = 'pyme_docs/'
+
+
+def quitar_prefijo(apps, schema_editor):
+    # los archivos no se mueven: DOCUMENTOS_ROOT ahora es la carpeta pyme_docs/
+    Pyme = apps.get_model('tucanasta', 'Pyme')
+    Pyme.objects.filter(documento__startswith=ANTIGUO).update(documento=Substr('documento', len(ANTIGUO) + 1))
+
+
+def poner_prefijo(apps, schema_editor):
+    Pyme = apps.get_model('tucanasta', 'Pyme')
+    Pyme.objects.exclude(documento__isnull=True).exclude(documento='').update(documento=Concat(Value(ANTIGUO), 'documento'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0013_tarea'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pyme',
+            name='documento',
+            field=models.FileField(blank=True, max_length=120, null=True, storage=tucanasta.documentos.DocumentosStorage(), upload_to=''),
+        ),
+        migrations.RunPython(quitar_prefijo, poner_prefijo),
+    ]
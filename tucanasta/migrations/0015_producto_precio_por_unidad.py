@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:59
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def completar_contenido(apps, schema_editor):
+    # lo mismo que Producto.completar_contenido(), en lotes
+    from tucanasta.equivalencias import parsear_contenido
+
+    Producto = apps.get_model('tucanasta', 'Producto')
+    cambiados = []
+    for p in Producto.objects.only('id', 'nombre', 'descripcion').iterator(chunk_size=1000):
+        p.contenido, p.unidad = parsear_contenido(f'{p.nombre} {p.descripcion or ""}')
+        if p.contenido is not None:
+            cambiados.append(p)
+    Producto.objects.bulk_update(cambiados, ['contenido', 'unidad'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tucanasta', '0014_pyme_documento_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='contenido',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='unidad',
+            field=models.CharField(blank=True, max_length=5),
+        ),
+        migrations.RunPython(completar_contenido, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='producto',
+            name='precio_por_unidad',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(contenido__gt=0, then=django.db.models.functions.math.Round(django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('precio', models.FloatField()), '*', models.Value(1000)), '/', django.db.models.functions.comparison.Cast('contenido', models.FloatField())), models.DecimalField(decimal_places=4, max_digits=18)), 2), unidad__in=['g', 'ml']), models.When(contenido__gt=0, then=django.db.models.functions.math.Round(django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('precio', models.FloatField()), '*', models.Value(1)), '/', django.db.models.functions.comparison.Cast('contenido', models.FloatField())), models.DecimalField(decimal_places=4, max_digits=18)), 2), unidad='u'), default=None), output_field=models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('tipo'), models.F('precio_por_unidad'), condition=models.Q(('disponible', True)), name='producto_tipo_ppu_disp_idx'),
+        ),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connections, models, router
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Cast, Lower, Round, Trim
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from .documentos import documentos_storage
+
 
 class Supermercado(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -21,9 +28,43 @@ class Usuario(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.nombre} {self.apellido})"
 
+class GrupoProducto(models.Model):
+    """
+    Productos equivalentes entre supermercados (mismo tipo, nombre/marca y
+    contenido). Lo llena el comando `agrupar_productos` (ver equivalencias.py).
+    """
+    clave = models.CharField(max_length=40, unique=True)  # sha1 de la firma
+    tipo = models.CharField(max_length=100)
+    marca = models.CharField(max_length=100, blank=True)
+    tokens = models.CharField(max_length=255, blank=True)
+    contenido = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    unidad = models.CharField(max_length=5, blank=True)  # g / ml / u
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.tipo}: {self.tokens} {self.contenido or ''}{self.unidad}"
+
+
+# unidad base del contenido -> unidad en que se expresa precio_por_unidad
+UNIDAD_PRECIO = {'g': 'kg', 'ml': 'L', 'u': 'u'}
+
+
+def _precio_por(factor):
+    # en float: en SQLite precio y contenido enteros harían división entera
+    por = Cast('precio', models.FloatField()) * factor / Cast('contenido', models.FloatField())
+    # redondeado en la BD (Postgres no tiene round(double, int)): el cursor de paginacion compara por igualdad
+    return Round(Cast(por, models.DecimalField(max_digits=18, decimal_places=4)), 2)
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=200)
     marca = models.CharField(max_length=100, blank=True, null=True)
+    # ' Tucapel ', 'TUCAPEL' -> 'tucapel': la calcula la BD, para facetas y filtros por marca
+    marca_normalizada = models.GeneratedField(
+        expression=Lower(Trim('marca')),
+        output_field=models.CharField(max_length=100, null=True),
+        db_persist=True,
+    )
     tipo = models.CharField(max_length=100, help_text="Categoría o tipo de producto, ej: pasta, arroz, aceite")
     descripcion = models.TextField(blank=True, null=True)
 
@@ -45,16 +86,92 @@ class Producto(models.Model):
     # Opcional: identificador interno o externo (para APIs o scraping)
     codigo_interno = models.CharField(max_length=100, blank=True, null=True)
 
+    # Grupo de equivalencia para comparar entre supermercados (agrupar_productos)
+    grupo = models.ForeignKey(GrupoProducto, on_delete=models.SET_NULL, null=True, blank=True, related_name='productos')
+
+    # Contenido parseado de nombre/descripción ('Arroz 5kg' -> 5000 g), lo llena save() y la importación
+    contenido = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    unidad = models.CharField(max_length=5, blank=True)  # g / ml / u
+    # $ por kg, por litro o por unidad: la calcula la BD, así sigue al precio en cualquier UPDATE
+    precio_por_unidad = models.GeneratedField(
+        expression=Case(
+            When(contenido__gt=0, unidad__in=['g', 'ml'], then=_precio_por(1000)),
+            When(contenido__gt=0, unidad='u', then=_precio_por(1)),
+            default=None,
+        ),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2, null=True),
+        db_persist=True,
+    )
+
     class Meta:
         ordering = ["tipo", "supermercado", "precio"]
+        # Índices parciales sobre `disponible`: en SQLite el filtro booleano se
+        # traduce a WHERE "disponible" / WHERE NOT "disponible", que sólo puede
+        # aprovechar un índice cuya condición coincida con ese término.
+        indexes = [
+            # categoría: LOWER(tipo) = ... AND disponible ORDER BY precio
+            models.Index(Lower('tipo'), F('precio'), condition=Q(disponible=True), name='producto_tipo_precio_disp_idx'),
+            # comparador: por supermercado, más recientes primero
+            models.Index(fields=['supermercado', '-fecha_actualizacion'], condition=Q(disponible=True), name='producto_super_fecha_disp_idx'),
+            # cola de revisión (disponible=False) ordenada por fecha
+            models.Index(fields=['-fecha_actualizacion'], condition=Q(disponible=False), name='producto_revision_fecha_idx'),
+            # ordering por defecto
+            models.Index(fields=['tipo', 'supermercado', 'precio'], name='producto_ordering_idx'),
+            # facetas: GROUP BY marca, tienda dentro de una categoría
+            models.Index(Lower('tipo'), F('marca_normalizada'), F('supermercado'), F('precio'), condition=Q(disponible=True), name='producto_tipo_facetas_idx'),
+            # categoría ordenada o filtrada por precio por kg / L / unidad
+            models.Index(Lower('tipo'), F('precio_por_unidad'), condition=Q(disponible=True), name='producto_tipo_ppu_disp_idx'),
+        ]
+        constraints = [
+            # clave de upsert de import_catalog (NULL no choca: productos sin código quedan libres)
+            models.UniqueConstraint(fields=['supermercado', 'codigo_interno'], name='producto_codigo_por_supermercado'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.supermercado.nombre}) - ${self.precio}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.completar_contenido()
+        elif {'nombre', 'descripcion'} & set(update_fields):
+            self.completar_contenido()
+            kwargs['update_fields'] = {*update_fields, 'contenido', 'unidad'}
+        super().save(*args, **kwargs)
+
+    def completar_contenido(self):
+        """Parsea contenido/unidad desde nombre + descripción (bulk_create no pasa por save())."""
+        from .equivalencias import parsear_contenido
+        self.contenido, self.unidad = parsear_contenido(f'{self.nombre} {self.descripcion or ""}')
+
+    @property
+    def unidad_precio(self):
+        """Unidad de precio_por_unidad para mostrar: 'kg', 'L' o 'u'."""
+        return UNIDAD_PRECIO.get(self.unidad, '')
+
 # Create your models here.
 
 
 
+class HistorialPrecio(models.Model):
+    """
+    Historial de precios append-only: una fila (producto, día, precio) sólo
+    cuando el precio cambia. Ver precios.registrar_precios().
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='historial_precios', db_index=False)
+    dia = models.DateField()
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # también sirve de índice para las consultas por rango de fechas
+            models.UniqueConstraint(fields=['producto', 'dia'], name='historial_precio_producto_dia'),
+        ]
+
+    def __str__(self):
+        return f'{self.producto_id} {self.dia}: ${self.precio}'
+
+
 class Cotizacion(models.Model):
     STATUS_CHOICES = (
         ('open', 'Abierta'),
@@ -66,15 +183,58 @@ class Cotizacion(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
 
+    # Denormalizados: los mantiene recalcular_totales() (señales de CotizacionItem)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cantidad_items = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['usuario', 'status'], name='cotizacion_usuario_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['usuario'], condition=Q(status='open'), name='una_cotizacion_abierta_por_usuario'),
+        ]
 
     def __str__(self):
         return f'Cotización #{self.pk} - {self.usuario} - {self.status}'
 
-    @property
-    def total(self):
-        return sum(item.subtotal for item in self.items.all())
+    @classmethod
+    def recalcular_totales(cls, *pks, devolver=False):
+        """
+        Recalcula total y cantidad_items con un solo UPDATE agregado.
+        Sin argumentos recalcula todas las cotizaciones (reparación de drift).
+        Devuelve cuántas actualizó, o con `devolver` un dict
+        {pk: (total, cantidad_items)} (en SQLite/Postgres con RETURNING,
+        sin volver a leer).
+        """
+        conexion = connections[router.db_for_write(cls)]
+        cotizaciones = conexion.ops.quote_name(cls._meta.db_table)
+        items = conexion.ops.quote_name(CotizacionItem._meta.db_table)
+        sql = (
+            f"UPDATE {cotizaciones} SET "
+            f"total = COALESCE((SELECT SUM(precio_unidad * cantidad) FROM {items} "
+            f"WHERE cotizacion_id = {cotizaciones}.id), 0), "
+            f"cantidad_items = (SELECT COUNT(*) FROM {items} WHERE cotizacion_id = {cotizaciones}.id)"
+        )
+        params = []
+        if pks:
+            sql += f" WHERE id IN ({', '.join(['%s'] * len(pks))})"
+            params = list(pks)
+        retornar = devolver and conexion.vendor in ('sqlite', 'postgresql')
+        if retornar:
+            sql += " RETURNING id, total, cantidad_items"
+
+        with conexion.cursor() as cursor:
+            cursor.execute(sql, params)
+            if not devolver:
+                return cursor.rowcount
+            filas = cursor.fetchall() if retornar else None
+        if filas is None:
+            qs = cls.objects.using(conexion.alias)
+            filas = (qs.filter(pk__in=pks) if pks else qs).values_list('pk', 'total', 'cantidad_items')
+        # SQLite devuelve la suma como float: mismo Decimal que leería el ORM
+        return {pk: (Decimal(str(total)).quantize(Decimal('0.01')), n) for pk, total, n in filas}
 
 
 class CotizacionItem(models.Model):
@@ -85,6 +245,9 @@ class CotizacionItem(models.Model):
 
     class Meta:
         unique_together = ('cotizacion', 'producto')
+        constraints = [
+            models.CheckConstraint(condition=Q(cantidad__gte=1), name='cotizacion_item_cantidad_positiva'),
+        ]
 
     @property
     def subtotal(self):
@@ -106,8 +269,50 @@ class Pyme(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
     # NUEVO: documento adjunto para verificación
-    documento = models.FileField(upload_to='pyme_docs/', blank=True, null=True)
+    # (nombre = sha256 del contenido, en DOCUMENTOS_ROOT; ver documentos.py)
+    documento = models.FileField(storage=documentos_storage, max_length=120, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # cola de revisión (approved=False) ordenada por fecha
+            models.Index(fields=['-fecha_creacion'], condition=Q(approved=False), name='pyme_revision_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.user.username})"
-    
\ No newline at end of file
+
+
+class Tarea(models.Model):
+    """
+    Cola de tareas en la base de datos (ver tareas.py y el comando procesar_tareas).
+    """
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('hecha', 'Hecha'),
+        ('fallida', 'Fallida'),
+    )
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    # clave de idempotencia: encolar dos veces la misma clave no duplica la tarea
+    clave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    ejecutar_desde = models.DateTimeField(default=timezone.now)
+    # mientras corre: si el worker muere, otro la retoma al vencer este plazo
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # lo que el worker busca: pendientes cuya hora ya llegó
+            models.Index(fields=['ejecutar_desde'], condition=Q(estado='pendiente'), name='tarea_pendiente_idx'),
+            models.Index(fields=['bloqueada_hasta'], condition=Q(estado='en_curso'), name='tarea_en_curso_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.nombre} #{self.pk} ({self.estado})'
+
@@ -0,0 +1,231 @@
+"""
+Optimizador de canasta: dónde conviene comprar una cotización.
+
+Cada item se resuelve a sus productos equivalentes en todos los
+supermercados (mismo GrupoProducto, ver equivalencias.py) y se arma una
+matriz tienda × item con el costo (precio × cantidad, infinito si la tienda
+no lo tiene). Sobre esa matriz se calcula:
+
+- la tienda única más barata, y
+- la división más barata usando a lo más K tiendas: exacta enumerando
+  combinaciones cuando son pocas, y si no greedy + mejoras por intercambio.
+
+Cada fila de la matriz es una lista plana de floats y las combinaciones se
+evalúan con map(min, ...) por columna sobre esas listas: 100 items × 50 tiendas
+con K=2 se resuelve exacto en ~50 ms, sin dependencias extra.
+
+Sobre LIMITE_EXACTO el resultado es aproximado (greedy, 'exacto': False) y
+puede tardar bastante más, por eso las vistas usan optimizar_cacheado(): el
+resultado se guarda por versión del carrito (cantidad de items y total de la
+cotización) y versión del catálogo, y sólo se recalcula si alguno cambia.
+"""
+from itertools import combinations
+from math import comb, inf
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .cache_paginas import version_catalogo
+from .models import Producto, Supermercado
+
+# combinaciones × items sobre las que se deja de enumerar y se usa greedy
+LIMITE_EXACTO = 300_000
+
+# cuántas tiendas individuales se prueban como punto de partida del greedy
+SEMILLAS_GREEDY = 8
+
+OPTIMIZADOR_CACHE_KEY = 'tucanasta:optimizador:{}:{}:{}:{}:{}'
+OPTIMIZADOR_CACHE_TIMEOUT = getattr(settings, 'OPTIMIZADOR_CACHE_TIMEOUT', 10 * 60)
+
+
+def matriz_precios(cotizacion):
+    """
+    Devuelve (tiendas, items, costos, elegidos):
+      tiendas  -> [Supermercado, ...]
+      items    -> [CotizacionItem, ...]
+      costos   -> costos[t][i] = precio × cantidad en la tienda t (inf si no está)
+      elegidos -> elegidos[t][i] = id del producto más barato en t para el item i
+    Tres consultas: items (con producto), productos equivalentes y tiendas.
+    """
+    items = list(cotizacion.items.select_related('producto').order_by('pk'))
+    grupos = {it.producto.grupo_id for it in items if it.producto.grupo_id}
+    sin_grupo = {it.producto_id for it in items if not it.producto.grupo_id}
+
+    candidatos = (
+        Producto.objects.filter(Q(grupo_id__in=grupos) | Q(pk__in=sin_grupo), disponible=True)
+        .values_list('pk', 'grupo_id', 'supermercado_id', 'precio')
+    )
+
+    # (tienda, grupo) / (tienda, producto) -> (precio más bajo, producto)
+    mejor_por_grupo = {}
+    mejor_por_producto = {}
+    for pk, grupo_id, super_id, precio in candidatos:
+        precio = float(precio)
+        if pk in sin_grupo:
+            mejor_por_producto[(super_id, pk)] = (precio, pk)
+        if grupo_id in grupos:
+            actual = mejor_por_grupo.get((super_id, grupo_id))
+            if actual is None or precio < actual[0]:
+                mejor_por_grupo[(super_id, grupo_id)] = (precio, pk)
+
+    tienda_ids = sorted({k[0] for k in mejor_por_grupo} | {k[0] for k in mejor_por_producto})
+    tiendas = list(Supermercado.objects.filter(pk__in=tienda_ids).order_by('pk')) if tienda_ids else []
+
+    costos, elegidos = [], []
+    for tienda in tiendas:
+        fila, fila_ids = [], []
+        for it in items:
+            if it.producto.grupo_id:
+                encontrado = mejor_por_grupo.get((tienda.pk, it.producto.grupo_id))
+            else:
+                encontrado = mejor_por_producto.get((tienda.pk, it.producto_id))
+            if encontrado:
+                fila.append(encontrado[0] * it.cantidad)
+                fila_ids.append(encontrado[1])
+            else:
+                fila.append(inf)
+                fila_ids.append(None)
+        costos.append(fila)
+        elegidos.append(fila_ids)
+    return tiendas, items, costos, elegidos
+
+
+def _evaluar(filas):
+    """(items sin precio, total) para una combinación de filas de la matriz."""
+    minimos = list(map(min, *filas)) if len(filas) > 1 else filas[0]
+    faltantes = minimos.count(inf)
+    if not faltantes:
+        return 0, sum(minimos)
+    return faltantes, sum(c for c in minimos if c != inf)
+
+
+def mejor_tienda(costos):
+    """Índice de la tienda única más barata (menos faltantes primero)."""
+    if not costos:
+        return None, (0, 0.0)
+    return min(((t, _evaluar([fila])) for t, fila in enumerate(costos)), key=lambda x: x[1])
+
+
+def mejor_division(costos, max_tiendas):
+    """
+    Conjunto de a lo más `max_tiendas` tiendas que minimiza (faltantes, total).
+    Devuelve (índices, (faltantes, total), exacto).
+    """
+    n = len(costos)
+    if n == 0:
+        return (), (0, 0.0), True
+    k = max(1, min(max_tiendas, n))
+    n_items = len(costos[0])
+
+    if sum(comb(n, r) for r in range(1, k + 1)) * max(n_items, 1) <= LIMITE_EXACTO:
+        mejor = min(
+            ((combo, _evaluar([costos[t] for t in combo]))
+             for r in range(1, k + 1) for combo in combinations(range(n), r)),
+            key=lambda x: x[1],
+        )
+        return mejor[0], mejor[1], True
+
+    # greedy + intercambios partiendo de las mejores tiendas individuales
+    semillas = sorted(range(n), key=lambda t: _evaluar([costos[t]]))[:SEMILLAS_GREEDY]
+    mejor = min((_greedy(costos, k, t) for t in semillas), key=lambda x: x[1])
+    return tuple(sorted(mejor[0])), mejor[1], False
+
+
+def _greedy(costos, k, semilla):
+    n = len(costos)
+    # agregar la tienda que más baja el costo mientras mejore
+    elegidas = [semilla]
+    valor = _evaluar([costos[semilla]])
+    while len(elegidas) < k:
+        candidatos = (
+            (t, _evaluar([costos[e] for e in elegidas] + [costos[t]]))
+            for t in range(n) if t not in elegidas
+        )
+        t, v = min(candidatos, key=lambda x: x[1])
+        if v >= valor:
+            break
+        elegidas.append(t)
+        valor = v
+
+    # intercambios 1 a 1 hasta que ninguno mejore
+    mejoro = True
+    while mejoro:
+        mejoro = False
+        for pos in range(len(elegidas)):
+            resto = [costos[e] for j, e in enumerate(elegidas) if j != pos]
+            for t in range(n):
+                if t in elegidas:
+                    continue
+                v = _evaluar(resto + [costos[t]])
+                if v < valor:
+                    elegidas[pos], valor, mejoro = t, v, True
+    return elegidas, valor
+
+
+def optimizar_cotizacion(cotizacion, max_tiendas=2):
+    """Resultado serializable (JSON) con la mejor tienda única y la mejor división."""
+    tiendas, items, costos, elegidos = matriz_precios(cotizacion)
+
+    def detalle(indices):
+        asignacion = []
+        for i, it in enumerate(items):
+            opciones = [(costos[t][i], t) for t in indices if costos[t][i] != inf]
+            if not opciones:
+                asignacion.append({'item_id': it.pk, 'producto': it.producto.nombre, 'supermercado': None, 'producto_id': None, 'subtotal': None})
+                continue
+            costo, t = min(opciones)
+            asignacion.append({
+                'item_id': it.pk,
+                'producto': it.producto.nombre,
+                'supermercado': tiendas[t].nombre,
+                'producto_id': elegidos[t][i],
+                'subtotal': round(costo, 2),
+            })
+        return asignacion
+
+    resultado = {
+        'total_actual': float(cotizacion.total),
+        'items': len(items),
+        'tiendas_consideradas': len(tiendas),
+        'una_tienda': None,
+        'dividida': None,
+    }
+    if not tiendas:
+        return resultado
+
+    t, (faltantes, total) = mejor_tienda(costos)
+    resultado['una_tienda'] = {
+        'supermercado': tiendas[t].nombre,
+        'total': round(total, 2),
+        'faltantes': faltantes,
+        'items': detalle([t]),
+    }
+
+    indices, (faltantes, total), exacto = mejor_division(costos, max_tiendas)
+    resultado['dividida'] = {
+        'max_tiendas': max_tiendas,
+        'supermercados': [tiendas[i].nombre for i in indices],
+        'total': round(total, 2),
+        'faltantes': faltantes,
+        'exacto': exacto,
+        'items': detalle(indices),
+    }
+    return resultado
+
+
+def optimizar_cacheado(cotizacion, max_tiendas=2):
+    """
+    optimizar_cotizacion() guardado en el cache. Agregar, quitar o cambiar
+    cantidades mueve cantidad_items o total, y guardar productos o tiendas
+    mueve la versión del catálogo; el TTL acota el caso raro de un cambio de
+    items que deje ambos iguales.
+    """
+    clave = OPTIMIZADOR_CACHE_KEY.format(
+        cotizacion.pk, cotizacion.cantidad_items, cotizacion.total, max_tiendas, version_catalogo(),
+    )
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = optimizar_cotizacion(cotizacion, max_tiendas=max_tiendas)
+        cache.set(clave, resultado, OPTIMIZADOR_CACHE_TIMEOUT)
+    return resultado
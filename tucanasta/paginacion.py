@@ -0,0 +1,185 @@
+"""
+Paginación por cursor (keyset) para listados de productos.
+
+En vez de OFFSET, cada página pide "los que vienen después de la última fila
+vista" según el orden activo, así la página 200 cuesta lo mismo que la 1 y
+no se cargan miles de productos por request. El cursor es la tupla de
+valores de orden de la última fila, en JSON base64 para la URL.
+"""
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, NullIf
+
+from .catalogo import PLACEHOLDER_IMG
+from .imagenes import proxy_filas
+from .models import UNIDAD_PRECIO
+
+# ordenar (GET) -> campos de orden; 'pk' al final desempata para que el cursor sea único
+ORDENES = {
+    'precio_asc': ('precio', 'pk'),
+    'precio_desc': ('-precio', '-pk'),
+    'nombre_asc': ('nombre', 'pk'),
+    'precio_unidad_asc': ('precio_por_unidad', 'pk'),  # $/kg, $/L o $/u; sin contenido al final
+    None: ('tipo', 'supermercado_id', 'precio', 'pk'),  # Meta.ordering de Producto
+}
+
+# campos de orden que pueden ser NULL: van al final en ambos sentidos
+NULABLES = {'precio_por_unidad'}
+
+POR_PAGINA = 48
+
+# columnas que necesitan las tarjetas de producto (HTML y JSON); incluye
+# todas las de ORDENES para poder armar el cursor desde la última fila
+CAMPOS_TARJETA = (
+    'id', 'nombre', 'marca', 'precio', 'producto_url', 'tipo', 'supermercado_id', 'precio_por_unidad',
+)
+_CLAVE_FILA = {'pk': 'id'}
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def orden(ordenar):
+    return ORDENES.get(ordenar, ORDENES[None])
+
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat()  # el ORM lo vuelve a parsear al filtrar
+    return valor
+
+
+def codificar_cursor(valores):
+    texto = json.dumps([_valor_json(v) for v in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _decimal(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (str, int)):
+        raise ValueError
+    valor = Decimal(valor)
+    if not valor.is_finite():
+        raise ValueError
+    return valor
+
+
+def _entero(valor):
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ValueError
+    return valor
+
+
+def _texto(valor):
+    if not isinstance(valor, str):
+        raise ValueError
+    return valor
+
+
+def _fecha(valor):
+    return datetime.datetime.fromisoformat(_texto(valor))
+
+
+# campo de orden -> conversión del valor del cursor (ValueError si no calza)
+TIPOS_CURSOR = {
+    'pk': _entero,
+    'supermercado_id': _entero,
+    'precio': _decimal,
+    'precio_por_unidad': _decimal,
+    'nombre': _texto,
+    'tipo': _texto,
+    'fecha_actualizacion': _fecha,
+    'fecha_creacion': _fecha,
+}
+
+
+def decodificar_cursor(cursor, campos):
+    """Valores del cursor ya convertidos al tipo de cada campo; CursorInvalido si no calzan."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise CursorInvalido('cursor inválido')
+    if not isinstance(valores, list) or len(valores) != len(campos):
+        raise CursorInvalido('cursor inválido')
+    convertidos = []
+    for campo, valor in zip(campos, valores):
+        nombre = campo.lstrip('-')
+        if valor is None and nombre in NULABLES:
+            convertidos.append(None)
+            continue
+        try:
+            convertidos.append(TIPOS_CURSOR[nombre](valor))
+        except (ArithmeticError, TypeError, ValueError):
+            raise CursorInvalido('cursor inválido')
+    return convertidos
+
+
+def despues_de(campos, valores):
+    """
+    Q de "fila siguiente" en orden lexicográfico:
+    (a > va) OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc) ...
+    con < en los campos descendentes. En los NULABLES los NULL van al final:
+    después de un valor vienen también los NULL, y después de un NULL sólo
+    otros NULL (los desempata el campo siguiente).
+    """
+    filtro = Q()
+    iguales = {}
+    for campo, valor in zip(campos, valores):
+        nombre = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        if valor is None and nombre in NULABLES:
+            iguales[f'{nombre}__isnull'] = True
+            continue
+        siguiente = Q(**{f'{nombre}__{operador}': valor})
+        if nombre in NULABLES:
+            siguiente |= Q(**{f'{nombre}__isnull': True})
+        filtro |= Q(**iguales) & siguiente
+        iguales[nombre] = valor
+    return filtro
+
+
+def _ordenar(campo):
+    nombre = campo.lstrip('-')
+    if nombre not in NULABLES:
+        return campo
+    return F(nombre).desc(nulls_last=True) if campo.startswith('-') else F(nombre).asc(nulls_last=True)
+
+
+def tarjetas(productos):
+    """
+    .values() con lo justo para pintar una tarjeta. El placeholder de imagen
+    y la unidad del precio por unidad ('g' -> 'kg') los resuelve la base de datos.
+    """
+    return productos.values(
+        *CAMPOS_TARJETA,
+        imagen=Coalesce(NullIf('imagen_url', Value('')), Value(PLACEHOLDER_IMG)),
+        tienda=F('supermercado__nombre'),
+        unidad_precio=Case(*[When(unidad=u, then=Value(p)) for u, p in UNIDAD_PRECIO.items()], default=Value('')),
+    )
+
+
+def pagina(productos, ordenar=None, cursor=None, por_pagina=POR_PAGINA):
+    """
+    Devuelve (filas, siguiente_cursor) del queryset `productos` (sin ordenar)
+    según `ordenar`. siguiente_cursor es None en la última página.
+    Lanza CursorInvalido si el cursor no corresponde al orden.
+    """
+    campos = orden(ordenar)
+    qs = productos.order_by(*map(_ordenar, campos))
+    if cursor:
+        qs = qs.filter(despues_de(campos, decodificar_cursor(cursor, campos)))
+
+    filas = list(tarjetas(qs)[:por_pagina + 1])
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        ultima = filas[-1]
+        siguiente = codificar_cursor([ultima[_CLAVE_FILA.get(c.lstrip('-'), c.lstrip('-'))] for c in campos])
+    return proxy_filas(filas), siguiente
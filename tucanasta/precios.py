@@ -0,0 +1,118 @@
+"""
+Historial de precios de productos.
+
+Se guarda una fila (producto, día, precio) sólo cuando el precio cambia
+respecto del último día registrado; el precio vigente en una fecha es el de
+la última fila anterior o igual a esa fecha (función escalón).
+"""
+import datetime
+from itertools import groupby
+
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import HistorialPrecio, Producto
+
+
+def registrar_precios(productos, dia=None, lote=1000):
+    """
+    Registra el precio actual de los productos del queryset `productos` que
+    cambiaron respecto del último día anterior a `dia` (hoy por defecto).
+    Todo set-based: un SELECT de los que cambiaron, INSERT ... ON CONFLICT
+    para ellos y un DELETE de las filas de hoy que volvieron al precio previo.
+    Devuelve la cantidad de filas escritas.
+    """
+    dia = dia or timezone.localdate()
+    anterior = (
+        HistorialPrecio.objects
+        .filter(producto=OuterRef('pk'), dia__lt=dia)
+        .order_by('-dia')
+        .values('precio')[:1]
+    )
+    del_dia = HistorialPrecio.objects.filter(producto=OuterRef('pk'), dia=dia).values('precio')[:1]
+    con_anterior = productos.order_by().annotate(
+        precio_anterior=Subquery(anterior),
+        precio_del_dia=Subquery(del_dia),
+    )
+
+    cambiados = con_anterior.filter(
+        Q(precio_anterior__isnull=True) | ~Q(precio_anterior=F('precio')),
+        Q(precio_del_dia__isnull=True) | ~Q(precio_del_dia=F('precio')),
+    ).values_list('pk', 'precio')
+
+    filas = [HistorialPrecio(producto_id=pk, dia=dia, precio=precio) for pk, precio in cambiados]
+    HistorialPrecio.objects.bulk_create(
+        filas,
+        update_conflicts=True,
+        unique_fields=['producto', 'dia'],
+        update_fields=['precio'],
+        batch_size=lote,
+    )
+
+    # cambió y volvió al precio anterior en el mismo día: la fila de hoy sobra
+    HistorialPrecio.objects.filter(
+        dia=dia,
+        producto__in=con_anterior.filter(precio_anterior=F('precio')).values('pk'),
+    ).delete()
+    return len(filas)
+
+
+def serie_precios(producto_id, desde, hasta=None):
+    """
+    [(dia, precio), ...] entre `desde` y `hasta` (inclusive), partiendo con el
+    precio vigente en `desde` para que la serie no empiece vacía.
+    """
+    hasta = hasta or timezone.localdate()
+    historial = HistorialPrecio.objects.filter(producto_id=producto_id)
+    inicial = historial.filter(dia__lt=desde).order_by('-dia').values_list('precio', flat=True).first()
+    puntos = list(
+        historial.filter(dia__range=(desde, hasta)).order_by('dia').values_list('dia', 'precio')
+    )
+    if inicial is not None and (not puntos or puntos[0][0] != desde):
+        puntos.insert(0, (desde, inicial))
+    return puntos
+
+
+def compactar_historial(dias_diarios=180, dias_retencion=365 * 5, hoy=None, lote=1000, productos_por_lote=100):
+    """
+    - Más antiguo que `dias_retencion`: se borra, salvo la última fila de cada
+      producto antes del corte (sigue siendo el precio vigente en esa fecha).
+    - Entre `dias_diarios` y `dias_retencion`: se deja una fila por semana
+      ISO (la última, que es el precio vigente al cerrar la semana).
+    Recorre de a `productos_por_lote` productos (por producto_id), así la
+    memoria no crece con el tamaño del historial.
+    Devuelve la cantidad de filas borradas.
+    """
+    hoy = hoy or timezone.localdate()
+    corte_diario = hoy - datetime.timedelta(days=dias_diarios)
+    corte_retencion = hoy - datetime.timedelta(days=dias_retencion)
+    viejas = HistorialPrecio.objects.filter(dia__lt=corte_diario)
+
+    borrados = 0
+    ultimo = 0
+    while True:
+        productos = list(
+            viejas.filter(producto_id__gt=ultimo).order_by('producto_id')
+            .values_list('producto_id', flat=True).distinct()[:productos_por_lote]
+        )
+        if not productos:
+            return borrados
+        ultimo = productos[-1]
+        # se leen enteras antes de borrar: SQLite no aísla un cursor abierto de los DELETE
+        filas = list(
+            viejas.filter(producto_id__in=productos).order_by('producto_id', 'dia').values_list('pk', 'producto_id', 'dia')
+        )
+        borrar = []
+        for _, filas_producto in groupby(filas, key=lambda f: f[1]):
+            filas_producto = list(filas_producto)
+            antiguas = [f for f in filas_producto if f[2] < corte_retencion]
+            borrar.extend(f[0] for f in antiguas[:-1])
+            recientes = [f for f in filas_producto if f[2] >= corte_retencion]
+            for _, semana in groupby(recientes, key=lambda f: f[2].isocalendar()[:2]):
+                borrar.extend(f[0] for f in list(semana)[:-1])
+        for i in range(0, len(borrar), lote):
+            borrados += HistorialPrecio.objects.filter(pk__in=borrar[i:i + lote]).delete()[0]
+
+
+def registrar_precio_producto(producto):
+    return registrar_precios(Producto.objects.filter(pk=producto.pk))
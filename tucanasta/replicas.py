@@ -0,0 +1,105 @@
+"""
+Lecturas del catálogo en una réplica.
+
+Con un alias 'replica' en DATABASES (ver settings), RouterReplica manda las
+lecturas de Producto, Supermercado, GrupoProducto e HistorialPrecio a la
+réplica; el resto (carrito, pymes, usuarios, sesiones) y todas las
+escrituras van al primario.
+
+Se lee del primario, aunque sea catálogo:
+- dentro de una transacción del primario (leer lo que se acaba de escribir),
+- dentro de `leer_de_primario()`,
+- en requests que escriben (POST/PUT/PATCH/DELETE) y durante
+  REPLICA_PRIMARIO_SEGUNDOS después, en el mismo navegador
+  (PrimarioTrasEscrituraMiddleware), para que quien crea o aprueba un
+  producto lo vea aunque la réplica venga atrasada.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+PRIMARIO = 'default'
+
+# modelos de tucanasta que se pueden leer de la réplica
+MODELOS_CATALOGO = frozenset({'producto', 'supermercado', 'grupoproducto', 'historialprecio'})
+
+COOKIE_PRIMARIO = 'leer_primario'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_en_primario = ContextVar('tucanasta_leer_de_primario', default=False)
+
+
+def hay_replica():
+    return REPLICA in connections.databases
+
+
+@contextmanager
+def leer_de_primario():
+    token = _en_primario.set(True)
+    try:
+        yield
+    finally:
+        _en_primario.reset(token)
+
+
+class RouterReplica:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'tucanasta' or model._meta.model_name not in MODELOS_CATALOGO:
+            return PRIMARIO
+        if _en_primario.get() or connections[PRIMARIO].in_atomic_block:
+            return PRIMARIO
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARIO
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # primario y réplica tienen los mismos datos
+        return {obj1._state.db, obj2._state.db} <= {PRIMARIO, REPLICA}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # la réplica recibe el esquema por replicación (o sincronizar_replica)
+        return db != REPLICA
+
+
+class PrimarioTrasEscrituraMiddleware:
+    # sirve también a vistas async sin forzar el paso por un hilo
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _fijar_primario(self, request):
+        return hay_replica() and (request.method not in METODOS_SEGUROS or COOKIE_PRIMARIO in request.COOKIES)
+
+    def _recordar_escritura(self, request, response):
+        if request.method not in METODOS_SEGUROS:
+            response.set_cookie(
+                COOKIE_PRIMARIO, '1', max_age=settings.REPLICA_PRIMARIO_SEGUNDOS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._fijar_primario(request):
+            return self.get_response(request)
+        with leer_de_primario():
+            response = self.get_response(request)
+        return self._recordar_escritura(request, response)
+
+    async def __acall__(self, request):
+        if not self._fijar_primario(request):
+            return await self.get_response(request)
+        with leer_de_primario():
+            response = await self.get_response(request)
+        return self._recordar_escritura(request, response)
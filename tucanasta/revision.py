@@ -0,0 +1,122 @@
+"""
+Cola de revisión del panel de administración (productos y pymes pendientes).
+
+- Las colas se paginan por cursor (ver paginacion.py), más recientes primero,
+  así el panel no carga miles de envíos de una vez.
+- Aprobar/rechazar en lote es una sola sentencia `... WHERE id IN (...)`.
+  El UPDATE no dispara señales, por eso la invalidación del catálogo (cache
+  de metadatos y páginas) se agenda a mano al confirmar. El índice FTS no
+  necesita nada: la búsqueda filtra `disponible` al consultar.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.urls import reverse
+from django.utils import timezone
+
+from . import tareas
+from .catalogo import PLACEHOLDER_IMG, invalidar_catalogo
+from .documentos import documentos_storage, nombre_miniatura
+from .models import Producto, Pyme
+from .paginacion import codificar_cursor, decodificar_cursor, despues_de
+
+POR_PAGINA_REVISION = 50
+MAX_LOTE = 500  # ids por aprobación/rechazo en lote
+
+ORDEN_PRODUCTOS = ('-fecha_actualizacion', '-pk')
+ORDEN_PYMES = ('-fecha_creacion', '-pk')
+
+
+def _pagina(qs, campos, cursor, por_pagina):
+    qs = qs.order_by(*campos)
+    if cursor:
+        qs = qs.filter(despues_de(campos, decodificar_cursor(cursor, campos)))
+    filas = list(qs[:por_pagina + 1])
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        ultima = filas[-1]
+        siguiente = codificar_cursor([ultima['id' if c.lstrip('-') == 'pk' else c.lstrip('-')] for c in campos])
+    return filas, siguiente
+
+
+def cola_productos(cursor=None, por_pagina=POR_PAGINA_REVISION):
+    """(filas, siguiente) de productos pendientes (disponible=False)."""
+    qs = Producto.objects.filter(disponible=False).values(
+        'id', 'nombre', 'marca', 'tipo', 'precio', 'moneda', 'producto_url', 'fecha_actualizacion',
+        imagen=Coalesce(NullIf('imagen_url', Value('')), Value(PLACEHOLDER_IMG)),
+        tienda=F('supermercado__nombre'),
+    )
+    return _pagina(qs, ORDEN_PRODUCTOS, cursor, por_pagina)
+
+
+def cola_pymes(cursor=None, por_pagina=POR_PAGINA_REVISION):
+    """(filas, siguiente) de pymes sin aprobar."""
+    qs = Pyme.objects.filter(approved=False).values(
+        'id', 'nombre', 'direccion', 'web', 'documento', 'fecha_creacion',
+        usuario=F('user__username'), email=F('user__email'),
+    )
+    filas, siguiente = _pagina(qs, ORDEN_PYMES, cursor, por_pagina)
+    for fila in filas:
+        nombre = fila['documento']
+        fila['documento'] = reverse('documento_pyme', args=[fila['id']]) if nombre else None
+        # la miniatura la genera la tarea procesar_documento_pyme (sólo imágenes)
+        fila['miniatura'] = (
+            f"{fila['documento']}?miniatura=1"
+            if nombre and documentos_storage.exists(nombre_miniatura(nombre)) else None
+        )
+    return filas, siguiente
+
+
+def aprobar_productos(ids):
+    """Publica los productos pendientes de `ids`. Devuelve cuántos cambiaron."""
+    with transaction.atomic():
+        n = Producto.objects.filter(pk__in=ids, disponible=False).update(
+            disponible=True, fecha_actualizacion=timezone.now(),
+        )
+        if n:
+            transaction.on_commit(invalidar_catalogo)
+            # productos nuevos en el catálogo: reagrupar equivalencias una vez por minuto a lo más
+            tareas.encolar(
+                'agrupar_catalogo', clave=f"agrupar:{timezone.now():%Y%m%d%H%M}",
+                ejecutar_en=timezone.now() + timedelta(minutes=1),
+            )
+    return n
+
+
+def rechazar_productos(ids):
+    """Elimina los productos pendientes de `ids`. Devuelve cuántos se borraron."""
+    with transaction.atomic():
+        # post_delete de Producto ya agenda la invalidación del catálogo
+        _, por_modelo = Producto.objects.filter(pk__in=ids, disponible=False).delete()
+    return por_modelo.get(Producto._meta.label, 0)
+
+
+def aprobar_pymes(ids):
+    with transaction.atomic():
+        pendientes = list(Pyme.objects.filter(pk__in=ids, approved=False).values_list('pk', flat=True))
+        n = Pyme.objects.filter(pk__in=pendientes).update(approved=True)
+        # el correo de aviso sale del worker (tareas.py), no de la request
+        for pk in pendientes:
+            tareas.encolar('notificar_pyme_aprobada', clave=f'pyme-aprobada:{pk}', pyme_id=pk)
+    return n
+
+
+def rechazar_pymes(ids):
+    _, por_modelo = Pyme.objects.filter(pk__in=ids, approved=False).delete()
+    return por_modelo.get(Pyme._meta.label, 0)
+
+
+ACCIONES = {
+    ('productos', 'aprobar'): aprobar_productos,
+    ('productos', 'rechazar'): rechazar_productos,
+    ('pymes', 'aprobar'): aprobar_pymes,
+    ('pymes', 'rechazar'): rechazar_pymes,
+}
+
+COLAS = {
+    'productos': cola_productos,
+    'pymes': cola_pymes,
+}
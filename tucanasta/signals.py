@@ -0,0 +1,84 @@
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .busqueda import asegurar_indice_fts
+from .carrito import invalidar_resumen, invalidar_resumen_de_productos
+from .catalogo import invalidar_catalogo
+from .models import Cotizacion, CotizacionItem, Producto, Supermercado
+from .precios import registrar_precio_producto
+
+
+# --- totales denormalizados de Cotizacion ---
+
+@receiver(post_save, sender=CotizacionItem)
+@receiver(post_delete, sender=CotizacionItem)
+def actualizar_totales_cotizacion(sender, instance, **kwargs):
+    # corre dentro de la misma transacción que guardó/eliminó el item
+    Cotizacion.recalcular_totales(instance.cotizacion_id)
+
+
+# --- cache del mini-carrito ---
+
+@receiver(post_save, sender=Cotizacion)
+@receiver(post_delete, sender=Cotizacion)
+def invalidar_cache_carrito(sender, instance, **kwargs):
+    # guardar, reabrir o eliminar cotizaciones (y el admin de Django)
+    invalidar_resumen(instance.usuario_id)
+
+
+@receiver(post_save, sender=CotizacionItem)
+@receiver(post_delete, sender=CotizacionItem)
+def invalidar_cache_carrito_item(sender, instance, **kwargs):
+    usuario_id = Cotizacion.objects.filter(pk=instance.cotizacion_id).values_list('usuario_id', flat=True).first()
+    if usuario_id is not None:
+        invalidar_resumen(usuario_id)
+
+
+@receiver(post_save, sender=Producto)
+def invalidar_cache_carrito_producto(sender, instance, created=False, update_fields=None, **kwargs):
+    # el resumen guarda nombre, imagen y tienda; borrar un producto borra sus
+    # items en cascada y eso ya lo cubre invalidar_cache_carrito_item
+    if created or (update_fields is not None and not {'nombre', 'imagen_url', 'supermercado'} & set(update_fields)):
+        return
+    invalidar_resumen_de_productos(pk=instance.pk)
+
+
+@receiver(post_save, sender=Supermercado)
+def invalidar_cache_carrito_supermercado(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidar_resumen_de_productos(supermercado_id=instance.pk)
+
+
+# --- cache de metadatos del catálogo ---
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Supermercado)
+@receiver(post_delete, sender=Supermercado)
+def invalidar_cache_catalogo(sender, **kwargs):
+    # al confirmar: así ninguna request vuelve a cachear datos sin commitear
+    transaction.on_commit(invalidar_catalogo)
+
+
+# --- historial de precios ---
+
+@receiver(post_save, sender=Producto)
+def registrar_historial_precio(sender, instance, update_fields=None, **kwargs):
+    # formularios pyme, editar_producto_admin, admin de Django...
+    if update_fields is not None and 'precio' not in update_fields:
+        return
+    registrar_precio_producto(instance)
+
+
+# --- índice de búsqueda ---
+
+@receiver(post_migrate)
+def asegurar_busqueda(sender, app_config=None, using='default', **kwargs):
+    # una migración que reconstruye tucanasta_producto en SQLite borra los triggers FTS
+    if app_config is None or app_config.label != 'tucanasta':
+        return
+    conn = connections[using]
+    if ('tucanasta', '0006_producto_fts') in MigrationRecorder(conn).applied_migrations():
+        asegurar_indice_fts(conn)
@@ -0,0 +1,185 @@
+"""
+Cola de tareas en segundo plano guardada en la base de datos.
+
+Para efectos lentos que no deben bloquear la request: correos, revisión de
+documentos subidos, reagrupar el catálogo. (El índice de búsqueda no pasa
+por aquí: lo mantienen los triggers FTS5 y, tras migraciones, post_migrate.)
+
+    encolar('notificar_pyme_aprobada', clave=f'pyme-aprobada:{pk}', pyme_id=pk)
+
+- La tarea se inserta en la misma transacción que el cambio que la origina:
+  si la request hace rollback, la tarea tampoco existe.
+- `clave` es de idempotencia: una segunda llamada con la misma clave no crea
+  otra tarea (p.ej. no se manda dos veces el mismo correo).
+- El worker (`python manage.py procesar_tareas`, o procesar_pendientes()
+  en el mismo proceso) toma cada tarea con un UPDATE condicional, así varios
+  workers no ejecutan la misma. Si falla se reintenta con backoff exponencial
+  hasta max_intentos; si el worker muere, la tarea se retoma al vencer
+  bloqueada_hasta.
+"""
+import hashlib
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import documentos, equivalencias
+from .models import Pyme, Tarea, Usuario
+
+logger = logging.getLogger(__name__)
+
+TAREAS = {}
+
+BACKOFF_BASE = 30       # segundos antes del primer reintento (luego x2, x4...)
+BACKOFF_MAXIMO = 60 * 60
+DURACION_BLOQUEO = timedelta(minutes=10)
+
+
+def tarea(nombre):
+    """Registra `funcion(**argumentos)` como tarea encolable bajo `nombre`."""
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(nombre, clave=None, ejecutar_en=None, max_intentos=5, **argumentos):
+    """
+    Crea la tarea (o devuelve la existente si `clave` ya fue encolada).
+    `argumentos` debe ser serializable a JSON.
+    """
+    if nombre not in TAREAS:
+        raise ValueError(f'tarea desconocida: {nombre}')
+    datos = {
+        'nombre': nombre,
+        'argumentos': argumentos,
+        'max_intentos': max_intentos,
+        'ejecutar_desde': ejecutar_en or timezone.now(),
+    }
+    if clave is None:
+        return Tarea.objects.create(**datos)
+    try:
+        with transaction.atomic():
+            return Tarea.objects.get_or_create(clave=clave, defaults=datos)[0]
+    except IntegrityError:
+        # otra request la encoló entre el get y el create
+        return Tarea.objects.get(clave=clave)
+
+
+def _listas():
+    ahora = timezone.now()
+    return Tarea.objects.filter(
+        Q(estado='pendiente', ejecutar_desde__lte=ahora)
+        | Q(estado='en_curso', bloqueada_hasta__lt=ahora)
+    )
+
+
+def tomar_siguiente():
+    """Reserva la próxima tarea lista y la devuelve, o None si no hay."""
+    while True:
+        candidata = _listas().order_by('ejecutar_desde', 'pk').values_list('pk', 'estado', 'bloqueada_hasta').first()
+        if candidata is None:
+            return None
+        pk, estado, bloqueada_hasta = candidata
+        # compare-and-set: sólo gana el worker que la ve todavía en el mismo estado
+        tomada = Tarea.objects.filter(pk=pk, estado=estado, bloqueada_hasta=bloqueada_hasta).update(
+            estado='en_curso',
+            intentos=F('intentos') + 1,
+            bloqueada_hasta=timezone.now() + DURACION_BLOQUEO,
+        )
+        if tomada:
+            return Tarea.objects.get(pk=pk)
+
+
+def ejecutar(t):
+    funcion = TAREAS.get(t.nombre)
+    try:
+        if funcion is None:
+            raise LookupError(f'tarea desconocida: {t.nombre}')
+        funcion(**t.argumentos)
+    except Exception:
+        t.ultimo_error = traceback.format_exc(limit=5)
+        if t.intentos >= t.max_intentos:
+            t.estado = 'fallida'
+            t.fecha_fin = timezone.now()
+            logger.error('Tarea %s falló definitivamente:\n%s', t, t.ultimo_error)
+        else:
+            t.estado = 'pendiente'
+            espera = min(BACKOFF_BASE * 2 ** (t.intentos - 1), BACKOFF_MAXIMO)
+            t.ejecutar_desde = timezone.now() + timedelta(seconds=espera)
+            logger.warning('Tarea %s falló (intento %s), reintento en %ss', t, t.intentos, espera)
+    else:
+        t.estado = 'hecha'
+        t.fecha_fin = timezone.now()
+        t.ultimo_error = ''
+    t.bloqueada_hasta = None
+    t.save(update_fields=['estado', 'fecha_fin', 'ultimo_error', 'ejecutar_desde', 'bloqueada_hasta'])
+    return t.estado == 'hecha'
+
+
+def procesar_pendientes(limite=None):
+    """Ejecuta tareas listas hasta vaciar la cola (o `limite`). Devuelve cuántas corrió."""
+    n = 0
+    while limite is None or n < limite:
+        t = tomar_siguiente()
+        if t is None:
+            break
+        ejecutar(t)
+        n += 1
+    return n
+
+
+# --- tareas ---
+
+@tarea('notificar_pyme_aprobada')
+def notificar_pyme_aprobada(pyme_id):
+    pyme = Pyme.objects.select_related('user').filter(pk=pyme_id, approved=True).first()
+    if pyme is None or not pyme.user.email:
+        return  # se rechazó o borró antes de que corriera la tarea
+    send_mail(
+        'Tu Pyme fue aprobada',
+        f'Hola {pyme.user.username}, "{pyme.nombre}" fue aprobada en Tus Canastas '
+        'y ya puedes publicar productos.',
+        settings.DEFAULT_FROM_EMAIL,
+        [pyme.user.email],
+    )
+
+
+@tarea('procesar_documento_pyme')
+def procesar_documento_pyme(pyme_id):
+    """Identifica el tipo real del documento, genera su miniatura y avisa al staff."""
+    pyme = Pyme.objects.filter(pk=pyme_id).first()
+    if pyme is None or not pyme.documento:
+        return
+    sha = hashlib.sha256()
+    tamano = 0
+    with pyme.documento.open('rb') as archivo:
+        cabecera = archivo.read(16)
+        for bloque in archivo.chunks():
+            sha.update(bloque)
+            tamano += len(bloque)
+    tipo, _ = documentos.tipo_documento(cabecera)
+    if tipo in ('png', 'jpg'):
+        documentos.generar_miniatura(pyme.documento.name)
+
+    destinatarios = list(
+        Usuario.objects.filter(is_staff=True, is_active=True).exclude(email='').values_list('email', flat=True)
+    )
+    if destinatarios:
+        send_mail(
+            f'Nueva Pyme pendiente: {pyme.nombre}',
+            f'Documento: {pyme.documento.name} ({tamano} bytes, '
+            f'tipo {tipo or "NO RECONOCIDO"}, sha256 {sha.hexdigest()}).',
+            settings.DEFAULT_FROM_EMAIL,
+            destinatarios,
+        )
+
+
+@tarea('agrupar_catalogo')
+def agrupar_catalogo():
+    equivalencias.agrupar_catalogo()
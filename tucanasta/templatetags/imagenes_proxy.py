@@ -0,0 +1,21 @@
+from django import template
+
+from tucanasta.catalogo import PLACEHOLDER_IMG
+from tucanasta.imagenes import url_proxy
+
+register = template.Library()
+
+
+@register.filter
+def imagen_proxy(producto):
+    """
+    {{ p|imagen_proxy }}: URL de la miniatura cacheada de un Producto o de un
+    dict con 'id' e 'imagen_url' (p.ej. los ítems del carrito).
+    """
+    if isinstance(producto, dict):
+        pk, url = producto.get('id'), producto.get('imagen_url')
+    else:
+        pk, url = getattr(producto, 'pk', None), getattr(producto, 'imagen_url', None)
+    if pk is None:
+        return url or PLACEHOLDER_IMG
+    return url_proxy(pk, url)
@@ -1,3 +1,1580 @@
-from django.test import TestCase
+from decimal import Decimal
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import busqueda, carrito, documentos, equivalencias, imagenes, importacion, metricas, optimizador, paginacion, precios, revision, tareas, views
+from .cache_paginas import invalidar_paginas
+from .catalogo import PLACEHOLDER_IMG, filtrar_por_tipo, metadatos_catalogo, ranking_productos_recientes, tipos_catalogo
+from .facetas import calcular_facetas
+from .forms import PymeProductForm
+from .models import Cotizacion, CotizacionItem, GrupoProducto, HistorialPrecio, Producto, Pyme, Supermercado, Tarea, Usuario
+from .replicas import PrimarioTrasEscrituraMiddleware, RouterReplica, leer_de_primario
+
+
+def crear_supermercado_con_productos(nombre, n=3, tipo='arroz', **extra):
+    s = Supermercado.objects.create(nombre=nombre)
+    for i in range(n):
+        Producto.objects.create(
+            nombre=f'{tipo.title()} {nombre} {i}',
+            tipo=tipo,
+            supermercado=s,
+            precio=Decimal('1000') + i,
+            **extra,
+        )
+    return s
+
+
+def crear_usuario(username='cliente', **extra):
+    n = Usuario.objects.count() + 1
+    return Usuario.objects.create_user(
+        username=username, password='clave-segura-123',
+        email=f'{username}@example.com', rut=f'1234567{n}-{n % 10}', **extra,
+    )
+
+
+class ComparadorViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_top_n_por_supermercado(self):
+        crear_supermercado_con_productos('Lider', n=12)
+        crear_supermercado_con_productos('Jumbo', n=2)
+        resp = self.client.get(reverse('comparador'))
+        self.assertEqual(resp.status_code, 200)
+        grupos = {g['supermercado'].nombre: g['productos'] for g in resp.context['data_supermercados']}
+        self.assertEqual(len(grupos['Lider']), 10)
+        self.assertEqual(len(grupos['Jumbo']), 2)
+
+    def test_no_muestra_no_disponibles(self):
+        crear_supermercado_con_productos('Unimarc', n=2, disponible=False)
+        resp = self.client.get(reverse('comparador'))
+        grupos = resp.context['data_supermercados']
+        self.assertEqual(grupos[0]['productos'], [])
+
+    def test_cantidad_de_queries_no_crece_con_supermercados(self):
+        crear_supermercado_con_productos('Lider', n=3)
+        crear_supermercado_con_productos('Jumbo', n=3)
+        with CaptureQueriesContext(connection) as pocos:
+            self.client.get(reverse('comparador'))
+
+        for i in range(8):
+            crear_supermercado_con_productos(f'Pyme {i}', n=3)
+        cache.clear()
+        with CaptureQueriesContext(connection) as muchos:
+            self.client.get(reverse('comparador'))
+
+        self.assertEqual(len(pocos), len(muchos))
+
+
+class CotizacionTotalesTests(TestCase):
+
+    def setUp(self):
+        self.user = crear_usuario()
+        self.client.force_login(self.user)
+        s = crear_supermercado_con_productos('Lider', n=2)
+        self.p1, self.p2 = s.productos.order_by('pk')
+
+    def test_total_se_mantiene_al_agregar_actualizar_y_eliminar(self):
+        url = reverse('agregar_cotizacion')
+        self.client.post(url, {'product_id': self.p1.pk, 'cantidad': 2})
+        resp = self.client.post(url, {'product_id': self.p2.pk}).json()
+        self.assertEqual(resp['total'], 2 * 1000 + 1001)
+        self.assertEqual(resp['count'], 2)
+
+        item = CotizacionItem.objects.get(producto=self.p1)
+        resp = self.client.post(reverse('actualizar_item'), {'item_id': item.pk, 'cantidad': 1}).json()
+        self.assertEqual(resp['total'], 1000 + 1001)
+
+        resp = self.client.post(reverse('eliminar_item'), {'item_id': item.pk}).json()
+        self.assertEqual(resp['total'], 1001)
+        self.assertEqual(resp['count'], 1)
+
+        cot = Cotizacion.objects.get(usuario=self.user)
+        self.assertEqual(cot.total, Decimal('1001'))
+        self.assertEqual(cot.cantidad_items, 1)
+
+    def test_comando_recalcula_drift(self):
+        self.client.post(reverse('agregar_cotizacion'), {'product_id': self.p1.pk, 'cantidad': 3})
+        Cotizacion.objects.update(total=0, cantidad_items=0)
+        call_command('recalcular_cotizaciones', stdout=StringIO())
+        cot = Cotizacion.objects.get(usuario=self.user)
+        self.assertEqual(cot.total, Decimal('3000'))
+        self.assertEqual(cot.cantidad_items, 1)
+
+    def test_recalcular_devuelve_totales(self):
+        cot = Cotizacion.objects.create(usuario=self.user)
+        vacia = Cotizacion.objects.create(usuario=self.user, status='saved')
+        CotizacionItem.objects.create(cotizacion=cot, producto=self.p1, cantidad=2, precio_unidad=Decimal('10.25'))
+        Cotizacion.objects.update(total=0, cantidad_items=0)
+        self.assertEqual(
+            Cotizacion.recalcular_totales(cot.pk, vacia.pk, devolver=True),
+            {cot.pk: (Decimal('20.50'), 1), vacia.pk: (Decimal('0.00'), 0)},
+        )
+        self.assertEqual(Cotizacion.objects.get(pk=cot.pk).total, Decimal('20.50'))
+        self.assertEqual(Cotizacion.recalcular_totales(), 2)
+
+
+class MiniCarritoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = crear_usuario()
+        self.client.force_login(self.user)
+        s = crear_supermercado_con_productos('Lider', n=2)
+        self.p1, self.p2 = s.productos.order_by('pk')
+
+    def _consultas_carrito(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse('comparador'))
+            self.assertEqual(resp.status_code, 200)
+        return resp, [q for q in ctx.captured_queries if 'cotizacionitem' in q['sql']]
+
+    def test_una_consulta_y_luego_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('agregar_cotizacion'), {'product_id': self.p1.pk, 'cantidad': 2})
+        resp, consultas = self._consultas_carrito()
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(resp.context['cotizacion']['total'], 2000.0)
+        self.assertEqual([it['cantidad'] for it in resp.context['cot_items']], [2])
+        self.assertContains(resp, 'Lider · $1000')
+
+        _, consultas = self._consultas_carrito()
+        self.assertEqual(consultas, [])
+
+    def test_mutaciones_invalidan(self):
+        self._consultas_carrito()  # cachea el carrito vacío
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post(reverse('agregar_cotizacion'), {'product_id': self.p2.pk}).json()
+        resp, _ = self._consultas_carrito()
+        self.assertEqual(len(resp.context['cot_items']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_item'), {'item_id': r['item_id']})
+        resp, _ = self._consultas_carrito()
+        self.assertEqual(len(resp.context['cot_items']), 0)
+        self.assertIsNone(resp.context['cotizacion'] or None)
+
+    def test_cambios_del_producto_invalidan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('agregar_cotizacion'), {'product_id': self.p1.pk})
+        self._consultas_carrito()  # cachea el resumen
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p1.nombre = 'Arroz renombrado'
+            self.p1.save()
+        resp, consultas = self._consultas_carrito()
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(resp.context['cot_items'][0]['producto']['nombre'], 'Arroz renombrado')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Supermercado.objects.filter(pk=self.p1.supermercado_id).get().save()
+        _, consultas = self._consultas_carrito()
+        self.assertEqual(len(consultas), 1)
+
+        # un producto que no está en ningún carrito no toca el cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p2.nombre = 'Otro'
+            self.p2.save()
+        _, consultas = self._consultas_carrito()
+        self.assertEqual(consultas, [])
+
+    def test_anonimo_no_consulta(self):
+        self.client.logout()
+        _, consultas = self._consultas_carrito()
+        self.assertEqual(consultas, [])
+
+
+class IndicesCatalogoTests(TestCase):
+    """Verifica con EXPLAIN QUERY PLAN que las consultas calientes usan índices (SQLite)."""
+
+    def plan(self, qs):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(fila[-1] for fila in cursor.fetchall())
+
+    def assertUsaIndice(self, qs, indice):
+        plan = self.plan(qs)
+        self.assertIn(f'INDEX {indice}', plan)
+
+    def test_categoria(self):
+        qs = filtrar_por_tipo(Producto.objects.filter(disponible=True), 'Arroz').order_by('precio')
+        self.assertUsaIndice(qs, 'producto_tipo_precio_disp_idx')
+
+    def test_comparador(self):
+        self.assertUsaIndice(ranking_productos_recientes(10), 'producto_super_fecha_disp_idx')
+
+    def test_cola_de_revision(self):
+        qs = Producto.objects.filter(disponible=False).order_by('-fecha_actualizacion')
+        self.assertUsaIndice(qs, 'producto_revision_fecha_idx')
+
+    def test_cotizacion_abierta(self):
+        plan = self.plan(Cotizacion.objects.filter(usuario_id=1, status='open'))
+        self.assertRegex(plan, r'SEARCH tucanasta_cotizacion USING (COVERING )?INDEX')
+
+    def test_una_sola_cotizacion_abierta_por_usuario(self):
+        user = crear_usuario()
+        Cotizacion.objects.create(usuario=user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cotizacion.objects.create(usuario=user)
+        Cotizacion.objects.create(usuario=user, status='saved')
+
+
+class PaginacionCategoriaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lider = crear_supermercado_con_productos('Lider', n=30, tipo='bebidas')
+        self.jumbo = crear_supermercado_con_productos('Jumbo', n=30, tipo='Bebidas', imagen_url='')
+
+    def _recorrer(self, ordenar, por_pagina=7):
+        qs = filtrar_por_tipo(Producto.objects.filter(disponible=True), 'bebidas')
+        vistos, cursor = [], None
+        while True:
+            filas, cursor = paginacion.pagina(qs, ordenar, cursor, por_pagina=por_pagina)
+            vistos.extend(f['id'] for f in filas)
+            if not cursor:
+                return vistos, qs
+
+    def test_cursor_recorre_todo_en_el_mismo_orden(self):
+        for ordenar in ['precio_asc', 'precio_desc', 'nombre_asc', None]:
+            vistos, qs = self._recorrer(ordenar)
+            esperado = list(qs.order_by(*paginacion.orden(ordenar)).values_list('pk', flat=True))
+            self.assertEqual(vistos, esperado, ordenar)
+
+    def test_placeholder_desde_la_bd(self):
+        filas, _ = paginacion.pagina(Producto.objects.filter(supermercado=self.jumbo), 'precio_asc')
+        self.assertEqual({f['imagen'] for f in filas}, {PLACEHOLDER_IMG})
+        self.assertEqual(filas[0]['tienda'], 'Jumbo')
+
+    def test_pagina_y_json(self):
+        resp = self.client.get(reverse('productos_por_categoria', args=['bebidas']), {'ordenar': 'precio_asc'})
+        self.assertEqual(resp.context['total'], 60)
+        self.assertEqual(len(resp.context['productos']), paginacion.POR_PAGINA)
+        data = self.client.get(
+            reverse('productos_categoria_json', args=['bebidas']),
+            {'ordenar': 'precio_asc', 'cursor': resp.context['siguiente']},
+        ).json()
+        self.assertEqual(len(data['productos']), 60 - paginacion.POR_PAGINA)
+        self.assertIsNone(data['siguiente'])
+        ids = [p['id'] for p in resp.context['productos']] + [p['id'] for p in data['productos']]
+        self.assertEqual(len(set(ids)), 60)
+
+        resp = self.client.get(reverse('productos_categoria_json', args=['bebidas']), {'cursor': 'xx'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_cursor_con_tipos_incorrectos_es_400(self):
+        staff = crear_usuario('staff', is_staff=True)
+        self.client.force_login(staff)
+        malos = [['abc', 1], [{'a': 1}, 1], [[1], 2], [None, 1], ['1000', '1'], ['NaN', 1], [True, 1]]
+        for valores in malos:
+            cursor = paginacion.codificar_cursor(valores)
+            for url in (reverse('productos_categoria_json', args=['bebidas']),
+                        reverse('api_productos_categoria', args=['bebidas'])):
+                resp = self.client.get(url, {'ordenar': 'precio_asc', 'cursor': cursor})
+                self.assertEqual(resp.status_code, 400, (url, valores))
+            # la página HTML ignora el cursor malo y muestra la primera
+            resp = self.client.get(reverse('productos_por_categoria', args=['bebidas']), {'ordenar': 'precio_asc', 'cursor': cursor})
+            self.assertEqual(resp.status_code, 200)
+        for valores in (['x', 1], ['2025-01-01T00:00:00', 'x'], [None, 1]):
+            resp = self.client.get(reverse('revision_cola', args=['productos']), {'cursor': paginacion.codificar_cursor(valores)})
+            self.assertEqual(resp.status_code, 400, valores)
+
+        # NULL sólo en campos que lo admiten
+        self.assertEqual(paginacion.decodificar_cursor(paginacion.codificar_cursor([None, 3]), ('precio_por_unidad', 'pk')), [None, 3])
+
+
+class FacetasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        lider = Supermercado.objects.create(nombre='Lider')
+        jumbo = Supermercado.objects.create(nombre='Jumbo')
+        for tienda, marca, precio in [
+            (lider, ' Tucapel ', 1000), (lider, 'TUCAPEL', 1200), (lider, 'Miraflores', 900),
+            (jumbo, 'tucapel', 1100), (jumbo, 'Miraflores', 5000), (jumbo, None, 2000),
+        ]:
+            Producto.objects.create(nombre='Arroz', tipo='arroz', marca=marca, supermercado=tienda, precio=precio)
+        Producto.objects.create(nombre='Aceite', tipo='aceite', marca='Belmont', supermercado=lider, precio=3000)
+
+    def _facetas(self, **kw):
+        base = filtrar_por_tipo(Producto.objects.filter(disponible=True), 'arroz')
+        with self.assertNumQueries(2):
+            return calcular_facetas(base, **kw)
+
+    def test_marca_normalizada_en_bd(self):
+        self.assertEqual(
+            set(Producto.objects.filter(tipo='arroz').values_list('marca_normalizada', flat=True)),
+            {'tucapel', 'miraflores', None},
+        )
+
+    def test_conteos_sin_filtros(self):
+        f = self._facetas()
+        self.assertEqual(f['total'], 6)
+        self.assertEqual([(m['etiqueta'], m['conteo']) for m in f['marcas']], [('Tucapel', 3), ('Miraflores', 2)])
+        self.assertEqual([(t['valor'], t['conteo']) for t in f['tiendas']], [('Jumbo', 3), ('Lider', 3)])
+        self.assertEqual(f['precios']['min'], Decimal('900'))
+        self.assertEqual(sum(r['conteo'] for r in f['precios']['rangos']), 6)
+
+    def test_facetas_disyuntivas(self):
+        f = self._facetas(marcas=['tucapel'], tiendas=['Lider'])
+        self.assertEqual(f['total'], 2)
+        # marcas: respetan la tienda, no la marca
+        self.assertEqual({m['valor']: m['conteo'] for m in f['marcas']}, {'tucapel': 2, 'miraflores': 1})
+        # tiendas: respetan la marca, no la tienda
+        self.assertEqual({t['valor']: t['conteo'] for t in f['tiendas']}, {'Lider': 2, 'Jumbo': 1})
+
+        f = self._facetas(precio_min=Decimal('1000'), precio_max=Decimal('1150'))
+        self.assertEqual(f['total'], 2)
+        self.assertEqual({m['valor']: m['conteo'] for m in f['marcas']}, {'tucapel': 2})
+        # los rangos de precio ignoran el propio filtro de precio
+        self.assertEqual(sum(r['conteo'] for r in f['precios']['rangos']), 6)
+
+    def test_vista_filtra_por_marca_normalizada(self):
+        resp = self.client.get(reverse('productos_por_categoria', args=['arroz']), {'marca': ['Tucapel'], 'tienda': 'Jumbo'})
+        self.assertEqual(resp.context['total'], 1)
+        self.assertEqual([p['precio'] for p in resp.context['productos']], [Decimal('1100')])
+        self.assertContains(resp, 'value="tucapel"')
+
+
+class CacheCatalogoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lider = crear_supermercado_con_productos('Lider', n=2, tipo='arroz', marca=' tucapel ')
+
+    def test_metadatos(self):
+        data = metadatos_catalogo()
+        self.assertEqual(data['tipos'], ['arroz'])
+
+    def test_segunda_lectura_no_consulta_la_bd(self):
+        tipos_catalogo()
+        with self.assertNumQueries(0):
+            tipos_catalogo()
+
+    def test_guardar_producto_invalida(self):
+        tipos_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Aceite Belmont', tipo='aceite', supermercado=self.lider, precio=2000)
+        self.assertEqual(tipos_catalogo(), ['aceite', 'arroz'])
+
+    def test_rechazar_producto_invalida(self):
+        tipos_catalogo()
+        staff = crear_usuario('admin', is_staff=True)
+        self.client.force_login(staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            for p in Producto.objects.all():
+                self.client.post(reverse('rechazar_producto', args=[p.pk]))
+        self.assertEqual(tipos_catalogo(), [])
+
+
+class CachePaginasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lider = crear_supermercado_con_productos('Lider', n=2, tipo='arroz')
+        self.url = reverse('productos_por_categoria', args=['arroz'])
+
+    def test_anonimo_segunda_visita_no_consulta_la_bd(self):
+        primera = self.client.get(self.url, {'ordenar': 'precio_asc'})
+        self.assertEqual(primera.status_code, 200)
+        self.assertIn('Cookie', primera['Vary'])
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url, {'ordenar': 'precio_asc'})
+        self.assertEqual(segunda.content, primera.content)
+
+    def test_query_string_es_parte_de_la_clave(self):
+        self.client.get(self.url, {'ordenar': 'precio_asc'})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'ordenar': 'precio_desc'})
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_guardar_producto_invalida(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Arroz Nuevo Zafiro', tipo='arroz', supermercado=self.lider, precio=999)
+        self.assertContains(self.client.get(self.url), 'Arroz Nuevo Zafiro')
+
+    def test_con_sesion_cachea_datos_pero_no_el_carrito(self):
+        usuario = crear_usuario('ana')
+        self.client.force_login(usuario)
+        p = Producto.objects.filter(supermercado=self.lider).first()
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            carrito.agregar_item(usuario, p, 3)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'ana')
+        self.assertEqual(len(response.context['cot_items']), 1)
+
+    def test_respuesta_anonima_no_llega_al_usuario_con_sesion(self):
+        self.client.get(self.url)
+        self.client.force_login(crear_usuario('ana'))
+        self.assertContains(self.client.get(self.url), 'ana')
+
+    def test_detalle_inexistente_no_se_cachea(self):
+        url = reverse('producto_detalle', args=[999999])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class BusquedaTests(TestCase):
+
+    def setUp(self):
+        s = Supermercado.objects.create(nombre='Lider')
+        self.aceite = Producto.objects.create(nombre='Aceíte de maravilla Belmont 1L', marca='Belmont', tipo='aceite', supermercado=s, precio=2990)
+        self.arroz = Producto.objects.create(nombre='Arroz grado 1', marca='Tucapel', tipo='arroz', supermercado=s, precio=1290)
+        Producto.objects.create(nombre='Aceite oliva pendiente', tipo='aceite', supermercado=s, precio=5990, disponible=False)
+
+    def buscar(self, q, **params):
+        return self.client.get(reverse('buscar_productos'), {'q': q, **params}).json()
+
+    def test_ignora_tildes_y_mayusculas(self):
+        data = self.buscar('ACEITE')
+        self.assertEqual([r['id'] for r in data['resultados']], [self.aceite.pk])
+        self.assertEqual(self.buscar('aceíte')['total'], 1)
+
+    def test_prefijo_y_marca(self):
+        self.assertEqual(self.buscar('tuca')['resultados'][0]['id'], self.arroz.pk)
+        self.assertEqual(self.buscar('belm mara')['total'], 1)
+
+    def test_triggers_siguen_actualizaciones(self):
+        self.arroz.nombre = 'Arroz integral'
+        self.arroz.save()
+        self.assertEqual(self.buscar('integral')['total'], 1)
+        self.arroz.delete()
+        self.assertEqual(self.buscar('tucapel')['total'], 0)
+
+    def test_paginacion(self):
+        s = Supermercado.objects.get(nombre='Lider')
+        for i in range(5):
+            Producto.objects.create(nombre=f'Fideos {i}', tipo='pasta', supermercado=s, precio=900 + i)
+        data = self.buscar('fideos', pagina=2, por_pagina=2)
+        self.assertEqual(data['total'], 5)
+        self.assertEqual(len(data['resultados']), 2)
+
+    def test_sintaxis_fts_no_rompe(self):
+        self.assertEqual(self.buscar('"arroz" OR NEAR(')['total'], 0)
+        self.assertEqual(busqueda.consulta_fts('Ñandú'), '"nandu"*')
+
+
+class EquivalenciasTests(TestCase):
+
+    def test_parsear_contenido(self):
+        self.assertEqual(equivalencias.parsear_contenido('Arroz Tucapel 1kg'), (Decimal('1000'), 'g'))
+        self.assertEqual(equivalencias.parsear_contenido('Arroz 900 g'), (Decimal('900'), 'g'))
+        self.assertEqual(equivalencias.parsear_contenido('Leche entera 1 L'), (Decimal('1000'), 'ml'))
+        self.assertEqual(equivalencias.parsear_contenido('Bebida 6 x 350 cc'), (Decimal('2100'), 'ml'))
+        self.assertEqual(equivalencias.parsear_contenido('Aceite 0,9 lt'), (Decimal('900'), 'ml'))
+        self.assertEqual(equivalencias.parsear_contenido('Sal de mar'), (None, ''))
+
+    def test_agrupa_entre_supermercados(self):
+        lider = Supermercado.objects.create(nombre='Lider')
+        jumbo = Supermercado.objects.create(nombre='Jumbo')
+        a = Producto.objects.create(nombre='Arroz Tucapel 1kg', tipo='arroz', supermercado=lider, precio=1390)
+        b = Producto.objects.create(nombre='Arroz grado 1 Tucapel 1 kg', marca='Tucapel', tipo='Arroz', supermercado=jumbo, precio=1290)
+        c = Producto.objects.create(nombre='Arroz Tucapel 5kg', tipo='arroz', supermercado=jumbo, precio=5990)
+        d = Producto.objects.create(nombre='Arroz integral Tucapel 1kg', tipo='arroz', supermercado=jumbo, precio=1590)
+
+        r = equivalencias.agrupar_catalogo()
+        self.assertEqual(r['grupos'], 3)
+        a.refresh_from_db(); b.refresh_from_db(); c.refresh_from_db(); d.refresh_from_db()
+        self.assertEqual(a.grupo_id, b.grupo_id)
+        self.assertNotEqual(a.grupo_id, c.grupo_id)
+        self.assertNotEqual(a.grupo_id, d.grupo_id)
+
+        # segunda pasada: nada que reasignar
+        self.assertEqual(equivalencias.agrupar_catalogo()['reasignados'], 0)
+
+    def test_editar_en_panel_conserva_grupo(self):
+        lider = Supermercado.objects.create(nombre='Lider')
+        p = Producto.objects.create(nombre='Arroz Tucapel 1kg', tipo='arroz', supermercado=lider, precio=1390)
+        equivalencias.agrupar_catalogo()
+        p.refresh_from_db()
+        grupo_id = p.grupo_id
+        self.assertIsNotNone(grupo_id)
+
+        self.client.force_login(crear_usuario('staff', is_staff=True))
+        resp = self.client.post(reverse('editar_producto_admin', args=[p.pk]), {
+            'nombre': p.nombre, 'tipo': 'arroz', 'precio': '1290', 'moneda': 'CLP', 'disponible': 'on',
+            'grupo': '',
+        })
+        self.assertRedirects(resp, reverse('revisar_productos'), fetch_redirect_response=False)
+        p.refresh_from_db()
+        self.assertEqual(p.precio, Decimal('1290'))
+        self.assertEqual(p.grupo_id, grupo_id)
+
+
+class ImportCatalogTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def importar(self, nombre, contenido, *args):
+        ruta = Path(self.dir.name) / nombre
+        ruta.write_text(contenido, encoding='utf-8')
+        salida = StringIO()
+        call_command('import_catalog', str(ruta), '--supermercado', 'Lider', *args, stdout=salida, stderr=StringIO())
+        return salida.getvalue()
+
+    def test_upsert_csv_y_desactiva_faltantes(self):
+        self.importar('feed.csv', (
+            'sku,nombre,marca,tipo,precio\n'
+            'A1,Arroz Tucapel 1kg,Tucapel,arroz,"1.390,50"\n'
+            'A2,Aceite Belmont 1L,Belmont,aceite,$2990\n'
+            'A3,Sin precio,,arroz,abc\n'
+        ))
+        self.assertEqual(Producto.objects.count(), 2)
+        self.assertEqual(Producto.objects.get(codigo_interno='A1').precio, Decimal('1390.50'))
+
+        salida = self.importar('feed2.jsonl', (
+            '{"codigo_interno": "A1", "nombre": "Arroz Tucapel 1kg", "tipo": "arroz", "precio": 1290}\n'
+            '{"codigo_interno": "A1", "nombre": "Arroz Tucapel 1kg", "tipo": "arroz", "precio": 1190}\n'
+            'no es json\n'
+        ))
+        self.assertIn('filas/s', salida)
+        self.assertEqual(Producto.objects.count(), 2)
+        a1 = Producto.objects.get(codigo_interno='A1')
+        self.assertEqual(a1.precio, Decimal('1190'))
+        self.assertTrue(a1.disponible)
+        self.assertFalse(Producto.objects.get(codigo_interno='A2').disponible)
+
+    def test_no_desactivar(self):
+        self.importar('a.csv', 'sku,nombre,tipo,precio\nB1,Sal Lobos 1kg,sal,490\n')
+        self.importar('b.csv', 'sku,nombre,tipo,precio\nB2,Azucar 1kg,azucar,990\n', '--no-desactivar')
+        self.assertTrue(Producto.objects.get(codigo_interno='B1').disponible)
+
+    def test_precios_y_urls_invalidos_se_reportan_por_fila(self):
+        feed = StringIO(
+            'sku,nombre,tipo,precio,imagen_url,producto_url\n'
+            'C1,Arroz 1kg,arroz,inf,,\n'
+            'C2,Arroz 1kg,arroz,1e30,,\n'
+            'C3,Arroz 1kg,arroz,nan,,\n'
+            f'C4,Arroz 1kg,arroz,990,https://cdn.example.cl/{"x" * 200}.png,\n'
+            'C5,Arroz 1kg,arroz,990,,no es url\n'
+            'C6,Arroz 1kg,arroz,990,https://cdn.example.cl/c6.png,https://lider.cl/c6\n'
+        )
+        resumen = importacion.importar_catalogo(feed, 'csv', Supermercado.objects.create(nombre='Lider'))
+        self.assertEqual([n for n, _ in resumen['errores']], [1, 2, 3, 4, 5])
+        self.assertIn('imagen_url supera 200', resumen['errores'][3][1])
+        self.assertIn('producto_url no es una URL', resumen['errores'][4][1])
+        self.assertEqual(list(Producto.objects.values_list('codigo_interno', flat=True)), ['C6'])
+
+    def test_pyme_codigo_repetido_es_error_de_campo(self):
+        duena = crear_usuario('duena')
+        tienda = Supermercado.objects.create(nombre='Almacén Doña Rosa')
+        Pyme.objects.create(user=duena, nombre='Almacén Doña Rosa', supermercado=tienda, approved=True)
+        Producto.objects.create(nombre='Pan amasado', tipo='pan', supermercado=tienda, precio=1500, codigo_interno='P1')
+        self.client.force_login(duena)
+        datos = {'nombre': 'Pan integral', 'tipo': 'pan', 'precio': '1800', 'moneda': 'CLP', 'codigo_interno': 'P1'}
+
+        resp = self.client.post(reverse('pyme_dashboard'), datos)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('codigo_interno', resp.context['form'].errors)
+        resp = self.client.post(reverse('pyme_ingresar'), {**datos, 'new_supermercado_name': tienda.nombre})
+        self.assertIn('codigo_interno', resp.context['form'].errors)
+        self.assertEqual(Producto.objects.filter(codigo_interno='P1').count(), 1)
+
+        # el mismo código en otra tienda, o al editar el propio producto, sí vale
+        self.assertTrue(PymeProductForm(datos, supermercado=Supermercado.objects.create(nombre='Otra')).is_valid())
+        self.assertTrue(PymeProductForm(datos, instance=Producto.objects.get(codigo_interno='P1')).is_valid())
+
+
+class HistorialPreciosTests(TestCase):
+
+    def setUp(self):
+        self.lider = Supermercado.objects.create(nombre='Lider')
+        self.producto = Producto.objects.create(nombre='Arroz', tipo='arroz', supermercado=self.lider, precio=1000)
+
+    def test_solo_registra_cambios(self):
+        self.assertEqual(HistorialPrecio.objects.count(), 1)
+        self.producto.nombre = 'Arroz grado 1'
+        self.producto.save()
+        self.assertEqual(HistorialPrecio.objects.count(), 1)
+
+        # cambio otro día -> nueva fila; volver al precio anterior el mismo día la borra
+        HistorialPrecio.objects.update(dia=datetime.date(2020, 1, 1))
+        self.producto.precio = 1100
+        self.producto.save()
+        self.assertEqual(HistorialPrecio.objects.count(), 2)
+        self.producto.precio = 1000
+        self.producto.save()
+        self.assertEqual(HistorialPrecio.objects.count(), 1)
+
+    def test_import_registra_cambios(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ruta = Path(tmp.name) / 'feed.csv'
+        ruta.write_text('sku,nombre,tipo,precio\nX1,Sal,sal,500\n', encoding='utf-8')
+        call_command('import_catalog', str(ruta), '--supermercado', 'Lider', stdout=StringIO())
+        x1 = Producto.objects.get(codigo_interno='X1')
+        self.assertEqual(list(x1.historial_precios.values_list('precio', flat=True)), [Decimal('500')])
+
+    def test_endpoint_sparkline(self):
+        HistorialPrecio.objects.update(dia=timezone.localdate() - datetime.timedelta(days=200))
+        self.producto.precio = 1200
+        self.producto.save()
+        data = self.client.get(reverse('historial_precios', args=[self.producto.pk]), {'dias': 30}).json()
+        self.assertEqual([p[1] for p in data['puntos']], [1000.0, 1200.0])
+        self.assertEqual(data['variacion'], 200.0)
+
+    def test_compactar(self):
+        hoy = datetime.date(2025, 6, 30)
+        HistorialPrecio.objects.all().delete()
+        dias = [datetime.date(2018, 1, 1), datetime.date(2018, 2, 1),   # fuera de retención
+                datetime.date(2024, 3, 4), datetime.date(2024, 3, 5),   # misma semana
+                datetime.date(2025, 6, 1)]                              # resolución diaria
+        otro = Producto.objects.create(nombre='Arroz Tucapel 5kg', tipo='arroz', supermercado=self.producto.supermercado, precio=5000)
+        HistorialPrecio.objects.all().delete()
+        for producto in (self.producto, otro):
+            for i, dia in enumerate(dias):
+                HistorialPrecio.objects.create(producto=producto, dia=dia, precio=1000 + i)
+        # de a un producto por lote
+        borrados = precios.compactar_historial(dias_diarios=180, dias_retencion=365 * 5, hoy=hoy, productos_por_lote=1)
+        self.assertEqual(borrados, 4)
+        for producto in (self.producto, otro):
+            self.assertEqual(
+                list(producto.historial_precios.order_by('dia').values_list('dia', flat=True)),
+                [datetime.date(2018, 2, 1), datetime.date(2024, 3, 5), datetime.date(2025, 6, 1)],
+            )
+
+
+class OptimizadorTests(TestCase):
+
+    def setUp(self):
+        self.user = crear_usuario()
+        self.client.force_login(self.user)
+        self.lider = Supermercado.objects.create(nombre='Lider')
+        self.jumbo = Supermercado.objects.create(nombre='Jumbo')
+        self.tottus = Supermercado.objects.create(nombre='Tottus')
+        precios_por_producto = {
+            'Arroz Tucapel 1kg': {self.lider: 1000, self.jumbo: 1200, self.tottus: 1500},
+            'Aceite Belmont 1 L': {self.lider: 3000, self.jumbo: 2000, self.tottus: 2900},
+            'Sal Lobos 1kg': {self.jumbo: 600, self.tottus: 400},
+        }
+        self.cot = Cotizacion.objects.create(usuario=self.user)
+        for nombre, por_tienda in precios_por_producto.items():
+            for tienda, precio in por_tienda.items():
+                Producto.objects.create(nombre=nombre, tipo=nombre.split()[0], supermercado=tienda, precio=precio)
+        equivalencias.agrupar_catalogo()
+        # el carrito tiene todo desde Lider salvo la sal (que Lider no vende)
+        for nombre, cantidad in [('Arroz Tucapel 1kg', 2), ('Aceite Belmont 1 L', 1), ('Sal Lobos 1kg', 1)]:
+            p = Producto.objects.filter(nombre=nombre).order_by('pk').first()
+            CotizacionItem.objects.create(cotizacion=self.cot, producto=p, cantidad=cantidad, precio_unidad=p.precio)
+
+    def test_una_tienda_y_division(self):
+        r = optimizador.optimizar_cotizacion(self.cot, max_tiendas=2)
+        self.assertEqual(r['tiendas_consideradas'], 3)
+        # Jumbo: 2*1200 + 2000 + 600 = 5000 (Lider no tiene sal)
+        self.assertEqual(r['una_tienda']['supermercado'], 'Jumbo')
+        self.assertEqual(r['una_tienda']['total'], 5000)
+        self.assertEqual(r['una_tienda']['faltantes'], 0)
+        # Lider + Jumbo: 2*1000 + 2000 + 600 = 4600 vs Lider + Tottus: 2000 + 2900 + 400 = 5300
+        self.assertEqual(sorted(r['dividida']['supermercados']), ['Jumbo', 'Lider'])
+        self.assertEqual(r['dividida']['total'], 4600)
+        self.assertTrue(r['dividida']['exacto'])
+
+    def test_no_disponible_cuenta_como_faltante(self):
+        Producto.objects.filter(nombre__startswith='Sal').update(disponible=False)
+        r = optimizador.optimizar_cotizacion(self.cot, max_tiendas=1)
+        self.assertEqual(r['una_tienda']['faltantes'], 1)
+        self.assertEqual(r['una_tienda']['total'], 4400)
+
+    def test_greedy_cerca_del_exacto(self):
+        import random
+        rnd = random.Random(7)
+        costos = [[rnd.randint(500, 3000) if rnd.random() > 0.1 else optimizador.inf for _ in range(40)]
+                  for _ in range(15)]
+        _, exacto, es_exacto = optimizador.mejor_division(costos, 3)
+        self.assertTrue(es_exacto)
+        limite = optimizador.LIMITE_EXACTO
+        optimizador.LIMITE_EXACTO = 0
+        self.addCleanup(setattr, optimizador, 'LIMITE_EXACTO', limite)
+        _, aproximado, es_exacto = optimizador.mejor_division(costos, 3)
+        self.assertFalse(es_exacto)
+        self.assertEqual(aproximado[0], exacto[0])
+        self.assertLessEqual(aproximado[1], exacto[1] * 1.05)
+
+    def test_endpoint_y_pagina(self):
+        data = self.client.get(reverse('optimizar_cotizacion'), {'k': 2}).json()
+        self.assertTrue(data['ok'])
+        self.assertEqual(data['dividida']['total'], 4600)
+        self.assertEqual(self.client.get(reverse('optimizar_cotizacion'), {'k': 'x'}).status_code, 400)
+        resp = self.client.get(reverse('ver_cotizacion'))
+        self.assertEqual(resp.context['optimizacion']['una_tienda']['supermercado'], 'Jumbo')
+
+    def test_resultado_cacheado_por_version_del_carrito(self):
+        cache.clear()
+        self.cot.refresh_from_db()
+        with mock.patch.object(optimizador, 'optimizar_cotizacion', wraps=optimizador.optimizar_cotizacion) as calc:
+            optimizador.optimizar_cacheado(self.cot)
+            optimizador.optimizar_cacheado(self.cot)
+            self.assertEqual(calc.call_count, 1)
+            # cambiar el carrito cambia la clave
+            self.cot.items.filter(producto__nombre__startswith='Sal').delete()
+            self.cot.refresh_from_db()
+            r = optimizador.optimizar_cacheado(self.cot)
+            self.assertEqual(calc.call_count, 2)
+            self.assertEqual(r['items'], 2)
+            # y también un cambio del catálogo
+            invalidar_paginas()
+            optimizador.optimizar_cacheado(self.cot)
+            self.assertEqual(calc.call_count, 3)
+
+
+class CarritoConcurrenteTests(TransactionTestCase):
+    # con DB_REPLICA_NAME el catálogo se lee del alias 'replica' (espejo en tests)
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = crear_usuario()
+        s = crear_supermercado_con_productos('Lider', n=1)
+        self.producto = s.productos.get()
+
+    def _en_paralelo(self, funcion, hilos=8, repeticiones=10):
+        errores = []
+        barrera = threading.Barrier(hilos)
+
+        def trabajo():
+            try:
+                barrera.wait()
+                for _ in range(repeticiones):
+                    funcion()
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errores.append(e)
+            finally:
+                connections.close_all()
+
+        ts = [threading.Thread(target=trabajo) for _ in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual(errores, [])
+
+    def test_agregar_en_paralelo_no_pierde_incrementos(self):
+        self._en_paralelo(lambda: carrito.agregar_item(self.user, self.producto, 1))
+        cot = Cotizacion.objects.get(usuario=self.user, status='open')
+        self.assertEqual(cot.items.get().cantidad, 80)
+        self.assertEqual(cot.total, Decimal('80000'))
+        self.assertEqual(cot.cantidad_items, 1)
+
+    def test_una_sola_cotizacion_abierta(self):
+        self._en_paralelo(lambda: carrito.cotizacion_abierta(self.user), repeticiones=1)
+        self.assertEqual(Cotizacion.objects.filter(usuario=self.user, status='open').count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cotizacion.objects.create(usuario=self.user, status='open')
+
+    def test_cantidad_minima_en_bd(self):
+        r = carrito.agregar_item(self.user, self.producto, 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CotizacionItem.objects.filter(pk=r['item_id']).update(cantidad=0)
+        self.assertEqual(carrito.actualizar_cantidad(self.user, r['item_id'], 0)[0], 'deleted')
+        self.assertEqual(Cotizacion.objects.get().cantidad_items, 0)
+
+
+class ApiCatalogoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lider = crear_supermercado_con_productos('Lider', n=3, tipo='arroz', imagen_url='')
+        self.jumbo = crear_supermercado_con_productos('Jumbo', n=2, tipo='arroz')
+
+    def test_supermercados_y_tipos(self):
+        data = self.client.get(reverse('api_supermercados')).json()
+        self.assertEqual(
+            [(s['nombre'], s['productos_disponibles']) for s in data['supermercados']],
+            [('Jumbo', 2), ('Lider', 3)],
+        )
+        self.assertEqual(self.client.get(reverse('api_tipos')).json()['tipos'], ['arroz'])
+
+    def test_etag_tipos_cambia_con_producto_no_disponible(self):
+        url = reverse('api_tipos')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Aceite Belmont 1 L', tipo='aceite', supermercado=self.lider, precio=2990, disponible=False)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['tipos'], ['aceite', 'arroz'])
+
+    def test_etag_categoria_cambia_con_nombre_de_supermercado(self):
+        url = reverse('api_productos_categoria', args=['arroz'])
+        etag = self.client.get(url, {'campos': 'id,tienda'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jumbo.nombre = 'Jumbo Express'
+            self.jumbo.save()
+        resp = self.client.get(url, {'campos': 'id,tienda'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('Jumbo Express', {p['tienda'] for p in resp.json()['productos']})
+
+    def test_etag_y_304(self):
+        url = reverse('api_productos_categoria', args=['arroz'])
+        resp = self.client.get(url, {'ordenar': 'precio_asc', 'campos': 'id,precio,imagen'})
+        etag = resp['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertEqual(set(resp.json()['productos'][0]), {'id', 'precio', 'imagen'})
+
+        # sin cambios: 304 sin cuerpo, con una sola consulta (la del ETag)
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, {'ordenar': 'precio_asc', 'campos': 'id,precio,imagen'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+        # otro orden u otros campos: otro ETag
+        resp = self.client.get(url, {'ordenar': 'precio_desc', 'campos': 'id,precio,imagen'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+        # cambio de precio: el ETag cambia
+        p = self.lider.productos.first()
+        p.precio = 1
+        p.save()
+        resp = self.client.get(url, {'ordenar': 'precio_asc', 'campos': 'id,precio,imagen'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['productos'][0], {'id': p.pk, 'precio': 1.0, 'imagen': PLACEHOLDER_IMG})
+
+        # desactivar por UPDATE (import_catalog) no toca fecha_actualizacion pero sí el conteo
+        etag = resp['ETag']
+        Producto.objects.filter(pk=p.pk).update(disponible=False)
+        resp = self.client.get(url, {'ordenar': 'precio_asc', 'campos': 'id,precio,imagen'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_producto_con_comparables(self):
+        a, b = self.lider.productos.order_by('pk')[:2]
+        Producto.objects.filter(pk__in=[a.pk, b.pk]).update(nombre='Arroz Tucapel 1kg')
+        equivalencias.agrupar_catalogo()
+        data = self.client.get(reverse('api_producto', args=[a.pk]), {'campos': 'id,tienda'}).json()
+        self.assertEqual(data['producto']['id'], a.pk)
+        self.assertEqual(data['comparables'], [{'id': b.pk, 'tienda': 'Lider'}])
+
+        self.assertEqual(self.client.get(reverse('api_producto', args=[999999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_producto', args=[a.pk]), {'campos': 'x'}).status_code, 400)
+
+
+class RouterReplicaTests(TestCase):
+
+    def setUp(self):
+        self.router = RouterReplica()
+        # TestCase envuelve cada test en atomic(), y dentro de una transacción
+        # del primario el router no usa la réplica: se simula estar fuera
+        antes = connection.in_atomic_block
+        connection.in_atomic_block = False
+        self.addCleanup(setattr, connection, 'in_atomic_block', antes)
+
+    def test_catalogo_se_lee_de_la_replica(self):
+        self.assertEqual(self.router.db_for_read(Producto), 'replica')
+        self.assertEqual(self.router.db_for_read(Supermercado), 'replica')
+        self.assertEqual(self.router.db_for_read(HistorialPrecio), 'replica')
+
+    def test_carrito_y_escrituras_van_al_primario(self):
+        self.assertEqual(self.router.db_for_read(Cotizacion), 'default')
+        self.assertEqual(self.router.db_for_read(CotizacionItem), 'default')
+        self.assertEqual(self.router.db_for_read(Usuario), 'default')
+        self.assertEqual(self.router.db_for_write(Producto), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'tucanasta'))
+
+    def test_leer_de_primario(self):
+        with leer_de_primario():
+            self.assertEqual(self.router.db_for_read(Producto), 'default')
+        self.assertEqual(self.router.db_for_read(Producto), 'replica')
+
+    def test_transaccion_del_primario_lee_del_primario(self):
+        connection.in_atomic_block = True
+        self.assertEqual(self.router.db_for_read(Producto), 'default')
+
+    def test_middleware_fija_el_primario_tras_escribir(self):
+        vistos = []
+
+        def vista(request):
+            vistos.append(self.router.db_for_read(Producto))
+            return HttpResponse('ok')
+
+        middleware = PrimarioTrasEscrituraMiddleware(vista)
+        factory = RequestFactory()
+        with mock.patch('tucanasta.replicas.hay_replica', return_value=True):
+            respuesta = middleware(factory.post('/cotizacion/agregar/'))
+            self.assertIn('leer_primario', respuesta.cookies)
+            factory.cookies['leer_primario'] = '1'
+            middleware(factory.get('/'))
+            del factory.cookies['leer_primario']
+            middleware(factory.get('/'))
+        self.assertEqual(vistos, ['default', 'default', 'replica'])
+
+
+class RevisionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = crear_usuario('admin', is_staff=True)
+        self.client.force_login(self.staff)
+        self.lider = crear_supermercado_con_productos('Lider', n=5, tipo='arroz', disponible=False)
+        self.pendientes = list(self.lider.productos.order_by('-fecha_actualizacion', '-pk').values_list('pk', flat=True))
+
+    def lote(self, **datos):
+        return self.client.post(reverse('revision_lote'), json.dumps(datos), content_type='application/json')
+
+    def test_cola_paginada_por_cursor(self):
+        filas, siguiente = revision.cola_productos(por_pagina=2)
+        vistos = [f['id'] for f in filas]
+        while siguiente:
+            filas, siguiente = revision.cola_productos(siguiente, por_pagina=2)
+            vistos += [f['id'] for f in filas]
+        self.assertEqual(vistos, self.pendientes)
+
+    def test_cola_json(self):
+        data = self.client.get(reverse('revision_cola', args=['productos'])).json()
+        self.assertEqual([f['id'] for f in data['filas']], self.pendientes)
+        self.assertIsNone(data['siguiente'])
+        self.assertEqual(self.client.get(reverse('revision_cola', args=['otra'])).status_code, 404)
+
+    def test_aprobar_en_lote_es_un_update_e_invalida_catalogo(self):
+        tipos_catalogo()
+        ids = self.pendientes[:3]
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as ctx:
+                revision.aprobar_productos(ids)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Producto.objects.filter(disponible=True).values_list('pk', flat=True)), set(ids))
+        self.assertEqual(tipos_catalogo(), ['arroz'])
+        self.assertEqual(busqueda.buscar('arroz')[1], 3)
+
+    def test_rechazar_en_lote_por_json(self):
+        resp = self.lote(tipo='productos', accion='rechazar', ids=self.pendientes[:2])
+        self.assertEqual(resp.json(), {'ok': True, 'procesados': 2})
+        self.assertEqual(Producto.objects.count(), 3)
+
+    def test_pymes_en_lote(self):
+        duenos = [crear_usuario(f'pyme{i}') for i in range(3)]
+        pymes = [Pyme.objects.create(user=u, nombre=f'Pyme {i}') for i, u in enumerate(duenos)]
+        resp = self.lote(tipo='pymes', accion='aprobar', ids=[pymes[0].pk, pymes[1].pk])
+        self.assertEqual(resp.json()['procesados'], 2)
+        filas, _ = revision.cola_pymes()
+        self.assertEqual([f['id'] for f in filas], [pymes[2].pk])
+        self.assertEqual(filas[0]['usuario'], 'pyme2')
+
+    def test_peticiones_invalidas(self):
+        self.assertEqual(self.lote(tipo='productos', accion='borrar', ids=[1]).status_code, 400)
+        self.assertEqual(self.lote(tipo='productos', accion='aprobar', ids=[]).status_code, 400)
+        self.assertEqual(self.lote(tipo='productos', accion='aprobar', ids=['x']).status_code, 400)
+
+    def test_solo_staff(self):
+        self.client.force_login(crear_usuario('cliente'))
+        self.assertEqual(self.client.get(reverse('revisar_productos')).status_code, 302)
+        self.assertEqual(self.lote(tipo='productos', accion='aprobar', ids=self.pendientes).status_code, 302)
+        self.assertFalse(Producto.objects.filter(disponible=True).exists())
+
+    def test_panel_muestra_primera_pagina(self):
+        Pyme.objects.create(user=crear_usuario('pyme'), nombre='Almacén Don Tito')
+        resp = self.client.get(reverse('revisar_productos'))
+        self.assertEqual(len(resp.context['pendientes']), 5)
+        self.assertContains(resp, 'Almacén Don Tito')
+        self.assertIsNone(resp.context['siguiente_productos'])
+
+
+class TareasTests(TestCase):
+
+    def setUp(self):
+        self.staff = crear_usuario('admin', is_staff=True)
+        self.duena = crear_usuario('duena')
+        self.pyme = Pyme.objects.create(user=self.duena, nombre='Almacén Doña Rosa')
+
+    def test_aprobar_pyme_encola_correo_y_el_worker_lo_envia(self):
+        self.client.force_login(self.staff)
+        self.client.post(reverse('aprobar_pyme', args=[self.pyme.pk]))
+        self.assertEqual(len(mail.outbox), 0)  # nada se envía en la request
+
+        self.assertEqual(tareas.procesar_pendientes(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['duena@example.com'])
+        self.assertEqual(Tarea.objects.get().estado, 'hecha')
+
+    def test_clave_de_idempotencia(self):
+        a = tareas.encolar('notificar_pyme_aprobada', clave='x', pyme_id=self.pyme.pk)
+        b = tareas.encolar('notificar_pyme_aprobada', clave='x', pyme_id=self.pyme.pk)
+        self.assertEqual(a.pk, b.pk)
+        self.assertEqual(Tarea.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            tareas.encolar('no_existe')
+
+    def test_reintentos_con_backoff_y_fallo_definitivo(self):
+        llamadas = []
+
+        @tareas.tarea('prueba_falla')
+        def falla():
+            llamadas.append(1)
+            raise RuntimeError('smtp caído')
+        self.addCleanup(tareas.TAREAS.pop, 'prueba_falla')
+
+        t = tareas.encolar('prueba_falla', max_intentos=2)
+        with self.assertLogs('tucanasta.tareas', 'WARNING'):
+            self.assertEqual(tareas.procesar_pendientes(), 1)
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), ('pendiente', 1))
+        self.assertGreater(t.ejecutar_desde, timezone.now())
+        self.assertIn('smtp caído', t.ultimo_error)
+        self.assertEqual(tareas.procesar_pendientes(), 0)  # todavía no toca
+
+        Tarea.objects.filter(pk=t.pk).update(ejecutar_desde=timezone.now())
+        with self.assertLogs('tucanasta.tareas', 'ERROR'):
+            tareas.procesar_pendientes()
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos, len(llamadas)), ('fallida', 2, 2))
+
+    def test_tarea_abandonada_se_retoma(self):
+        t = tareas.encolar('agrupar_catalogo')
+        self.assertEqual(tareas.tomar_siguiente().pk, t.pk)
+        self.assertIsNone(tareas.tomar_siguiente())  # reservada por otro worker
+        Tarea.objects.filter(pk=t.pk).update(bloqueada_hasta=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(tareas.tomar_siguiente().pk, t.pk)
+
+    def test_documento_de_pyme(self):
+        with tempfile.TemporaryDirectory() as carpeta, self.settings(DOCUMENTOS_ROOT=carpeta):
+            self.pyme.documento.save('rut.pdf', ContentFile(b'%PDF-1.4 contenido'))
+            tareas.encolar('procesar_documento_pyme', pyme_id=self.pyme.pk)
+            call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+        self.assertEqual(mail.outbox[0].to, ['admin@example.com'])
+        self.assertIn('tipo pdf', mail.outbox[0].body)
+
+
+class DocumentosPymeTests(TestCase):
+    PDF = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = self.settings(DOCUMENTOS_ROOT=carpeta.name, DOCUMENTO_MAX_BYTES=2048)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.carpeta = Path(carpeta.name)
+
+    def registrar(self, usuario, contenido, nombre='rut.pdf'):
+        self.client.force_login(usuario)
+        return self.client.post(reverse('pyme_registro'), {
+            'nombre': f'Pyme de {usuario.username}',
+            'documento': SimpleUploadedFile(nombre, contenido),
+        })
+
+    def test_registro_guarda_por_contenido_y_deduplica(self):
+        self.assertEqual(self.client.get(reverse('pyme_registro')).status_code, 302)  # login
+        self.registrar(crear_usuario('ana'), self.PDF)
+        self.registrar(crear_usuario('beto'), self.PDF, nombre='otro nombre.PDF')
+        nombres = set(Pyme.objects.values_list('documento', flat=True))
+        digest = hashlib.sha256(self.PDF).hexdigest()
+        self.assertEqual(nombres, {f'{digest[:2]}/{digest[2:4]}/{digest}.pdf'})
+        archivos = [p for p in self.carpeta.rglob('*') if p.is_file()]
+        self.assertEqual(len(archivos), 1)
+        self.assertEqual(Tarea.objects.filter(nombre='procesar_documento_pyme').count(), 2)
+
+    def test_documento_demasiado_grande_se_corta_en_la_subida(self):
+        resp = self.registrar(crear_usuario('ana'), b'%PDF-' + b'x' * 5000)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('supera', str(resp.context['form'].errors['documento']))
+        self.assertFalse(Pyme.objects.exists())
+
+    def test_formato_no_permitido(self):
+        resp = self.registrar(crear_usuario('ana'), b'MZ ejecutable', nombre='rut.exe')
+        self.assertIn('Formato no permitido', str(resp.context['form'].errors['documento']))
+
+    def test_descarga_staff_con_range(self):
+        self.registrar(crear_usuario('ana'), self.PDF)
+        url = reverse('documento_pyme', args=[Pyme.objects.get().pk])
+        self.assertEqual(self.client.get(url).status_code, 302)  # no es staff
+
+        self.client.force_login(crear_usuario('admin', is_staff=True))
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(resp.streaming_content), self.PDF)
+
+        resp = self.client.get(url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], f'bytes 5-14/{len(self.PDF)}')
+        self.assertEqual(b''.join(resp.streaming_content), self.PDF[5:15])
+
+        resp = self.client.get(url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(resp.streaming_content), self.PDF[-4:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.PDF)}-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+
+        with self.settings(DOCUMENTOS_SENDFILE='x-accel-redirect'):
+            resp = self.client.get(url)
+        self.assertTrue(resp['X-Accel-Redirect'].startswith('/interno/pyme_docs/'))
+        self.assertEqual(resp.content, b'')
+
+    def test_extension_y_content_type_salen_de_la_firma(self):
+        # un PDF válido con HTML adentro, subido como .html
+        contenido = b'%PDF-1.4 <html><script>alert(1)</script></html>'
+        self.registrar(crear_usuario('ana'), contenido, nombre='rut.html')
+        pyme = Pyme.objects.get()
+        self.assertTrue(pyme.documento.name.endswith('.pdf'))
+
+        self.client.force_login(crear_usuario('admin', is_staff=True))
+        resp = self.client.get(reverse('documento_pyme', args=[pyme.pk]))
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertEqual(resp['Content-Disposition'], 'inline')
+        self.assertEqual(resp['X-Content-Type-Options'], 'nosniff')
+
+        # contenido no reconocido: sin extensión
+        nombre = documentos.documentos_storage.save('viejo.html', ContentFile(b'<script>alert(1)</script>'))
+        self.assertNotIn('.', Path(nombre).name)
+
+        # un archivo guardado antes con la extensión del cliente no se sirve como HTML
+        (self.carpeta / 'legado.html').write_bytes(b'<script>alert(1)</script>')
+        Pyme.objects.filter(pk=pyme.pk).update(documento='legado.html')
+        resp = self.client.get(reverse('documento_pyme', args=[pyme.pk]))
+        self.assertEqual(resp['Content-Type'], 'application/octet-stream')
+        self.assertEqual(resp['Content-Disposition'], 'attachment')
+
+    def test_temporal_se_borra_si_falla_la_copia(self):
+        class Roto(ContentFile):
+            def chunks(self, chunk_size=None):
+                yield b'%PDF-1.4'
+                raise OSError('disco lleno')
+
+        with self.assertRaises(OSError):
+            documentos.documentos_storage.save('rut.pdf', Roto(b''))
+        self.assertEqual(list((self.carpeta / 'tmp').iterdir()), [])
+
+
+PNG_FALSO = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+descargas = []
+
+
+def fetcher_falso(url):
+    """Fetcher de prueba: no sale a la red."""
+    descargas.append(url)
+    if 'rota' in url:
+        raise imagenes.ErrorImagen('404')
+    if 'texto' in url:
+        return b'<html>no es imagen</html>'
+    return PNG_FALSO
+
+
+class ImagenesProxyTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = self.settings(IMAGENES_CACHE_ROOT=carpeta.name, IMAGENES_FETCHER='tucanasta.tests.fetcher_falso')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.carpeta = Path(carpeta.name)
+        descargas.clear()
+        s = Supermercado.objects.create(nombre='Lider')
+        self.p = Producto.objects.create(
+            nombre='Arroz', tipo='arroz', supermercado=s, precio=Decimal('1000'),
+            imagen_url='https://cdn.lider.cl/arroz.png',
+        )
+
+    def test_descarga_una_vez_y_sirve_del_disco(self):
+        url = imagenes.url_proxy(self.p.pk, self.p.imagen_url)
+        self.assertEqual(url, reverse('imagen_producto', args=[self.p.pk, imagenes.clave_url(self.p.imagen_url)]))
+        for _ in range(2):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(b''.join(resp.streaming_content), PNG_FALSO)  # sin Pillow: original
+        self.assertEqual(descargas, [self.p.imagen_url])
+        self.assertEqual(resp['Content-Type'], 'image/png')
+        self.assertIn('immutable', resp['Cache-Control'])
+
+        # ya en disco: no necesita ni la base de datos
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_clave_que_no_corresponde_al_producto(self):
+        otra = imagenes.clave_url('https://evil.example/x.png')
+        self.assertEqual(self.client.get(reverse('imagen_producto', args=[self.p.pk, otra])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('imagen_producto', args=[self.p.pk, 'ZZ..'])).status_code, 404)
+        self.assertEqual(descargas, [])
+
+    def test_fallo_redirige_al_placeholder_sin_reintentar(self):
+        for imagen_url in ('https://cdn.lider.cl/rota.png', 'https://cdn.lider.cl/texto.png'):
+            Producto.objects.filter(pk=self.p.pk).update(imagen_url=imagen_url)
+            url = imagenes.url_proxy(self.p.pk, imagen_url)
+            with self.assertLogs('tucanasta.imagenes', 'WARNING'):
+                resp = self.client.get(url)
+            self.assertRedirects(resp, PLACEHOLDER_IMG, fetch_redirect_response=False)
+            self.client.get(url)
+        self.assertEqual(len(descargas), 2)  # el segundo intento de cada una no descarga
+
+    def test_url_proxy_en_tarjetas_y_plantillas(self):
+        self.assertEqual(imagenes.url_proxy(self.p.pk, ''), PLACEHOLDER_IMG)
+        filas, _ = paginacion.pagina(Producto.objects.all())
+        self.assertTrue(filas[0]['imagen'].startswith('/img/'))
+        plantilla = Template('{% load imagenes_proxy %}{{ p|imagen_proxy }}|{{ it|imagen_proxy }}')
+        html = plantilla.render(Context({'p': self.p, 'it': {'imagen_url': ''}}))
+        self.assertEqual(html, f'{filas[0]["imagen"]}|{PLACEHOLDER_IMG}')
+
+    def test_no_descarga_productos_en_revision_ni_otros_esquemas(self):
+        Producto.objects.filter(pk=self.p.pk).update(disponible=False)
+        resp = self.client.get(imagenes.url_proxy(self.p.pk, self.p.imagen_url))
+        self.assertRedirects(resp, PLACEHOLDER_IMG, fetch_redirect_response=False)
+
+        Producto.objects.filter(pk=self.p.pk).update(disponible=True, imagen_url='ftp://10.0.0.1/x.png')
+        self.assertEqual(imagenes.url_proxy(self.p.pk, 'ftp://10.0.0.1/x.png'), 'ftp://10.0.0.1/x.png')
+        resp = self.client.get(reverse('imagen_producto', args=[self.p.pk, imagenes.clave_url('ftp://10.0.0.1/x.png')]))
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(descargas, [])
+
+    def test_descargar_http_solo_a_ips_publicas(self):
+        for ip in ('127.0.0.1', '10.1.2.3', '192.168.0.10', '169.254.169.254', '::1', 'fe80::1', '::ffff:127.0.0.1', '0.0.0.0'):
+            self.assertFalse(imagenes._ip_publica(ip), ip)
+        self.assertTrue(imagenes._ip_publica('8.8.8.8'))
+
+        pedidos = []
+
+        class Origen(BaseHTTPRequestHandler):
+            def do_GET(self):
+                pedidos.append(self.path)
+                if self.path == '/redirige':
+                    self.send_response(302)
+                    self.send_header('Location', 'ftp://10.0.0.1/x.png')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(PNG_FALSO)
+
+            def log_message(self, *args):
+                pass
+
+        servidor = HTTPServer(('127.0.0.1', 0), Origen)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        base = f'http://127.0.0.1:{servidor.server_port}'
+
+        with self.assertRaisesMessage(imagenes.ErrorImagen, 'no pública'):
+            imagenes.descargar_http(f'{base}/x.png')
+        with self.assertRaisesMessage(imagenes.ErrorImagen, 'esquema'):
+            imagenes.descargar_http('file:///etc/passwd')
+        self.assertEqual(pedidos, [])  # ni siquiera llegó el GET
+
+        # las redirecciones también se revisan
+        with mock.patch.object(imagenes, '_ip_publica', return_value=True):
+            self.assertEqual(imagenes.descargar_http(f'{base}/x.png'), PNG_FALSO)
+            with self.assertRaisesMessage(imagenes.ErrorImagen, 'redirección no permitida'):
+                imagenes.descargar_http(f'{base}/redirige')
+
+    def test_podar_borra_las_menos_usadas(self):
+        viejas = []
+        for i in range(4):
+            destino = imagenes.ruta(imagenes.clave_url(f'https://x/{i}.png'))
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            destino.write_bytes(b'x' * 100)
+            os.utime(destino, (1000 + i, 1000 + i))
+            viejas.append(destino)
+        self.assertEqual(imagenes.podar(1000), (0, 0))
+        self.assertEqual(imagenes.podar(250), (2, 200))
+        self.assertEqual([d.exists() for d in viejas], [False, False, True, True])
+
+
+@override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+class MetricasTests(TestCase):
+    """Con el modo estricto, pasarse del @presupuesto_consultas de una vista falla el test."""
+
+    def setUp(self):
+        cache.clear()
+        metricas.registro.limpiar()
+        for nombre in ('Lider', 'Jumbo', 'Tottus', 'Unimarc'):
+            crear_supermercado_con_productos(nombre, n=12, imagen_url='https://cdn.example/a.png')
+        self.user = crear_usuario('ana')
+        self.client.force_login(self.user)
+        self.productos = list(Producto.objects.order_by('pk'))
+        # varias cotizaciones guardadas: mis_cotizaciones no debe crecer con ellas
+        for inicio in (0, 10, 20):
+            for p in self.productos[inicio:inicio + 10]:
+                carrito.agregar_item(self.user, p, 2)
+            Cotizacion.objects.filter(usuario=self.user, status='open').update(status='saved')
+        carrito.agregar_item(self.user, self.productos[40], 1)
+
+    def test_vistas_dentro_del_presupuesto(self):
+        item = CotizacionItem.objects.get(cotizacion__status='open')
+        self.client.get(reverse('comparador'))
+        self.client.get(reverse('productos_por_categoria', args=['arroz']))
+        self.client.get(reverse('buscar_productos'), {'q': 'arroz'})
+        self.client.get(reverse('ver_cotizacion'))
+        self.client.get(reverse('mis_cotizaciones'))
+        self.client.post(reverse('agregar_cotizacion'), {'product_id': self.productos[41].pk})
+        self.client.post(reverse('agregar_cotizacion'), {'product_id': self.productos[41].pk, 'cantidad': 2})
+        self.client.post(reverse('actualizar_item'), {'item_id': item.pk, 'cantidad': 5})
+        self.client.post(reverse('eliminar_item'), {'item_id': item.pk})
+        self.assertEqual(Cotizacion.objects.get(status='open').total, self.productos[41].precio * 3)
+
+    def test_presupuesto_excedido(self):
+        with mock.patch.object(views.comparador_view, 'presupuesto_consultas', 0):
+            with self.assertRaises(metricas.PresupuestoExcedido):
+                self.client.get(reverse('comparador'))
+            with self.settings(METRICAS_PRESUPUESTO_ESTRICTO=False), self.assertLogs('tucanasta.metricas', 'WARNING'):
+                self.assertEqual(self.client.get(reverse('comparador')).status_code, 200)
+
+    @override_settings(METRICAS_SERVER_TIMING=True, METRICAS_TOKEN='secreto')
+    def test_server_timing_y_prometheus(self):
+        resp = self.client.get(reverse('mis_cotizaciones'))
+        self.assertRegex(resp['Server-Timing'], r'^sql;dur=[\d.]+;desc="5 consultas", plantilla;dur=[\d.]+, total;dur=[\d.]+$')
+
+        self.client.logout()
+        url = reverse('metricas')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+        texto = self.client.get(url, HTTP_AUTHORIZATION='Bearer secreto').content.decode()
+        self.assertIn('tucanasta_requests_total{vista="mis_cotizaciones",estado="200"} 1', texto)
+        self.assertIn('tucanasta_sql_consultas_total{vista="mis_cotizaciones"} 5', texto)
+        self.assertIn('tucanasta_request_segundos_count{vista="mis_cotizaciones"} 1', texto)
+        plantilla = next(l for l in texto.splitlines() if l.startswith('tucanasta_plantilla_segundos_total{vista="mis_cotizaciones"}'))
+        self.assertGreater(float(plantilla.split()[-1]), 0)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_y_benchmark(self):
+        salida = StringIO()
+        call_command('seed_benchmark', '--supermercados', '2', '--productos', '30', '--usuarios', '2',
+                     '--guardadas', '1', '--items', '5', stdout=salida)
+        self.assertEqual(Supermercado.objects.filter(nombre__startswith='Bench ').count(), 2)
+        self.assertEqual(Cotizacion.objects.filter(usuario__username='bench_0').count(), 2)
+        cot = Cotizacion.objects.filter(usuario__username='bench_0', status='saved').get()
+        self.assertEqual(cot.cantidad_items, 5)
+        self.assertGreater(cot.total, 0)
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = Path(carpeta) / 'bench.json'
+            call_command('benchmark', '--iteraciones', '2', '--calentamiento', '0', '--host', 'testserver',
+                         '--salida', str(ruta), stdout=StringIO())
+            informe = json.loads(ruta.read_text(encoding='utf-8'))
+            call_command('benchmark', '--iteraciones', '1', '--calentamiento', '0', '--host', 'testserver',
+                         '--escenario', 'producto', '--salida', str(ruta), '--comparar', str(ruta), stdout=salida)
+        self.assertEqual(informe['usuario'], 'bench_0')
+        self.assertIn('carrito_agregar', informe['escenarios'])
+        for nombre, r in informe['escenarios'].items():
+            self.assertEqual(r['errores'], 0, nombre)
+            self.assertLessEqual(r['p50_ms'], r['p95_ms'])
+        self.assertIn('vs ', salida.getvalue())
+
+        call_command('seed_benchmark', '--limpiar', '--supermercados', '1', '--productos', '5', '--usuarios', '1',
+                     '--sin-agrupar', stdout=StringIO())
+        self.assertEqual(Supermercado.objects.filter(nombre__startswith='Bench ').count(), 1)
+        self.assertEqual(Usuario.objects.filter(username__startswith='bench_').count(), 1)
+
+
+@override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+class CarritoLoteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = crear_usuario()
+        self.client.force_login(self.user)
+        s = crear_supermercado_con_productos('Lider', n=40)
+        self.productos = list(s.productos.order_by('pk'))
+        self.url = reverse('carrito_lote')
+
+    def lote(self, operaciones):
+        return self.client.post(self.url, json.dumps({'operaciones': operaciones}), content_type='application/json')
+
+    def test_canasta_de_40_en_una_request(self):
+        ops = [{'op': 'agregar', 'producto_id': p.pk, 'cantidad': 2} for p in self.productos]
+        ops.append({'op': 'agregar', 'producto_id': self.productos[0].pk})  # suma
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.lote(ops).json()
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 9)
+        self.assertEqual(resp['count'], 40)
+        self.assertEqual(len(resp['items']), 40)
+        esperado = sum(2 * p.precio for p in self.productos) + self.productos[0].precio
+        self.assertEqual(Decimal(str(resp['total'])), esperado)
+        self.assertEqual(CotizacionItem.objects.get(producto=self.productos[0]).cantidad, 3)
+
+    def test_actualizar_y_eliminar(self):
+        a = carrito.agregar_item(self.user, self.productos[0], 1)['item_id']
+        b = carrito.agregar_item(self.user, self.productos[1], 1)['item_id']
+        c = carrito.agregar_item(self.user, self.productos[2], 1)['item_id']
+        ajeno = carrito.agregar_item(crear_usuario('otro'), self.productos[3], 1)['item_id']
+
+        resp = self.lote([
+            {'op': 'actualizar', 'item_id': a, 'cantidad': 2},
+            {'op': 'actualizar', 'item_id': a, 'cantidad': 5},  # la última gana
+            {'op': 'actualizar', 'item_id': b, 'cantidad': 0},  # 0 elimina
+            {'op': 'eliminar', 'item_id': c},
+            {'op': 'eliminar', 'item_id': ajeno},
+            {'op': 'agregar', 'producto_id': 999999},
+        ]).json()
+        self.assertEqual(resp['total'], float(self.productos[0].precio * 5))
+        self.assertEqual([(it['pk'], it['cantidad']) for it in resp['items']], [(a, 5)])
+        self.assertEqual(resp['omitidos'], [
+            {'op': 'agregar', 'producto_id': 999999},
+            {'op': 'eliminar', 'item_id': ajeno},
+        ])
+        self.assertTrue(CotizacionItem.objects.filter(pk=ajeno).exists())
+        cot = Cotizacion.objects.get(usuario=self.user)
+        self.assertEqual((cot.total, cot.cantidad_items), (self.productos[0].precio * 5, 1))
+
+    def test_peticiones_invalidas(self):
+        self.assertEqual(self.client.post(self.url, 'no es json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.lote([]).status_code, 400)
+        resp = self.lote([{'op': 'agregar', 'producto_id': self.productos[0].pk}, {'op': 'vaciar'}])
+        self.assertEqual(resp.json()['error'], 'operación 1 inválida')
+        self.assertEqual(self.lote([{'op': 'agregar', 'producto_id': 1, 'cantidad': 0}]).status_code, 400)
+        self.assertFalse(CotizacionItem.objects.exists())
+
+
+@override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+class RepetirCotizacionTests(TestCase):
+
+    def setUp(self):
+        self.user = crear_usuario()
+        self.client.force_login(self.user)
+        s = crear_supermercado_con_productos('Lider', n=100)
+        self.productos = list(s.productos.order_by('pk'))
+        with transaction.atomic():
+            carrito.aplicar_lote(self.user, {p.pk: 2 for p in self.productos}, {}, set())
+        self.guardada = Cotizacion.objects.get(usuario=self.user)
+        Cotizacion.objects.filter(pk=self.guardada.pk).update(status='saved')
+        self.url = reverse('repetir_cotizacion')
+
+    def test_repite_con_precios_actuales_en_pocas_consultas(self):
+        Producto.objects.filter(pk=self.productos[0].pk).update(precio=Decimal('1500'))
+        Producto.objects.filter(pk=self.productos[1].pk).update(disponible=False)
+        total_anterior = Cotizacion.objects.get(pk=self.guardada.pk).total
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(self.url, {'cot_id': self.guardada.pk}).json()
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 8)
+
+        self.assertEqual(resp['count'], 99)
+        self.assertEqual(resp['total_anterior'], float(total_anterior))
+        self.assertEqual(resp['no_disponibles'], [{'producto_id': self.productos[1].pk, 'nombre': self.productos[1].nombre}])
+        nueva = Cotizacion.objects.get(pk=resp['cotizacion_id'], status='open')
+        self.assertNotEqual(nueva.pk, self.guardada.pk)
+        self.assertEqual(nueva.items.get(producto=self.productos[0]).precio_unidad, Decimal('1500'))
+        self.assertEqual(nueva.total, total_anterior - 2 * self.productos[0].precio + 2 * 1500 - 2 * self.productos[1].precio)
+
+        # la guardada queda intacta
+        self.assertEqual(Cotizacion.objects.get(pk=self.guardada.pk).status, 'saved')
+        self.assertEqual(self.guardada.items.get(producto=self.productos[0]).precio_unidad, self.productos[0].precio)
+
+    def test_carrito_con_items_pasa_a_guardado(self):
+        carrito.agregar_item(self.user, self.productos[5], 1)
+        abierta = Cotizacion.objects.get(usuario=self.user, status='open')
+        resp = self.client.post(self.url, {'cot_id': self.guardada.pk}).json()
+        self.assertNotEqual(resp['cotizacion_id'], abierta.pk)
+        self.assertEqual(Cotizacion.objects.get(pk=abierta.pk).status, 'saved')
+        self.assertEqual(Cotizacion.objects.filter(usuario=self.user, status='open').count(), 1)
+
+    def test_no_se_repite_ajena_ni_abierta(self):
+        otro = crear_usuario('otro')
+        self.client.force_login(otro)
+        self.assertEqual(self.client.post(self.url, {'cot_id': self.guardada.pk}).status_code, 404)
+        self.client.force_login(self.user)
+        abierta = carrito.cotizacion_abierta(self.user)
+        self.assertEqual(self.client.post(self.url, {'cot_id': abierta.pk}).status_code, 404)
+        self.assertEqual(self.client.post(self.url, {'cot_id': 'x'}).status_code, 400)
+
+
+class PrecioPorUnidadTests(TestCase):
+
+    def setUp(self):
+        self.lider = Supermercado.objects.create(nombre='Lider')
+        self.jumbo = Supermercado.objects.create(nombre='Jumbo')
+        self.kilo = Producto.objects.create(nombre='Arroz Tucapel 1kg', tipo='arroz', supermercado=self.lider, precio=1390)
+        self.cinco = Producto.objects.create(nombre='Arroz Tucapel 5kg', tipo='arroz', supermercado=self.jumbo, precio=5990)
+        self.sin = Producto.objects.create(nombre='Arroz a granel', tipo='arroz', supermercado=self.jumbo, precio=990)
+        self.chico = Producto.objects.create(
+            nombre='Arroz Preparado Chaufan', descripcion='Bolsa 210 g', tipo='arroz', supermercado=self.lider, precio=1150,
+        )
+
+    def test_contenido_y_precio_por_unidad(self):
+        for p in (self.kilo, self.cinco, self.sin, self.chico):
+            p.refresh_from_db()
+        self.assertEqual((self.kilo.contenido, self.kilo.unidad), (Decimal('1000'), 'g'))
+        self.assertEqual(self.kilo.precio_por_unidad, Decimal('1390'))
+        self.assertEqual(self.cinco.precio_por_unidad, Decimal('1198'))
+        self.assertEqual(self.chico.precio_por_unidad, Decimal('5476.19'))  # de la descripción, redondeado en la BD
+        self.assertEqual(self.kilo.unidad_precio, 'kg')
+        self.assertIsNone(self.sin.contenido)
+        self.assertIsNone(self.sin.precio_por_unidad)
+
+        # la BD lo recalcula aunque el precio cambie con UPDATE
+        Producto.objects.filter(pk=self.cinco.pk).update(precio=4990)
+        self.cinco.refresh_from_db()
+        self.assertEqual(self.cinco.precio_por_unidad, Decimal('998'))
+
+        # save(update_fields) con el nombre también guarda el contenido nuevo
+        self.kilo.nombre = 'Arroz Tucapel 2kg'
+        self.kilo.save(update_fields=['nombre'])
+        self.kilo.refresh_from_db()
+        self.assertEqual(self.kilo.contenido, Decimal('2000'))
+        self.assertEqual(self.kilo.precio_por_unidad, Decimal('695'))
+
+    def test_form_no_expone_contenido(self):
+        form = PymeProductForm(
+            {'nombre': 'Arroz Tucapel 2kg', 'tipo': 'arroz', 'precio': '2000', 'moneda': 'CLP', 'contenido': '1', 'unidad': 'u'},
+            instance=self.kilo,
+        )
+        self.assertNotIn('contenido', form.fields)
+        self.assertNotIn('unidad', form.fields)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.kilo.refresh_from_db()
+        self.assertEqual((self.kilo.contenido, self.kilo.unidad), (Decimal('2000'), 'g'))
+        self.assertEqual(self.kilo.precio_por_unidad, Decimal('1000'))
+
+    def test_importacion_completa_contenido(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = Path(carpeta) / 'feed.csv'
+            ruta.write_text('sku,nombre,tipo,precio\nL1,Leche entera 1 L,leche,1090\nL2,Leche 6 x 200 ml,leche,2400\n', encoding='utf-8')
+            call_command('import_catalog', str(ruta), '--supermercado', 'Lider', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            dict(Producto.objects.filter(tipo='leche').values_list('codigo_interno', 'precio_por_unidad')),
+            {'L1': Decimal('1090'), 'L2': Decimal('2000')},
+        )
+
+    def test_categoria_ordena_y_filtra_por_precio_por_unidad(self):
+        orden = [self.cinco.pk, self.kilo.pk, self.chico.pk, self.sin.pk]  # sin contenido al final
+        filas, siguiente = paginacion.pagina(Producto.objects.all(), 'precio_unidad_asc')
+        self.assertEqual([f['id'] for f in filas], orden)
+        self.assertEqual(filas[0]['unidad_precio'], 'kg')
+
+        # el cursor recorre el mismo orden, cruzando a los NULL
+        vistos, cursor = [], None
+        while True:
+            filas, cursor = paginacion.pagina(Producto.objects.all(), 'precio_unidad_asc', cursor, por_pagina=1)
+            vistos += [f['id'] for f in filas]
+            if cursor is None:
+                break
+        self.assertEqual(vistos, orden)
+
+        url = reverse('productos_por_categoria', args=['arroz'])
+        resp = self.client.get(url, {'ordenar': 'precio_unidad_asc', 'precio_unidad_max': '1500', 'unidad': 'g'})
+        self.assertEqual([p['id'] for p in resp.context['productos']], [self.cinco.pk, self.kilo.pk])
+        self.assertEqual(resp.context['total'], 2)
+        self.assertContains(resp, '$1198/kg')
+
+    def test_detalle_compara_por_unidad(self):
+        grupo = GrupoProducto.objects.create(clave='x' * 40, tipo='arroz')
+        Producto.objects.filter(pk__in=[self.kilo.pk, self.cinco.pk, self.sin.pk]).update(grupo=grupo)
+        resp = self.client.get(reverse('producto_detalle', args=[self.kilo.pk]))
+        self.assertEqual([p.pk for p in resp.context['similares']], [self.cinco.pk, self.kilo.pk, self.sin.pk])
+        self.assertContains(resp, '$1198 por kg')
@@ -1,17 +1,23 @@
+import hmac
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login, authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.views.decorators.http import require_POST
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST
 from .models import Producto, Supermercado
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseRedirect
 from django.contrib.auth import update_session_auth_hash
 from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
 from .forms import CustomUserCreationForm
 from django.utils import timezone
+from datetime import timedelta
 from django.core.mail import send_mail
 from .forms import UserUpdateForm, SimplePasswordChangeForm
 # importa modelos (incluye Cotizacion y CotizacionItem)
@@ -25,13 +31,25 @@ from .forms import PymeRegistrationForm, PymeProductForm
 from .models import Pyme, Supermercado, Producto
 from django.shortcuts import redirect
 from django.conf import settings
+from . import busqueda, carrito, documentos, imagenes, metricas, paginacion, revision, tareas
+from .documentos import LimiteDocumentoHandler
+from .cache_paginas import cache_anonimo, fragmento
+from .metricas import presupuesto_consultas
+from .precios import serie_precios
+from .optimizador import optimizar_cacheado
+from .catalogo import (
+    ORDEN_SIMILARES, PLACEHOLDER_IMG, filtrar_por_tipo, productos_de_categoria, productos_recientes_por_supermercado,
+    similares_a, tipos_catalogo,
+)
+from .facetas import calcular_facetas
 
 # --- agregar_cotizacion ---
 
 def get_or_create_open_cotizacion(user):
-    cot, created = Cotizacion.objects.get_or_create(usuario=user, status='open')
-    return cot
+    return carrito.cotizacion_abierta(user)
 
+# 5 con el carrito ya creado; el primer producto además crea la cotización
+@presupuesto_consultas(6)
 @login_required
 @require_POST
 def agregar_cotizacion(request, producto_id=None):
@@ -48,33 +66,27 @@ def agregar_cotizacion(request, producto_id=None):
 
     if not product_id:
         return JsonResponse({'ok': False, 'error': 'product_id faltante'}, status=400)
+    if cantidad < 1:
+        return JsonResponse({'ok': False, 'error': 'cantidad inválida'}, status=400)
 
-    producto = get_object_or_404(Producto, pk=product_id)
-
-    cot = get_or_create_open_cotizacion(request.user)
+    producto = get_object_or_404(Producto.objects.only('pk', 'nombre', 'precio'), pk=product_id)
 
-    item, created = CotizacionItem.objects.get_or_create(
-        cotizacion=cot,
-        producto=producto,
-        defaults={'cantidad': cantidad, 'precio_unidad': producto.precio}
-    )
-
-    if not created:
-        item.cantidad = item.cantidad + cantidad
-        item.precio_unidad = producto.precio
-        item.save()
+    # upsert atómico: clics simultáneos suman, no se pisan
+    r = carrito.agregar_item(request.user, producto, cantidad)
 
     return JsonResponse({
         'ok': True,
-        'item_id': item.pk,
+        'item_id': r['item_id'],
         'producto': producto.nombre,
-        'cantidad': item.cantidad,
-        'subtotal': item.subtotal,
-        'total': cot.total
+        'cantidad': r['cantidad'],
+        'subtotal': r['subtotal'],
+        'total': float(r['total']),
+        'count': r['count'],
     })
 
 
 # 2) Ver cotización (pantalla)
+@presupuesto_consultas(6)
 @login_required
 def ver_cotizacion(request):
     cot = get_or_create_open_cotizacion(request.user)
@@ -83,42 +95,92 @@ def ver_cotizacion(request):
     # pasar también el total
     total = cot.total
 
+    # Dónde conviene comprar: con muchas tiendas el optimizador pasa a greedy
+    # y el resultado es aproximado (optimizacion.dividida.exacto es False).
+    # Se cachea por versión del carrito y del catálogo (optimizar_cacheado).
     return render(request, 'cotizacion.html', {
         'cotizacion': cot,
         'items': items,
         'total': total,
+        'optimizacion': optimizar_cacheado(cot, max_tiendas=2) if cot.cantidad_items else None,
     })
 
 
+# 2b) Dónde conviene comprar la cotización (AJAX GET)
+@login_required
+def optimizar_cotizacion_view(request):
+    try:
+        k = int(request.GET.get('k', 2))
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'k inválido'}, status=400)
+    if not 1 <= k <= 5:
+        return JsonResponse({'ok': False, 'error': 'k debe estar entre 1 y 5'}, status=400)
+    cot = get_or_create_open_cotizacion(request.user)
+    return JsonResponse({'ok': True, **optimizar_cacheado(cot, max_tiendas=k)})
+
+
 # 3) Actualizar cantidad (AJAX POST)
+@presupuesto_consultas(4)
 @login_required
 @require_POST
 def actualizar_item(request):
     item_id = request.POST.get('item_id')
-    cantidad = int(request.POST.get('cantidad', 1))
-    item = get_object_or_404(CotizacionItem, pk=item_id, cotizacion__usuario=request.user)
-    if cantidad <= 0:
-        item.delete()
-        msg = 'deleted'
-    else:
-        item.cantidad = cantidad
-        item.save()
-        msg = 'updated'
-    # recompute total
-    total = item.cotizacion.total if hasattr(item, 'cotizacion') else 0
-    return JsonResponse({'ok': True, 'msg': msg, 'total': total})
+    try:
+        cantidad = int(request.POST.get('cantidad', 1))
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'cantidad inválida'}, status=400)
+    resultado = carrito.actualizar_cantidad(request.user, item_id, cantidad)
+    if resultado is None:
+        return JsonResponse({'ok': False, 'error': 'item no encontrado'}, status=404)
+    msg, total, count = resultado
+    return JsonResponse({'ok': True, 'msg': msg, 'total': float(total), 'count': count})
 
 
 # 4) Eliminar item (AJAX POST)
+@presupuesto_consultas(4)
 @login_required
 @require_POST
 def eliminar_item(request):
-    item_id = request.POST.get('item_id')
-    item = get_object_or_404(CotizacionItem, pk=item_id, cotizacion__usuario=request.user)
-    cot = item.cotizacion
-    item.delete()
-    return JsonResponse({'ok': True, 'total': cot.total})
+    resultado = carrito.eliminar_item(request.user, request.POST.get('item_id'))
+    if resultado is None:
+        return JsonResponse({'ok': False, 'error': 'item no encontrado'}, status=404)
+    total, count = resultado
+    return JsonResponse({'ok': True, 'total': float(total), 'count': count})
+
+
 
+# 4b) Varios cambios del carrito en una request (AJAX POST JSON)
+@presupuesto_consultas(9)
+@login_required
+@require_POST
+def carrito_lote(request):
+    """
+    POST /cotizacion/lote/
+    {"operaciones": [{"op": "agregar", "producto_id": 1, "cantidad": 2},
+                     {"op": "actualizar", "item_id": 5, "cantidad": 3},
+                     {"op": "eliminar", "item_id": 7}]}
+    Responde el carrito completo una sola vez.
+    """
+    try:
+        datos = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'petición inválida'}, status=400)
+    try:
+        operaciones = carrito.leer_operaciones(datos.get('operaciones') if isinstance(datos, dict) else None)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+
+    r = carrito.aplicar_lote(request.user, *operaciones)
+    # ya invalidado al confirmar: se recalcula y queda en cache para el mini-carrito
+    resumen = carrito.resumen_carrito(request.user.pk)
+    return JsonResponse({
+        'ok': True,
+        'cotizacion_id': r['cotizacion_id'],
+        'total': float(r['total']),
+        'count': r['count'],
+        'items': resumen['items'],
+        'omitidos': r['omitidos'],
+    })
 
 # 5) Guardar cotización (cambiar status a 'saved')
 @login_required
@@ -141,6 +203,7 @@ def guardar_cotizacion(request):
 
 
 # Lista de cotizaciones del usuario (guardadas / abiertas / enviadas)
+@presupuesto_consultas(5)
 @login_required
 def mis_cotizaciones(request):
     cotizaciones = (
@@ -167,6 +230,28 @@ def reabrir_cotizacion(request):
     return JsonResponse({'ok': True, 'cotizacion_id': cot.pk})
 
 
+
+# Repetir una cotización guardada como carrito nuevo, con precios actuales
+@presupuesto_consultas(8)
+@login_required
+@require_POST
+def repetir_cotizacion(request):
+    try:
+        cot_id = int(request.POST.get('cot_id'))
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'cot_id inválido'}, status=400)
+    r = carrito.repetir_cotizacion(request.user, cot_id)
+    if r is None:
+        return JsonResponse({'ok': False, 'error': 'cotización no encontrada'}, status=404)
+    return JsonResponse({
+        'ok': True,
+        'cotizacion_id': r['cotizacion_id'],
+        'total': float(r['total']),
+        'total_anterior': float(r['total_anterior']),
+        'count': r['count'],
+        'no_disponibles': r['no_disponibles'],
+    })
+
 # Eliminar cotización completa
 @login_required
 @require_POST
@@ -183,7 +268,7 @@ def ajustes(request):
     """
     Página de ajustes:
     - maneja update de perfil y cambio de contraseña
-    - prepara cotizacion y cot_items para el mini-cart (igual que en comparador_view)
+    - el mini-cart (cotizacion, cot_items) lo agrega context_processors.mini_carrito
     """
     user = request.user
 
@@ -215,19 +300,9 @@ def ajustes(request):
         profile_form = UserUpdateForm(instance=user)
         password_form = SimplePasswordChangeForm(user=user)
 
-    # --- preparar mini-cart: cotizacion abierta y items (igual que en comparador_view) ---
-    cot = None
-    cot_items = []
-    if request.user.is_authenticated:
-        cot = Cotizacion.objects.filter(usuario=request.user, status='open').prefetch_related('items__producto', 'items__producto__supermercado').first()
-        if cot:
-            cot_items = list(cot.items.select_related('producto', 'producto__supermercado').all())
-
     context = {
         'profile_form': profile_form,
         'password_form': password_form,
-        'cotizacion': cot,
-        'cot_items': cot_items,
     }
     return render(request, 'ajustes.html', context)
 
@@ -253,18 +328,12 @@ def pyme_ingresar(request):
     - Permite seleccionar supermercado existente o crear uno nuevo (new_supermercado_name).
     - Requiere login.
     """
-    # preparar mini-cart (igual que en otras vistas para mantener consistencia UI)
-    cot = None
-    cot_items = []
-    if request.user.is_authenticated:
-        cot = Cotizacion.objects.filter(usuario=request.user, status='open').prefetch_related('items__producto').first()
-        if cot:
-            cot_items = list(cot.items.select_related('producto', 'producto__supermercado').all())
-
     if request.method == "POST":
-        form = PymeProductForm(request.POST)
         new_super_name = request.POST.get('new_supermercado_name', '').strip()
         new_super_url = request.POST.get('new_supermercado_url', '').strip()
+        # si la tienda ya existe, el form revisa que el código no esté repetido en ella
+        existente = Supermercado.objects.filter(nombre=new_super_name).first() if new_super_name else None
+        form = PymeProductForm(request.POST, supermercado=existente)
 
         # Validamos que haya supermercado seleccionado o uno nuevo
         if not form.cleaned_data if not form.is_bound else False:
@@ -296,16 +365,23 @@ def pyme_ingresar(request):
 
     context = {
         'form': form,
-        'cotizacion': cot,
-        'cot_items': cot_items,
     }
     return render(request, 'pyme_ingresar.html', context)
 
 
 
 
+@csrf_exempt
 @login_required
 def pyme_registro(request):
+    # el límite de tamaño se aplica mientras llega el archivo; el handler debe
+    # instalarse antes de que se lea request.POST, y CsrfViewMiddleware lo lee
+    request.upload_handlers.insert(0, LimiteDocumentoHandler(request))
+    return _pyme_registro(request)
+
+
+@csrf_protect
+def _pyme_registro(request):
     # si ya tiene pyme, redirige al dashboard
     if hasattr(request.user, 'pyme'):
         messages.info(request, "Ya tienes una cuenta Pyme. Accediendo al panel.")
@@ -313,6 +389,9 @@ def pyme_registro(request):
 
     if request.method == 'POST':
         form = PymeRegistrationForm(request.POST, request.FILES)
+        if getattr(request, 'documento_excedido', False):
+            form.is_valid()
+            form.errors['documento'] = form.error_class([documentos.mensaje_excedido()])
         if form.is_valid():
             pyme = form.save(commit=False)
             pyme.user = request.user
@@ -325,6 +404,11 @@ def pyme_registro(request):
             pyme.approved = False
             # guardar documento si subido (form ya lo maneja)
             pyme.save()
+            if pyme.documento:
+                # revisar el documento y avisar al staff fuera de la request
+                tareas.encolar(
+                    'procesar_documento_pyme', clave=f'documento-pyme:{pyme.pk}:{pyme.documento.name}', pyme_id=pyme.pk,
+                )
             messages.success(request, "Registro Pyme creado. Tu tienda quedó pendiente de revisión.")
             return redirect('pyme_dashboard')
         else:
@@ -333,16 +417,10 @@ def pyme_registro(request):
     else:
         form = PymeRegistrationForm()
 
+    return render(request, 'pyme_registro.html', {'form': form})
+
 @login_required
 def pyme_dashboard(request):
-    # preparar mini-cart (si quieres mantener coherencia con header)
-    cot = None
-    cot_items = []
-    if request.user.is_authenticated:
-        cot = Cotizacion.objects.filter(usuario=request.user, status='open').prefetch_related('items__producto').first()
-        if cot:
-            cot_items = list(cot.items.select_related('producto', 'producto__supermercado').all())
-
     # asegurar que la cuenta pyme exista
     pyme = getattr(request.user, 'pyme', None)
     if not pyme:
@@ -352,7 +430,7 @@ def pyme_dashboard(request):
     productos = Producto.objects.filter(supermercado=pyme.supermercado).order_by('-fecha_actualizacion')
 
     if request.method == 'POST':
-        form = PymeProductForm(request.POST)
+        form = PymeProductForm(request.POST, supermercado=pyme.supermercado)
         if form.is_valid():
             producto = form.save(commit=False)
             # precio viene limpio desde form.cleaned_data['precio'] (float)
@@ -374,8 +452,6 @@ def pyme_dashboard(request):
         'pyme': pyme,
         'form': form,
         'productos': productos,
-        'cotizacion': cot,
-        'cot_items': cot_items,
     }
     return render(request, 'pyme_dashboard.html', context)
 
@@ -384,12 +460,13 @@ def pyme_dashboard(request):
 
 
 # 🏠 Página de inicio
+@cache_anonimo
 def index(request):
     return render(request, 'index.html')
 
 # 💬 Vista básica de comparador
 def comparador(request):
-    tipos = Producto.objects.values_list('tipo', flat=True).distinct().order_by('tipo')
+    tipos = tipos_catalogo()
     return render(request, 'comparador.html', {'tipos': tipos})
 
 # 🧾 Registro de usuarios
@@ -439,53 +516,110 @@ def login_view(request):
     return render(request, "login.html", context)
 
 # 🛒 Vista principal con productos por supermercado
+@presupuesto_consultas(6)
+@cache_anonimo
 def comparador_view(request):
-    supermercados = Supermercado.objects.all().order_by('nombre')
+    # top 10 por supermercado en una sola consulta (ver catalogo.py); con
+    # sesión se cachean sólo los datos, el carrito lo pone mini_carrito
+    data_supermercados = fragmento(request, 'comparador', lambda: productos_recientes_por_supermercado(limite=10))
 
-    data_supermercados = []
-    for s in supermercados:
-        productos = (
-            Producto.objects.filter(supermercado=s, disponible=True)
-            .order_by('-fecha_actualizacion')[:10]
-        )
-        for p in productos:
-            if not p.imagen_url:
-                p.imagen_url = "/static/img/placeholder.png"
-
-        data_supermercados.append({
-            "supermercado": s,
-            "productos": productos,
-        })
-
-    tipos = Producto.objects.values_list('tipo', flat=True).distinct().order_by('tipo')
-
-    # --- NUEVO: obtener cotización abierta si el usuario está autenticado ---
-    cot = None
-    cot_items = []
-    if request.user.is_authenticated:
-        cot = Cotizacion.objects.filter(usuario=request.user, status='open').prefetch_related('items__producto').first()
-        if cot:
-            cot_items = list(cot.items.select_related('producto', 'producto__supermercado').all())
+    tipos = tipos_catalogo()
 
     return render(request, 'comparador.html', {
         "data_supermercados": data_supermercados,
         "tipos": tipos,
-        "cotizacion": cot,
-        "cot_items": cot_items,
     })
     
     
+# 🔍 Búsqueda full-text (JSON paginado)
+@presupuesto_consultas(3)
+def buscar_productos(request):
+    """
+    GET /buscar/?q=aceite&pagina=1&por_pagina=20
+    Busca en nombre, marca, descripción y tipo (ver busqueda.py).
+    """
+    q = request.GET.get('q', '').strip()
+    try:
+        pagina = max(1, int(request.GET.get('pagina', 1)))
+        por_pagina = min(50, max(1, int(request.GET.get('por_pagina', 20))))
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'pagina/por_pagina inválidos'}, status=400)
+
+    ids, total = busqueda.buscar(q, offset=(pagina - 1) * por_pagina, limite=por_pagina)
+    productos = Producto.objects.select_related('supermercado').in_bulk(ids)
+
+    resultados = []
+    for pk in ids:
+        p = productos.get(pk)
+        if p is None:
+            continue
+        resultados.append({
+            'id': p.pk,
+            'nombre': p.nombre,
+            'marca': p.marca,
+            'tipo': p.tipo,
+            'precio': float(p.precio),
+            'moneda': p.moneda,
+            'supermercado': p.supermercado.nombre,
+            'imagen_url': p.imagen_url or PLACEHOLDER_IMG,
+            'url': reverse('producto_detalle', args=[p.pk]),
+        })
+
+    return JsonResponse({
+        'ok': True,
+        'q': q,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': total,
+        'resultados': resultados,
+    })
+
+
+# 📈 Historial de precios de un producto (sparkline)
+def historial_precios(request, producto_id):
+    """
+    GET /producto/<id>/precios/?dias=90
+    Serie [dia, precio] para dibujar un sparkline; incluye el precio vigente
+    al inicio del rango.
+    """
+    get_object_or_404(Producto.objects.only('id'), pk=producto_id)
+    try:
+        dias = min(3650, max(1, int(request.GET.get('dias', 90))))
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'dias inválido'}, status=400)
+
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=dias)
+    puntos = serie_precios(producto_id, desde, hasta)
+    precios = [float(precio) for _, precio in puntos]
+
+    return JsonResponse({
+        'ok': True,
+        'producto_id': producto_id,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'puntos': [[dia.isoformat(), float(precio)] for dia, precio in puntos],
+        'min': min(precios) if precios else None,
+        'max': max(precios) if precios else None,
+        'variacion': precios[-1] - precios[0] if precios else None,
+    })
+
+
 # 📦 Productos por categoría
 def productos_por_categoria(request, tipo):
-    productos = Producto.objects.filter(tipo__iexact=tipo).order_by('nombre', 'supermercado__nombre')
-    tipos = Producto.objects.values_list('tipo', flat=True).distinct().order_by('tipo')
+    productos = filtrar_por_tipo(Producto.objects.all(), tipo).order_by('nombre', 'supermercado__nombre')
+    tipos = tipos_catalogo()
     return render(request, 'productos_categoria.html', {'tipo': tipo, 'productos': productos, 'tipos': tipos})
 
 # 🔍 Detalle de producto con comparación de precios
+@cache_anonimo
 def producto_detalle(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
-    similares = Producto.objects.filter(nombre__icontains=producto.nombre, tipo=producto.tipo).order_by('precio')
-    tipos = Producto.objects.values_list('tipo', flat=True).distinct().order_by('tipo')
+    def calcular():
+        producto = get_object_or_404(Producto, id=producto_id)
+        return producto, list(similares_a(producto).select_related('supermercado').order_by(*ORDEN_SIMILARES))
+
+    producto, similares = fragmento(request, 'producto', calcular)
+    tipos = tipos_catalogo()
     return render(request, 'producto_detalle.html', {
         'producto': producto,
         'similares': similares,
@@ -495,99 +629,69 @@ def producto_detalle(request, producto_id):
 
 
 # 📦 Productos por categoría con filtros y ordenamiento
+# con el cache de catálogo frío (tras guardar un producto) son 2 más
+@presupuesto_consultas(7)
+@cache_anonimo
 def productos_por_categoria(request, tipo):
-    # Filtrar productos por categoría
-    productos = Producto.objects.filter(tipo__iexact=tipo, disponible=True)
-    tipos = Producto.objects.values_list('tipo', flat=True).distinct().order_by('tipo')
-    # Filtros GET
-    q = request.GET.get('q')
-    ordenar = request.GET.get('ordenar')
-    marca_filtro = request.GET.getlist('marca')
-    tienda_filtro = request.GET.getlist('tienda')
-
-    # Búsqueda
-    if q:
-        productos = productos.filter(nombre__icontains=q)
-
-    # Filtrar por marca
-    if marca_filtro:
-        productos = productos.filter(marca__in=marca_filtro)
-
-    # Filtrar por tienda
-    if tienda_filtro:
-        productos = productos.filter(supermercado__nombre__in=tienda_filtro)
-
-    # Ordenar resultados
-    if ordenar == "precio_asc":
-        productos = productos.order_by("precio")
-    elif ordenar == "precio_desc":
-        productos = productos.order_by("-precio")
-    elif ordenar == "nombre_asc":
-        productos = productos.order_by("nombre")
-
-    # Obtener marcas únicas
-    marcas_query = (
-        Producto.objects.filter(tipo__iexact=tipo)
-        .exclude(marca__isnull=True)
-        .exclude(marca__exact="")
-        .values_list("marca", flat=True)
-    )
-    marcas = sorted(set(m.strip().title() for m in marcas_query if m))
-
-    # Obtener tiendas únicas
-    tiendas = (
-        Supermercado.objects.filter(productos__tipo__iexact=tipo)
-        .values_list("nombre", flat=True)
-        .distinct()
-        .order_by("nombre")
-    )
-
-    # Asegurar placeholder en las imágenes (facilita render JS/HTML)
-    for p in productos:
-        if not p.imagen_url:
-            p.imagen_url = "/static/img/placeholder.png"
-
-    # --- Obtener cotización abierta y sus items (igual que en comparador_view) ---
-    cot = None
-    cot_items = []
-    if request.user.is_authenticated:
-        cot = (
-            Cotizacion.objects
-            .filter(usuario=request.user, status='open')
-            .prefetch_related('items__producto', 'items__producto__supermercado')
-            .first()
+    productos, base, filtros = productos_de_categoria(tipo, request.GET)
+
+    def calcular():
+        # Primera página por cursor; el resto llega por scroll infinito (productos_categoria_json)
+        try:
+            filas, siguiente = paginacion.pagina(productos, filtros['ordenar'], request.GET.get('cursor'))
+        except paginacion.CursorInvalido:
+            filas, siguiente = paginacion.pagina(productos, filtros['ordenar'])
+
+        # Marcas, tiendas y rangos de precio con conteos (dos consultas, ver facetas.py)
+        facetas = calcular_facetas(
+            base, filtros['marca_filtro'], filtros['tienda_filtro'], filtros['precio_min'], filtros['precio_max'],
         )
-        if cot:
-            cot_items = list(cot.items.select_related('producto', 'producto__supermercado').all())
+        return filas, siguiente, facetas
+
+    filas, siguiente, facetas = fragmento(request, 'categoria', calcular)
 
     context = {
         "tipo": tipo,
-        "tipos": tipos,
-        "productos": productos,
-        "marcas": marcas,
-        "tiendas": tiendas,
-        "marca_filtro": marca_filtro,
-        "tienda_filtro": tienda_filtro,
-        "ordenar": ordenar,
-        # mini-cart context:
-        "cotizacion": cot,
-        "cot_items": cot_items,
+        "tipos": tipos_catalogo(),
+        "productos": filas,
+        "total": facetas['total'],
+        "siguiente": siguiente,
+        "facetas": facetas,
+        "marca_filtro": filtros['marca_filtro'],
+        "tienda_filtro": filtros['tienda_filtro'],
+        "precio_min": filtros['precio_min'],
+        "precio_max": filtros['precio_max'],
+        "ordenar": filtros['ordenar'],
+        "unidad": filtros['unidad'],
+        "precio_unidad_max": filtros['precio_unidad_max'],
     }
 
     return render(request, "productos_categoria.html", context)
 
+
+# 📜 Siguiente página de una categoría (JSON para scroll infinito)
+def productos_categoria_json(request, tipo):
+    """
+    GET /categoria/<tipo>/mas/?cursor=...&ordenar=precio_asc&marca=...&tienda=...
+    Mismos filtros que productos_por_categoria; devuelve filas .values().
+    """
+    productos, _, filtros = productos_de_categoria(tipo, request.GET)
+    try:
+        filas, siguiente = paginacion.pagina(productos, filtros['ordenar'], request.GET.get('cursor'))
+    except paginacion.CursorInvalido as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    for fila in filas:
+        fila['precio'] = float(fila['precio'])
+        if fila['precio_por_unidad'] is not None:
+            fila['precio_por_unidad'] = float(fila['precio_por_unidad'])
+    return JsonResponse({'ok': True, 'productos': filas, 'siguiente': siguiente})
+
 @staff_member_required
 @require_POST
 def aprobar_pyme(request, pk):
     pyme = get_object_or_404(Pyme, pk=pk)
-    pyme.approved = True
-    pyme.save()
-
-    # opcional: notificar por mensaje y por email (si configuras email)
+    revision.aprobar_pymes([pyme.pk])  # aprueba y encola el correo de aviso (ver tareas.py)
     messages.success(request, f'Pyme "{pyme.nombre}" aprobada y activada.')
-    # ejemplo email (requiere config email)
-    # send_mail('Tu Pyme fue aprobada', 'Tu Pyme ha sido aprobada...', 'from@example.com', [pyme.user.email])
-
     return redirect('revisar_productos')
 
 @staff_member_required
@@ -602,14 +706,96 @@ def rechazar_pyme(request, pk):
 
 
 
+@staff_member_required
 def revisar_productos(request):
-    pendientes = Producto.objects.filter(disponible=False).select_related('supermercado').order_by('-fecha_actualizacion')
-    pymes_pendientes = Pyme.objects.filter(approved=False).select_related('user').order_by('-fecha_creacion')
+    # primera página de cada cola; el resto lo trae el panel con revision_cola
+    pendientes, siguiente_productos = revision.cola_productos()
+    pymes_pendientes, siguiente_pymes = revision.cola_pymes()
     return render(request, 'panel-admin/revisar_productos.html', {
         'pendientes': pendientes,
+        'siguiente_productos': siguiente_productos,
         'pymes_pendientes': pymes_pendientes,
+        'siguiente_pymes': siguiente_pymes,
     })
 
+
+# Documento de verificación de una pyme (sólo staff; admite Range)
+@staff_member_required
+@require_GET
+def documento_pyme(request, pk):
+    pyme = get_object_or_404(Pyme.objects.only('pk', 'documento'), pk=pk)
+    if not pyme.documento:
+        raise Http404("La pyme no adjuntó documento")
+    nombre = pyme.documento.name
+    if request.GET.get('miniatura'):
+        nombre = documentos.nombre_miniatura(nombre)
+    if not documentos.documentos_storage.exists(nombre):
+        raise Http404("Archivo no encontrado")
+    # el tipo sale de los bytes guardados, no de la extensión del nombre
+    content_type = 'image/jpeg' if request.GET.get('miniatura') else documentos.content_type_guardado(nombre)
+    return documentos.servir(request, nombre, content_type)
+
+
+# Imagen de producto vía proxy: miniatura cacheada en disco
+@require_GET
+def imagen_producto(request, producto_id, clave):
+    if not imagenes.clave_valida(clave):
+        raise Http404("Imagen no encontrada")
+    destino = imagenes.ruta(clave)
+    if not destino.exists():
+        url, disponible = Producto.objects.filter(pk=producto_id).values_list('imagen_url', 'disponible').first() or (None, False)
+        # sólo se descargan URLs que de verdad son la imagen del producto (no es un proxy abierto)
+        if not url or imagenes.clave_url(url) != clave or not imagenes.url_descargable(url):
+            raise Http404("Imagen no encontrada")
+        try:
+            if not disponible:
+                # producto en revisión: su imagen_url todavía no la aprobó nadie
+                raise imagenes.ErrorImagen('producto no disponible')
+            destino = imagenes.obtener(url)
+        except imagenes.ErrorImagen:
+            response = redirect(PLACEHOLDER_IMG)
+            response['Cache-Control'] = 'public, max-age=300'
+            return response
+    return imagenes.servir(destino)
+
+
+# Cola de revisión paginada (AJAX GET, async)
+@staff_member_required
+@require_GET
+async def revision_cola(request, tipo):
+    """GET /panel-admin/revisiones/cola/<productos|pymes>/?cursor=..."""
+    cola = revision.COLAS.get(tipo)
+    if cola is None:
+        return JsonResponse({'ok': False, 'error': 'cola desconocida'}, status=404)
+    try:
+        filas, siguiente = await sync_to_async(cola)(request.GET.get('cursor'))
+    except paginacion.CursorInvalido as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    for fila in filas:
+        if 'precio' in fila:
+            fila['precio'] = float(fila['precio'])
+    return JsonResponse({'ok': True, 'filas': filas, 'siguiente': siguiente})
+
+
+# Aprobar / rechazar en lote (AJAX POST JSON, async)
+@staff_member_required
+@require_POST
+async def revision_lote(request):
+    """
+    POST /panel-admin/revisiones/lote/
+    {"tipo": "productos"|"pymes", "accion": "aprobar"|"rechazar", "ids": [1, 2, ...]}
+    """
+    try:
+        datos = json.loads(request.body)
+        accion = revision.ACCIONES[(datos.get('tipo'), datos.get('accion'))]
+        ids = [int(i) for i in datos.get('ids', [])]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'ok': False, 'error': 'petición inválida'}, status=400)
+    if not ids or len(ids) > revision.MAX_LOTE:
+        return JsonResponse({'ok': False, 'error': f'entre 1 y {revision.MAX_LOTE} ids'}, status=400)
+    n = await sync_to_async(accion)(ids)
+    return JsonResponse({'ok': True, 'procesados': n})
+
 @staff_member_required
 @require_POST
 def aprobar_producto(request, pk):
@@ -660,4 +846,16 @@ def editar_producto_admin(request, pk):
     return render(request, "panel-admin/editar_producto.html", {
         "form": form,
         "producto": producto,
-    })
\ No newline at end of file
+    })
+
+
+# 📊 Métricas por vista en formato Prometheus (staff o token)
+@require_GET
+def metricas_view(request):
+    token = settings.METRICAS_TOKEN
+    autorizado = request.user.is_staff or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not autorizado:
+        return HttpResponse(status=403)
+    return HttpResponse(metricas.registro.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')